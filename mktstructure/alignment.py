@@ -0,0 +1,195 @@
+import os
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from .compression import SUFFIXES, strip_suffix
+
+SUFFIX = ".align.npz"
+# Horizon of the midpoint used by realized spread and price impact, as a negative lag (a lead).
+HORIZON = "-5min"
+
+
+def lag_ns(lag) -> int:
+    """Lag as nanoseconds, e.g. `0`, `1s`, `5s` or `-5min` (negative lags look forward)"""
+    if isinstance(lag, (int, float)) or str(lag).lstrip("-").replace(".", "").isdigit():
+        return int(pd.Timedelta(float(lag), "s").value)
+    return int(pd.Timedelta(lag).value)
+
+
+def cleaned_path(signed_path: str):
+    """The cleaned data a signed file was classified from, compressed or not, if any"""
+    base = strip_suffix(signed_path).replace(".signed", "")
+    for suffix in SUFFIXES.values():
+        if os.path.isfile(base + suffix):
+            return base + suffix
+    return None
+
+
+def prevailing(times: np.ndarray, at: np.ndarray, last_time) -> np.ndarray:
+    """
+    Offset of the last of the sorted `times` at or before each of `at`, or -1 if there is
+    none or it is after `last_time`, the end of the data
+    """
+    offsets = np.searchsorted(times, at, "right") - 1
+    offsets[at > last_time] = -1
+    return offsets
+
+
+def alignment_path(data_path: str) -> str:
+    """Path of the alignment index stored next to the data file"""
+    return strip_suffix(data_path).removesuffix(".csv") + SUFFIX
+
+
+class AlignmentIndex:
+    """
+    For each trade, the row offset of the prevailing quote at `trade time - lag` into the
+    quote table (timestamps, bids and asks) kept along with it, or -1 if there is none.
+
+    A lag of 0 means the last quote before the trade in file order. A negative lag looks
+    forward, e.g. `-5min` is the quote prevailing five minutes after the trade, which is -1
+    if that is beyond the last tick of the day. It is computed once, by binary search,
+    when classifying and is stored next to the signed data so that measures reuse it.
+    """
+
+    def __init__(self, quote_times, quote_bids, quote_asks, trade_times, lags, offsets):
+        self.quote_times = quote_times
+        self.quote_bids = quote_bids
+        self.quote_asks = quote_asks
+        self.trade_times = trade_times
+        self.lags = [int(lag) for lag in lags]
+        self.offsets_by_lag = offsets
+
+    @classmethod
+    def build(
+        cls,
+        timestamps: np.ndarray,
+        is_quote: np.ndarray,
+        is_trade: np.ndarray,
+        bids: np.ndarray,
+        asks: np.ndarray,
+        lags: Sequence = (0,),
+    ) -> "AlignmentIndex":
+        """Build from UTC epoch-ns `timestamps` of sorted ticks and masks of valid quotes and trades"""
+        quote_rows = np.flatnonzero(is_quote)
+        trade_rows = np.flatnonzero(is_trade)
+        quote_times = timestamps[quote_rows]
+        trade_times = timestamps[trade_rows]
+        last_time = timestamps[is_quote | is_trade].max(initial=np.iinfo(np.int64).min)
+        lags = sorted({lag_ns(lag) for lag in lags})
+        offsets = np.empty((len(lags), len(trade_rows)), dtype=np.int64)
+        for i, lag in enumerate(lags):
+            if lag == 0:
+                offsets[i] = np.searchsorted(quote_rows, trade_rows) - 1
+            else:
+                offsets[i] = prevailing(quote_times, trade_times - lag, last_time)
+        return cls(quote_times, bids[quote_rows], asks[quote_rows], trade_times, lags, offsets)
+
+    @classmethod
+    def for_trades(
+        cls, quote_times, quote_bids, quote_asks, trade_times, last_time, lags
+    ) -> "AlignmentIndex":
+        """
+        Build from the quote table and the UTC epoch-ns `trade_times`, for non-zero `lags`
+        only: lag 0 is by file order, which the times alone don't give
+        """
+        lags = sorted({lag_ns(lag) for lag in lags})
+        if 0 in lags:
+            raise ValueError("Lag 0 needs the rows of the ticks, see `build()`.")
+        offsets = np.empty((len(lags), len(trade_times)), dtype=np.int64)
+        for i, lag in enumerate(lags):
+            offsets[i] = prevailing(quote_times, trade_times - lag, last_time)
+        return cls(quote_times, quote_bids, quote_asks, trade_times, lags, offsets)
+
+    def offsets(self, lag=0) -> np.ndarray:
+        ns = lag_ns(lag)
+        if ns not in self.lags:
+            raise KeyError(f"Lag {lag} is not in the alignment index.")
+        return self.offsets_by_lag[self.lags.index(ns)]
+
+    def _take(self, values, lag):
+        offsets = self.offsets(lag)
+        out = np.full(len(offsets), np.nan)
+        found = offsets >= 0
+        out[found] = values[offsets[found]]
+        return out
+
+    def bids(self, lag=0) -> np.ndarray:
+        return self._take(self.quote_bids, lag)
+
+    def asks(self, lag=0) -> np.ndarray:
+        return self._take(self.quote_asks, lag)
+
+    def midpoints(self, lag=0) -> np.ndarray:
+        return (self.bids(lag) + self.asks(lag)) / 2
+
+    def take(self, trades: np.ndarray) -> "AlignmentIndex":
+        """Alignment of a subset of the trades, given by their positions"""
+        return AlignmentIndex(
+            self.quote_times,
+            self.quote_bids,
+            self.quote_asks,
+            self.trade_times[trades],
+            self.lags,
+            self.offsets_by_lag[:, trades],
+        )
+
+    def save(self, path):
+        # Write to a temporary file first so that readers never see a partial index.
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            quote_times=self.quote_times,
+            quote_bids=self.quote_bids,
+            quote_asks=self.quote_asks,
+            trade_times=self.trade_times,
+            lags=np.array(self.lags, dtype=np.int64),
+            offsets=self.offsets_by_lag,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> "AlignmentIndex":
+        with np.load(path) as f:
+            return cls(
+                f["quote_times"],
+                f["quote_bids"],
+                f["quote_asks"],
+                f["trade_times"],
+                f["lags"],
+                f["offsets"],
+            )
+
+
+def trade_timestamps(data: pd.DataFrame) -> np.ndarray:
+    """Timestamps of the trades as datetime64[ns], from the index or the `Date-Time` column"""
+    index = data.index
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(data["Date-Time"])
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_numpy(dtype="datetime64[ns]")
+
+
+def midpoints_after(data: pd.DataFrame, alignment=None, horizon=HORIZON) -> np.ndarray:
+    """
+    Midpoint of the quote prevailing `horizon` after each trade, NaN if that's beyond the
+    end of the data. The quotes are those of the alignment index of the data if given.
+    Without one, only the quotes prevailing at the trades are known, their `Mid Point`,
+    so quotes between trades are missed: `compute` rebuilds the index from the cleaned
+    data instead, see `classification.align_signed`.
+    """
+    if alignment is not None and len(alignment.trade_times) == len(data):
+        try:
+            return alignment.midpoints(horizon)
+        except KeyError:
+            pass
+    midpt = data["Mid Point"].to_numpy()
+    timestamps = trade_timestamps(data).view(np.int64)
+    last_time = timestamps.max(initial=np.iinfo(np.int64).min)
+    offsets = prevailing(timestamps, timestamps - lag_ns(horizon), last_time)
+    out = np.full(len(midpt), np.nan)
+    found = offsets >= 0
+    out[found] = midpt[offsets[found]]
+    return out
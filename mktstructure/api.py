@@ -0,0 +1,212 @@
+"""
+The pipeline of `clean`, `classify` and `compute` on ticks held in memory, for services
+that embed the computations, without reading or writing files.
+
+    from mktstructure import api
+
+    results = api.run(df, ["effective_spread", "realized_spread", "amihud"])
+
+The ticks have the columns of a parsed RIC-day file (`#RIC`, `Date-Time`, `GMT Offset`,
+`Type`, `Price`, `Volume`, `Bid Price`, ... or the `L<i>-...` market depth columns), and
+may hold many RIC-days. They are given as a pandas DataFrame, a pyarrow Table or a
+mapping of column names to NumPy arrays. `Date-Time` is UTC, as strings or datetimes.
+Measures are named by their `compute` flags, e.g. `bid_ask_spread` or `kyle_lambda`.
+
+The results are a DataFrame of `date`, `ric`, `measure` and `value`, with the `bucket`
+of each value given an `interval`, or a dict of NumPy arrays of these columns. They are
+those of the subcommands with the default `--price_dtype float64`. The steps are also
+available one at a time: `ric_days()`, `clean()`, `classify()` and `compute()`.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, Iterator, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import bars, buckets, measures as _measures, rolling
+from .classification import _epoch_ns, classify_trades
+from .schema import compact
+from .sessions import SessionCalendar
+from .utils import sort_and_rm_duplicates
+
+# `compute` flag -> measure, and whether it is computed from the signed trades rather
+# than the cleaned ticks.
+MEASURES = {
+    "bid_ask_spread": ("bidask_spread", True),
+    "effective_spread": ("effective_spread", True),
+    "realized_spread": ("realized_spread", True),
+    "price_impact": ("price_impact", True),
+    "variance_ratio": ("variance_ratio", True),
+    "bid_slope": ("bid_slope", False),
+    "ask_slope": ("ask_slope", False),
+    "scaled_depth_diff_1": ("sdd1", False),
+    "scaled_depth_diff_5": ("sdd5", False),
+}
+# Measures that take the trade/quote alignment of `classify`.
+ALIGNED = {"realized_spread", "price_impact"}
+DAY_NS = 86_400 * 1_000_000_000
+
+
+def to_frame(data, price_dtype="float64") -> pd.DataFrame:
+    """The ticks as a DataFrame of the compact schema of `schema`, the input is kept"""
+    if isinstance(data, pd.DataFrame):
+        df = data.copy(deep=False)
+    elif isinstance(data, Mapping):
+        df = pd.DataFrame(dict(data))
+    elif hasattr(data, "to_pandas"):
+        # pyarrow Table or RecordBatch.
+        df = data.to_pandas()
+    else:
+        raise TypeError(
+            "Expected a DataFrame, an Arrow table or a mapping of arrays, "
+            f"got {type(data)}."
+        )
+    return compact(df, price_dtype)
+
+
+def ric_days(df: pd.DataFrame) -> Iterator[Tuple[str, date, pd.DataFrame]]:
+    """`(RIC, local date, ticks)` of each RIC-day in the ticks, as split by `--parse`"""
+    if not len(df):
+        return
+    offsets = df["GMT Offset"].to_numpy(dtype=np.float64) * 3600e9
+    local = _epoch_ns(df["Date-Time"]) + offsets.astype(np.int64)
+    days = (local // DAY_NS).astype("datetime64[D]")
+    rics = df["#RIC"].astype(str).to_numpy()
+    for (ric, day), rows in df.groupby([rics, days], sort=True).indices.items():
+        yield ric, pd.Timestamp(day).date(), df.take(rows)
+
+
+def clean(df: pd.DataFrame) -> pd.DataFrame:
+    """The ticks sorted by time without duplicates, as done by `clean`"""
+    return sort_and_rm_duplicates(df).reset_index()
+
+
+def classify(
+    df: pd.DataFrame,
+    algorithms: Sequence[str] = ("lr",),
+    sessions: np.ndarray = None,
+    bvc_bar_volume: float = None,
+    quote_lag=0,
+):
+    """
+    Signed trades of a cleaned RIC-day and their trade/quote alignment, as done by
+    `classify`. See `classification.classify_trades`.
+    """
+    return classify_trades(
+        df,
+        tuple(algorithms),
+        sessions,
+        bvc_bar_volume,
+        quote_lag,
+        return_alignment=True,
+    )
+
+
+def compute(
+    data: pd.DataFrame,
+    measures: Iterable[str],
+    alignment=None,
+    day: date = None,
+    interval=None,
+) -> list:
+    """
+    `(measure name, value)` of the `measures` of a RIC-day, or `(bucket, measure name,
+    value)` of each bucket with an `interval`. `data` is the signed trades for the trade
+    measures and the cleaned ticks for the market depth ones. Rolling measures are
+    skipped, see `run()`.
+    """
+    bucket = buckets.bucket_ids(data, day, interval) if interval else None
+    results = []
+    for flag in measures:
+        if flag not in MEASURES:
+            continue
+        measure = getattr(_measures, MEASURES[flag][0])
+        kwargs = {}
+        if flag in ALIGNED and alignment is not None:
+            kwargs["alignment"] = alignment
+        if bucket is not None:
+            if not hasattr(measure, "estimate_buckets"):
+                continue
+            ids, values = measure.estimate_buckets(data, bucket, **kwargs)
+            for b, value in zip(ids, values):
+                results.append((buckets.label(b, interval), measure.name, value))
+            continue
+        result = measure.estimate(data, **kwargs)
+        # The variance ratio test gives a list of results.
+        if isinstance(result, list):
+            results.extend((k, v) for res in result for k, v in res.items())
+        else:
+            results.append((measure.name, result))
+    return results
+
+
+def run(
+    data,
+    measures: Iterable[str],
+    algorithms: Sequence[str] = ("lr",),
+    quote_lag=0,
+    bvc_bar_volume: float = None,
+    interval=None,
+    window: int = 20,
+    price_dtype="float64",
+    output="frame",
+):
+    """
+    Clean the ticks, classify their trades if needed and compute the `measures` of
+    each RIC-day. The rolling measures (`amihud`, `roll_spread`, `kyle_lambda`,
+    `corwin_schultz`) are over the last `window` days of each RIC in the data, and
+    given from the first day with a full window. Returns a DataFrame, or a dict of
+    arrays with `output="arrays"`.
+    """
+    measures = list(measures)
+    unknown = set(measures).difference(MEASURES).difference(rolling.MEASURES)
+    if unknown:
+        raise ValueError(f"Unknown measures: {', '.join(sorted(unknown))}.")
+    if output not in ("frame", "arrays"):
+        raise ValueError(f"Unknown output {output!r}, expected frame or arrays.")
+    rolling_measures = [m for m in rolling.MEASURES if m in measures]
+    depth = [m for m in measures if m in MEASURES and not MEASURES[m][1]]
+    trade = [m for m in measures if m in MEASURES and MEASURES[m][1]]
+    df = to_frame(data, price_dtype)
+    calendar = SessionCalendar()
+    windows = defaultdict(lambda: rolling.Window(window))
+    rows = []
+
+    def add(day, ric, results):
+        for result in results:
+            # Rolling measures have no bucket.
+            bucket = (result[:-2] or (None,)) if interval else ()
+            rows.append((day, ric, *bucket, *result[-2:]))
+
+    for ric, day, ticks in ric_days(df):
+        cleaned = clean(ticks)
+        if depth:
+            add(day, ric, compute(cleaned, depth, day=day, interval=interval))
+        if not (trade or rolling_measures):
+            continue
+        signed, alignment = classify(
+            cleaned, algorithms, calendar.sessions(ric, day), bvc_bar_volume, quote_lag
+        )
+        if trade:
+            add(day, ric, compute(signed, trade, alignment, day, interval))
+        if rolling_measures:
+            # Days are in order within each RIC.
+            day_bars = bars.compute_bars(signed)
+            windows[ric].push(str(day), rolling.day_stats(day_bars))
+            history = windows[ric].history.get(str(day))
+            if history:
+                add(
+                    day,
+                    ric,
+                    [
+                        (f"{rolling.MEASURES[m]} ({window} days)", history[m])
+                        for m in rolling_measures
+                    ],
+                )
+    columns = ["date", "ric"] + (["bucket"] if interval else []) + ["measure", "value"]
+    frame = pd.DataFrame(rows, columns=columns)
+    frame["value"] = frame["value"].astype(np.float64)
+    if output == "arrays":
+        return {column: frame[column].to_numpy() for column in columns}
+    return frame
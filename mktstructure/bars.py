@@ -0,0 +1,135 @@
+"""
+Per-minute bars of the signed trades of a RIC-day, computed once and reused.
+
+One numba pass over the trades aggregates each minute of local time into its OHLC,
+volume, dollar volume (and so VWAP), signed volume, trade count and mean quoted spread
+over the trades with a quote.
+`classify` saves the bars next to the signed data (`*.bars.npz`), and `compute` builds
+them for signed files without. Low-frequency measures, e.g. the rolling Amihud, Roll,
+Kyle's lambda and Corwin-Schultz, read the bars instead of the ticks.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .buckets import local_times
+from .compression import strip_suffix
+from .kernels import kernel
+from .measures.exceptions import MissingVariableError
+
+SUFFIX = ".bars.npz"
+# `spread` is the mean over the `quotes` trades with a quote.
+COLUMNS = [
+    "minute",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "dollar_volume",
+    "signed_volume",
+    "trades",
+    "spread",
+    "quotes",
+]
+vars_needed = {"Price", "Volume", "Direction", "Bid Price", "Ask Price"}
+MINUTE_NS = 60 * 1_000_000_000
+
+
+def bars_path(data_path: str) -> str:
+    """Path of the bars stored next to the signed data file"""
+    return strip_suffix(data_path).removesuffix(".csv") + SUFFIX
+
+
+def is_fresh(data_path: str) -> bool:
+    """Whether the bars of the data file exist and are newer than it"""
+    path = bars_path(data_path)
+    if not os.path.isfile(path):
+        return False
+    return os.path.getmtime(path) >= os.path.getmtime(data_path)
+
+
+@kernel("f8[:, ::1](i8[::1], f8[::1], f8[::1], f8[::1], f8[::1], f8[::1])")
+def _aggregate(minutes, price, volume, direction, bid, ask):
+    """Bars of the trades, one row per minute with trades, in the order of `COLUMNS`"""
+    n = len(minutes)
+    n_bars = 0
+    for i in range(n):
+        if i == 0 or minutes[i] != minutes[i - 1]:
+            n_bars += 1
+    out = np.zeros((n_bars, 11))
+    b = -1
+    for i in range(n):
+        if i == 0 or minutes[i] != minutes[i - 1]:
+            b += 1
+            out[b, 0] = minutes[i]
+            out[b, 1] = price[i]
+            out[b, 2] = price[i]
+            out[b, 3] = price[i]
+        p = price[i]
+        out[b, 2] = max(out[b, 2], p)
+        out[b, 3] = min(out[b, 3], p)
+        out[b, 4] = p
+        out[b, 5] += volume[i]
+        out[b, 6] += p * volume[i]
+        out[b, 7] += direction[i] * volume[i]
+        out[b, 8] += 1
+        spread = ask[i] - bid[i]
+        if not np.isnan(spread):
+            out[b, 9] += spread
+            out[b, 10] += 1
+    for b in range(n_bars):
+        out[b, 9] = out[b, 9] / out[b, 10] if out[b, 10] else np.nan
+    return out
+
+
+def compute_bars(data: pd.DataFrame) -> pd.DataFrame:
+    """Bars of each minute with trades, `minute` being the minute of the local day"""
+    if not len(data):
+        return pd.DataFrame({c: np.empty(0) for c in COLUMNS})
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError("bars", vars_needed.difference(data.columns))
+
+    minutes = (local_times(data) // MINUTE_NS) % (24 * 60)
+    out = _aggregate(
+        np.ascontiguousarray(minutes),
+        *(
+            data[c].to_numpy(dtype=np.float64)
+            for c in ["Price", "Volume", "Direction", "Bid Price", "Ask Price"]
+        ),
+    )
+    bars = pd.DataFrame(out, columns=COLUMNS)
+    return bars.astype({"minute": np.int64, "trades": np.int64, "quotes": np.int64})
+
+
+def save(bars: pd.DataFrame, path):
+    # Write to a temporary file first so that readers never see partial bars.
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **{c: bars[c].to_numpy() for c in COLUMNS})
+    os.replace(tmp, path)
+
+
+def load(path) -> pd.DataFrame:
+    with np.load(path) as f:
+        return pd.DataFrame({c: f[c] for c in COLUMNS})
+
+
+def daily(bars: pd.DataFrame) -> dict:
+    """Aggregates of the whole day, with its VWAP and mean quoted spread"""
+    volume = bars["volume"].sum()
+    quotes = bars["quotes"].sum()
+    return {
+        "open": bars["open"].iloc[0] if len(bars) else np.nan,
+        "high": bars["high"].max(),
+        "low": bars["low"].min(),
+        "close": bars["close"].iloc[-1] if len(bars) else np.nan,
+        "volume": volume,
+        "dollar_volume": bars["dollar_volume"].sum(),
+        "vwap": bars["dollar_volume"].sum() / volume if volume else np.nan,
+        "signed_volume": bars["signed_volume"].sum(),
+        "trades": bars["trades"].sum(),
+        "spread": np.nansum(bars["spread"] * bars["quotes"]) / quotes
+        if quotes
+        else np.nan,
+    }
@@ -0,0 +1,261 @@
+"""
+Stage-by-stage benchmark on synthetic data.
+
+    python -m mktstructure.benchmark --sizes 10000 100000 1000000 --out bench.json
+    python -m mktstructure.benchmark --sizes 10000 100000 --baseline bench.json
+
+Each stage (download from a local `mock_datascope`, parse, clean, classify and every measure) runs in a fresh process on one RIC-day
+of the given number of ticks, and reports rows/sec and the peak memory of that process.
+The stage is timed once as is and run again with `tracemalloc` for the memory it traces.
+With `--baseline`, exits with an error if any stage is slower than the baseline by more
+than `--tolerance`.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from . import synthetic
+from .metrics import peak_rss_mb, reset_peak_rss
+
+TRADE_MEASURES = [
+    "bidask_spread",
+    "effective_spread",
+    "realized_spread",
+    "price_impact",
+    "variance_ratio",
+]
+DEPTH_MEASURES = ["bid_slope", "ask_slope", "sdd1", "sdd5"]
+STAGES = ["download", "parse", "clean", "classify"] + TRADE_MEASURES + DEPTH_MEASURES
+
+
+def _find(directory, suffix):
+    for root, _, files in os.walk(directory):
+        for f in sorted(files):
+            if f.endswith(suffix):
+                return os.path.join(root, f)
+    raise FileNotFoundError(f"No {suffix} file in {directory}")
+
+
+def _prepare(workdir, size, depth):
+    """Generate, parse, clean and classify one RIC-day, keeping every intermediate file"""
+    from .trth_parser import parse_to_data_dir
+    from .utils import _sort_and_rm_duplicates
+    from .classification import classify_trades
+    from .alignment import alignment_path
+    from .compression import Codec, to_csv
+    from .schema import read_ticks
+
+    raw = os.path.join(workdir, "raw.csv")
+    write = synthetic.write_market_depth if depth else synthetic.write_time_and_sales
+    write(raw, rics=1, days=1, ticks_per_day=size)
+    parse_to_data_dir(raw, os.path.join(workdir, "data"), "1")
+    parsed = _find(os.path.join(workdir, "data"), ".csv")
+    _sort_and_rm_duplicates(parsed, replace=False)
+    if not depth:
+        sorted_ = parsed.replace(".csv", ".sorted.csv")
+        signed, alignment = classify_trades(read_ticks(sorted_), return_alignment=True)
+        out = sorted_.replace(".csv", ".signed.csv")
+        to_csv(signed, out, Codec("none"))
+        alignment.save(alignment_path(out))
+    return raw
+
+
+def _run_stage(stage, workdir, size):
+    """Run one stage on the prepared data in `workdir`, in a fresh process"""
+    from .schema import read_ticks
+
+    data = os.path.join(workdir, "data")
+    if stage == "download":
+        import gzip
+        import threading
+
+        from .mock_datascope import MockDataScope
+        from .trth import Connection
+
+        server = MockDataScope(ticks_per_day=size)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        trth = Connection(
+            "", "", progress_callback=lambda *_: None, base_url=server.base_url,
+            polling_interval=0.05,
+        )
+        out = os.path.join(workdir, "download.csv.gz")
+        args = (["SYN0000.N"], "2021-03-15T00:00:00.000Z", "2021-03-16T00:00:00.000Z")
+        # The mock generates the payload once, keep it out of the timing.
+        trth.save_results(trth.get_table(*args), out)
+        with gzip.open(out, "rt") as f:
+            rows = sum(1 for _ in f) - 1
+        run = lambda: trth.save_results(trth.get_table(*args), out)
+    elif stage == "parse":
+        from .trth_parser import parse_to_data_dir
+
+        raw = os.path.join(workdir, "raw.csv")
+        with open(raw) as f:
+            rows = sum(1 for _ in f) - 1
+        # Into a new directory each run, the stage runs twice.
+        run = lambda: parse_to_data_dir(raw, tempfile.mkdtemp(dir=workdir), "1")
+    elif stage == "clean":
+        from .quality import CHECKS
+        from .utils import _sort_and_rm_duplicates
+
+        src = _find(data, ".csv")
+        path = os.path.join(workdir, "clean.csv")
+        shutil.copy(src, path)
+        # As `clean --filters` with every check.
+        quality = {"checks": CHECKS}
+        # Compile the kernels first.
+        warmup = os.path.join(workdir, "warmup.csv")
+        with open(src) as fin, open(warmup, "w") as fout:
+            fout.writelines(line for _, line in zip(range(1001), fin))
+        _sort_and_rm_duplicates(warmup, replace=True, quality=quality)
+        rows = len(read_ticks(path))
+        # To a sorted copy, so that each run cleans the same file.
+        run = lambda: _sort_and_rm_duplicates(path, replace=False, quality=quality)
+    elif stage == "classify":
+        from .classification import classify_trades
+
+        path = _find(data, ".sorted.csv")
+        # Compile the kernels first.
+        classify_trades(read_ticks(path, nrows=1000))
+        df = read_ticks(path)
+        rows = len(df)
+        run = lambda: classify_trades(df, return_alignment=True)
+    else:
+        from . import measures
+        from .alignment import AlignmentIndex, alignment_path
+
+        measure = getattr(measures, stage)
+        suffix = ".sorted.csv" if stage in DEPTH_MEASURES else ".signed.csv"
+        path = _find(data, suffix)
+        df = read_ticks(path)
+        rows = len(df)
+        kwargs = {}
+        if stage in ("realized_spread", "price_impact"):
+            kwargs["alignment"] = AlignmentIndex.load(alignment_path(path))
+        # Compile the kernels first.
+        measure.estimate(df.head(1000))
+        run = lambda: measure.estimate(df, **kwargs)
+
+    reset_peak_rss()
+    t0, c0 = time.perf_counter(), time.process_time()
+    run()
+    seconds, cpu = time.perf_counter() - t0, time.process_time() - c0
+    rss = peak_rss_mb()
+    # Tracing slows allocations down several times, so it gets a run of its own.
+    tracemalloc.start()
+    run()
+    _, traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "stage": stage,
+        "rows": rows,
+        "seconds": seconds,
+        "cpu_seconds": cpu,
+        "rows_per_sec": rows / seconds if seconds else float("inf"),
+        "peak_rss_mb": rss,
+        "peak_traced_mb": traced / 1024 / 1024,
+    }
+
+
+def run(sizes, stages=STAGES, workdir=None):
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for size in sizes:
+        tmp = tempfile.mkdtemp(dir=workdir)
+        tas, depth = os.path.join(tmp, "tas"), os.path.join(tmp, "depth")
+        os.makedirs(tas)
+        os.makedirs(depth)
+        try:
+            _prepare(tas, size, depth=False)
+            if set(stages).intersection(DEPTH_MEASURES):
+                _prepare(depth, size, depth=True)
+            for stage in stages:
+                with ProcessPoolExecutor(1, mp_context=ctx) as exe:
+                    where = depth if stage in DEPTH_MEASURES else tas
+                    try:
+                        result = exe.submit(_run_stage, stage, where, size).result()
+                    except Exception as e:
+                        print(f"{stage:>18} {size:>10} rows failed: {e!r}")
+                        results.append({"stage": stage, "size": size, "error": repr(e)})
+                        continue
+                result["size"] = size
+                results.append(result)
+                print(
+                    f"{stage:>18} {size:>10} rows {result['rows_per_sec']:>14,.0f} rows/s "
+                    f"{result['peak_rss_mb']:>8.1f} MB peak RSS {result['peak_traced_mb']:>8.1f} MB traced",
+                    flush=True,
+                )
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Stages slower than the baseline by more than `tolerance` (a fraction)"""
+    base = {(r["stage"], r["size"]): r.get("rows_per_sec") for r in baseline}
+    regressions = []
+    for r in results:
+        before = base.get((r["stage"], r["size"]))
+        if before and r.get("rows_per_sec", 0) < before * (1 - tolerance):
+            regressions.append((r["stage"], r["size"], before, r["rows_per_sec"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each stage and measure on synthetic TRTH data"
+    )
+    parser.add_argument(
+        "--sizes",
+        metavar="ticks",
+        nargs="+",
+        type=int,
+        default=[10_000, 100_000, 1_000_000],
+        help="ticks per RIC-day to benchmark",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="stages and measures to benchmark",
+    )
+    parser.add_argument("--out", metavar="out", help="file to save results (JSON)")
+    parser.add_argument(
+        "--baseline",
+        metavar="baseline",
+        help="results (JSON) of a previous run to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        metavar="fraction",
+        type=float,
+        default=0.2,
+        help="allowed slowdown relative to the baseline",
+    )
+    parser.add_argument(
+        "--workdir", metavar="dir", help="directory for temporary data"
+    )
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.stages, args.workdir)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for stage, size, before, after in regressions:
+            print(f"Regression: {stage} at {size} rows, {before:,.0f} -> {after:,.0f} rows/s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
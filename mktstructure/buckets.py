@@ -0,0 +1,85 @@
+"""
+Intraday time buckets, e.g. 5-minute intervals, for measures computed per bucket.
+
+Rows are assigned to buckets of their local time of day. The reductions are segmented
+sums with `np.bincount` over the bucket of each row, so all buckets of a file come out of
+one vectorized pass. Only buckets with rows are returned.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .alignment import lag_ns
+
+
+def interval_ns(interval) -> int:
+    """Interval as nanoseconds, e.g. `5min`, `30s` or `300` (seconds)"""
+    ns = lag_ns(interval)
+    if ns <= 0:
+        raise ValueError(f"Invalid interval {interval!r}, expected a positive duration.")
+    return ns
+
+
+def local_times(data: pd.DataFrame) -> np.ndarray:
+    """
+    Local timestamps of the rows as epoch nanoseconds. Signed data is in local time
+    already, cleaned data is in UTC with the `GMT Offset` of each row.
+    """
+    index = data.index
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(data["Date-Time"])
+    times = index.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    if index.tz is not None:
+        offsets = data["GMT Offset"].to_numpy(dtype=np.float64) * 3600e9
+        times = times + offsets.astype(np.int64)
+    return times
+
+
+def bucket_ids(data: pd.DataFrame, day, interval) -> np.ndarray:
+    """Bucket of each row: number of `interval`s since the local midnight of `day`"""
+    midnight = pd.Timestamp(day).normalize().value
+    return (local_times(data) - midnight) // interval_ns(interval)
+
+
+def label(bucket, interval) -> str:
+    """Local time of day of the start of the bucket, e.g. `09:30:00`"""
+    start = timedelta(microseconds=int(bucket) * interval_ns(interval) // 1000)
+    return (datetime.min + start).strftime("%H:%M:%S")
+
+
+def _segments(buckets):
+    # Offset to the first bucket so that bincount isn't sized by the time since midnight.
+    first = buckets.min()
+    return buckets - first, first
+
+
+def mean(values, buckets, skipna=False):
+    """Mean of `values` in each bucket, as `(buckets, means)`"""
+    if not len(buckets):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    segments, first = _segments(buckets)
+    rows = np.bincount(segments)
+    if skipna:
+        valid = ~np.isnan(values)
+        counts = np.bincount(segments, weights=valid, minlength=len(rows))
+        values = np.where(valid, values, 0.0)
+    else:
+        counts = rows
+    sums = np.bincount(segments, weights=values, minlength=len(rows))
+    ids = np.flatnonzero(rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ids + first, sums[ids] / counts[ids]
+
+
+def weighted_mean(values, weights, buckets):
+    """Mean of `values` weighted by `weights` in each bucket, as `(buckets, means)`"""
+    if not len(buckets):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    segments, first = _segments(buckets)
+    rows = np.bincount(segments)
+    weighted = np.bincount(segments, weights=values * weights, minlength=len(rows))
+    totals = np.bincount(segments, weights=weights, minlength=len(rows))
+    ids = np.flatnonzero(rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ids + first, weighted[ids] / totals[ids]
@@ -0,0 +1,372 @@
+import math
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from .alignment import HORIZON, AlignmentIndex, trade_timestamps
+from .kernels import kernel
+from .schema import QUALITY_FIELD
+from .sessions import exchange_of, in_sessions, session_intervals
+
+# Lee and Ready (1991), Ellis, Michaely and O'Hara (2000),
+# Chakrabarty, Li, Nguyen and Van Ness (2007) and bulk volume classification (Easley, Lopez de Prado and O'Hara, 2012).
+ALGORITHMS = ("lr", "emo", "clnv", "bvc")
+# Default number of volume bars per day used by BVC.
+BVC_BARS = 50
+
+
+def classify_trades(
+    df: pd.DataFrame,
+    algorithms: Sequence[str] = ("lr",),
+    sessions: np.ndarray = None,
+    bvc_bar_volume: float = None,
+    quote_lag=0,
+    lags: Sequence = (),
+    return_alignment: bool = False,
+):
+    """
+    Classify trades into buys (1) and sells (-1) using the given algorithms in a single pass,
+    keeping only trades within the trading `sessions`, an (n, 2) array of [open, close]
+    UTC timestamps in nanoseconds as in `sessions.SessionCalendar`. If not given, the sessions
+    are looked up by the RIC and local date of the first row.
+
+    `Direction` holds the result of the first algorithm. If more than one is given, each also
+    gets its own column, e.g. `Direction-EMO`. BVC gives the buy-minus-sell volume fraction of
+    the trade's volume bar, a float in [-1, 1].
+
+    Trades are matched to the quote prevailing `quote_lag` (e.g. `0`, `1s`, `5s`) earlier via an
+    `alignment.AlignmentIndex`, which also covers the extra `lags` and the horizon used by
+    realized spread and price impact. It is returned along with the data if `return_alignment`.
+    """
+    unknown = set(algorithms).difference(ALGORITHMS)
+    if unknown or not algorithms:
+        raise ValueError(f"Unknown classification algorithms: {', '.join(unknown)}.")
+    timestamps, offsets, prices, bids, asks, is_quote, is_trade = _valid_ticks(
+        df, sessions
+    )
+    alignment = AlignmentIndex.build(
+        timestamps, is_quote, is_trade, bids, asks, (0, quote_lag, HORIZON, *lags)
+    )
+    # The prevailing bid/ask of each trade.
+    trade_rows = np.flatnonzero(is_trade)
+    trade_bids = alignment.bids(quote_lag)
+    trade_asks = alignment.asks(quote_lag)
+    # BVC works on volume bars and needs no tick-by-tick pass.
+    if set(algorithms) != {"bvc"}:
+        directions = _classify(
+            prices[trade_rows],
+            trade_bids,
+            trade_asks,
+            "lr" in algorithms,
+            "emo" in algorithms,
+            "clnv" in algorithms,
+        )
+    midpoints = (trade_bids + trade_asks) / 2
+    # Keep only trades with a type of Trade.
+    # If the first observation is a Trade, there will not be a Mid Point.
+    kept = np.flatnonzero(
+        (df["Type"] == "Trade").to_numpy()[trade_rows] & ~np.isnan(midpoints)
+    )
+    keep = trade_rows[kept]
+
+    results = {}
+    for i, algorithm in enumerate(ALGORITHMS[:3]):
+        if algorithm in algorithms:
+            results[algorithm] = directions[i][kept]
+    if "bvc" in algorithms:
+        volumes = df["Volume"].to_numpy(dtype=np.float64)
+        if bvc_bar_volume is None:
+            bvc_bar_volume = np.nansum(volumes[is_trade]) / BVC_BARS
+        results["bvc"] = _bulk_volume_classify(
+            prices, volumes, is_trade, max(bvc_bar_volume, 1.0)
+        )[keep]
+
+    df = _signed_trades(
+        df,
+        algorithms,
+        results,
+        keep,
+        trade_bids[kept],
+        trade_asks[kept],
+        timestamps,
+        offsets,
+    )
+    if return_alignment:
+        return df, alignment.take(kept)
+    return df
+
+
+def _valid_ticks(df, sessions):
+    """
+    UTC epoch-ns timestamps, GMT offsets, prices, bids and asks of the ticks and masks of
+    the quotes and trades used to classify
+    """
+    # UTC nanoseconds since epoch.
+    timestamps = _epoch_ns(df["Date-Time"])
+    # GMT offset of each row, which changes within the file on DST switches.
+    offsets = (df["GMT Offset"].to_numpy(dtype=np.float64) * 3600e9).astype(np.int64)
+    if sessions is None and len(df):
+        sessions = _default_sessions(df["#RIC"].iloc[0], timestamps[0], offsets[0])
+    elif sessions is None:
+        sessions = np.empty((0, 2), dtype=np.int64)
+    prices = df["Price"].to_numpy(dtype=np.float64)
+    bids = df["Bid Price"].to_numpy(dtype=np.float64)
+    asks = df["Ask Price"].to_numpy(dtype=np.float64)
+    bidsize = df["Bid Size"].to_numpy(dtype=np.float64)
+    asksize = df["Ask Size"].to_numpy(dtype=np.float64)
+
+    # Ignore ticks outside trading sessions.
+    in_session = in_sessions(timestamps, sessions)
+    # And rows flagged by the quality filter of `clean`.
+    if QUALITY_FIELD in df:
+        in_session &= df[QUALITY_FIELD].to_numpy() == 0
+    # If price is np.nan then this is a quote, which is used only if all fields are non-zero.
+    is_quote = in_session & np.isnan(prices)
+    is_quote &= (bids != 0) & (asks != 0) & (bidsize != 0) & (asksize != 0)
+    is_trade = in_session & ~np.isnan(prices)
+    return timestamps, offsets, prices, bids, asks, is_quote, is_trade
+
+
+def align_signed(
+    signed: pd.DataFrame, ticks: pd.DataFrame, sessions=None, lags=(HORIZON,)
+) -> AlignmentIndex:
+    """
+    Alignment of signed trades stored without their index with the quotes of the cleaned
+    `ticks` they were classified from, for the non-zero `lags`, the same as `classify`
+    would have stored for them
+    """
+    timestamps, _, _, bids, asks, is_quote, is_trade = _valid_ticks(ticks, sessions)
+    quote_rows = np.flatnonzero(is_quote)
+    last_time = timestamps[is_quote | is_trade].max(initial=np.iinfo(np.int64).min)
+    # The signed trades are indexed by local time.
+    offsets = signed["GMT Offset"].to_numpy(dtype=np.float64) * 3600e9
+    trade_times = trade_timestamps(signed).view(np.int64) - offsets.astype(np.int64)
+    return AlignmentIndex.for_trades(
+        timestamps[quote_rows],
+        bids[quote_rows],
+        asks[quote_rows],
+        trade_times,
+        last_time,
+        lags,
+    )
+
+
+def _signed_trades(df, algorithms, results, keep, bids, asks, timestamps, offsets):
+    """The `keep` rows of `df` with their directions and prevailing bid and ask"""
+    df = df.take(keep)
+    df["Direction"] = results[algorithms[0]]
+    if len(algorithms) > 1:
+        for algorithm in algorithms:
+            df[f"Direction-{algorithm.upper()}"] = results[algorithm]
+    # Keep the price dtype of the input data.
+    price_dtype = df["Bid Price"].dtype
+    df["Bid Price"] = bids.astype(price_dtype)
+    df["Ask Price"] = asks.astype(price_dtype)
+    df["Mid Point"] = ((bids + asks) / 2).astype(price_dtype)
+    # Set local time as index.
+    df.index = pd.DatetimeIndex(timestamps[keep] + offsets[keep], name="Date-Time")
+    return df.drop(columns="Date-Time")
+
+
+class StreamingLeeReady:
+    """
+    Lee and Ready classification of a RIC-day's sorted ticks fed in chunks, giving the
+    same signed trades as `classify_trades(df, ("lr",), sessions)` over the whole day.
+    The prevailing quote and the last two trade prices of the tick test carry over
+    between chunks. Trades are matched to the last quote before them (a quote lag of 0).
+    `rows` are the positions in the last chunk of the trades it returned, and
+    `quote_rows` those of its quotes, with their local `quote_times` (epoch ns, as the
+    signed trades) and `quote_midpoints`.
+    """
+
+    def __init__(self, sessions: np.ndarray = None):
+        self.sessions = sessions
+        self.bid, self.ask = np.nan, np.nan
+        self.last_prices = np.full(2, np.nan)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.quote_rows = np.empty(0, dtype=np.int64)
+        self.quote_times = np.empty(0, dtype=np.int64)
+        self.quote_midpoints = np.empty(0)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Signed trades of the next chunk of ticks"""
+        timestamps = _epoch_ns(df["Date-Time"])
+        offsets = df["GMT Offset"].to_numpy(dtype=np.float64) * 3600e9
+        offsets = offsets.astype(np.int64)
+        if self.sessions is None and len(df):
+            ric = df["#RIC"].iloc[0]
+            self.sessions = _default_sessions(ric, timestamps[0], offsets[0])
+        elif self.sessions is None:
+            self.sessions = np.empty((0, 2), dtype=np.int64)
+        prices = df["Price"].to_numpy(dtype=np.float64)
+        bids = df["Bid Price"].to_numpy(dtype=np.float64)
+        asks = df["Ask Price"].to_numpy(dtype=np.float64)
+        bidsize = df["Bid Size"].to_numpy(dtype=np.float64)
+        asksize = df["Ask Size"].to_numpy(dtype=np.float64)
+
+        # Same quotes and trades as `classify_trades()`.
+        in_session = in_sessions(timestamps, self.sessions)
+        if QUALITY_FIELD in df:
+            in_session &= df[QUALITY_FIELD].to_numpy() == 0
+        is_quote = in_session & np.isnan(prices)
+        is_quote &= (bids != 0) & (asks != 0) & (bidsize != 0) & (asksize != 0)
+        is_trade = in_session & ~np.isnan(prices)
+        quote_rows = np.flatnonzero(is_quote)
+        trade_rows = np.flatnonzero(is_trade)
+        # Prevailing quote of each trade, where -1 is the last quote of earlier chunks.
+        prevailing = np.searchsorted(quote_rows, trade_rows)
+        trade_bids = np.concatenate([[self.bid], bids[quote_rows]])[prevailing]
+        trade_asks = np.concatenate([[self.ask], asks[quote_rows]])[prevailing]
+        # The last two trade prices go first, so that the tick test picks up from there.
+        trade_prices = np.concatenate([self.last_prices, prices[trade_rows]])
+        directions = _classify(
+            trade_prices,
+            np.concatenate([np.full(2, np.nan), trade_bids]),
+            np.concatenate([np.full(2, np.nan), trade_asks]),
+            True,
+            False,
+            False,
+        )[0, 2:]
+        self.last_prices = trade_prices[-2:]
+        self.quote_rows = quote_rows
+        self.quote_times = timestamps[quote_rows] + offsets[quote_rows]
+        self.quote_midpoints = (bids[quote_rows] + asks[quote_rows]) / 2
+        if len(quote_rows):
+            self.bid, self.ask = bids[quote_rows[-1]], asks[quote_rows[-1]]
+
+        midpoints = (trade_bids + trade_asks) / 2
+        kept = np.flatnonzero(
+            (df["Type"] == "Trade").to_numpy()[trade_rows] & ~np.isnan(midpoints)
+        )
+        self.rows = trade_rows[kept]
+        return _signed_trades(
+            df,
+            ("lr",),
+            {"lr": directions[kept]},
+            self.rows,
+            trade_bids[kept],
+            trade_asks[kept],
+            timestamps,
+            offsets,
+        )
+
+
+def _epoch_ns(datetimes) -> np.ndarray:
+    """UTC nanoseconds since epoch of the datetime strings, keeping nanosecond precision"""
+    index = pd.DatetimeIndex(datetimes)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return index.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _default_sessions(ric, timestamp, offset):
+    day = pd.Timestamp(timestamp + offset).date()
+    sessions = session_intervals(exchange_of(ric), day)
+    if sessions is None:
+        # Unknown exchange, assume US hours in the local time given by the GMT offset.
+        open_, close = pd.Timestamp(day).value, pd.Timestamp(day).value
+        open_ += (9 * 60 + 30) * 60_000_000_000 - offset
+        close += 16 * 3600_000_000_000 - offset
+        sessions = np.array([[open_, close]], dtype=np.int64)
+    return sessions
+
+
+@kernel("i1[:, ::1](f8[:], f8[:], f8[:], b1, b1, b1)")
+def _classify(prices, bids, asks, lr, emo, clnv):
+    """Classify trades given the prevailing bid and ask of each trade"""
+    n = len(prices)
+    # One row per algorithm in ALGORITHMS[:3].
+    directions = np.zeros((3, n), dtype=np.int8)
+    last_trade_price, last2_trade_price = np.nan, np.nan
+    # Direction of the last non-zero price change, i.e. the tick test.
+    last_tick = 0
+    for i in range(n):
+        p = prices[i]
+        if p > last_trade_price:
+            last_tick = 1
+        elif p < last_trade_price:
+            last_tick = -1
+        if lr:
+            midpoint = (bids[i] + asks[i]) / 2
+            # Quote Test
+            if np.isnan(midpoint):
+                pass
+            elif p > midpoint:
+                directions[0, i] = 1
+            elif p < midpoint:
+                directions[0, i] = -1
+            # Ticke Test when price = last midpoint
+            elif np.isnan(last_trade_price):
+                pass
+            elif p > last_trade_price:
+                directions[0, i] = 1
+            elif p < last_trade_price:
+                directions[0, i] = -1
+            elif np.isnan(last2_trade_price):
+                pass
+            elif p > last2_trade_price:
+                directions[0, i] = 1
+            elif p < last2_trade_price:
+                directions[0, i] = -1
+        if emo:
+            # Trades at the ask are buys, at the bid are sells, otherwise the tick test.
+            if p == asks[i]:
+                directions[1, i] = 1
+            elif p == bids[i]:
+                directions[1, i] = -1
+            else:
+                directions[1, i] = last_tick
+        if clnv:
+            # Trades in the top (bottom) 30% of the spread are buys (sells), otherwise the tick test.
+            spread = asks[i] - bids[i]
+            if asks[i] >= p >= asks[i] - 0.3 * spread:
+                directions[2, i] = 1
+            elif bids[i] <= p <= bids[i] + 0.3 * spread:
+                directions[2, i] = -1
+            else:
+                directions[2, i] = last_tick
+        last2_trade_price = last_trade_price
+        last_trade_price = p
+    return directions
+
+
+@kernel("f8[::1](f8[:], f8[:], b1[:], f8)")
+def _bulk_volume_classify(prices, volumes, is_trade, bar_volume):
+    """
+    Aggregate trades into bars of `bar_volume` and assign to each trade the
+    buy-minus-sell fraction 2 * Z(dP / sigma(dP)) - 1 of its bar.
+    """
+    n = len(prices)
+    bar_of = np.full(n, -1, dtype=np.int64)
+    # Closing price of each bar, at most one bar per trade.
+    closes = np.empty(n, dtype=np.float64)
+    nbars, cum_volume = 0, 0.0
+    for i in range(n):
+        if not is_trade[i] or np.isnan(prices[i]):
+            continue
+        bar_of[i] = nbars
+        closes[nbars] = prices[i]
+        cum_volume += 0.0 if np.isnan(volumes[i]) else volumes[i]
+        if cum_volume >= bar_volume:
+            nbars += 1
+            cum_volume = 0.0
+    # Last, partially filled bar.
+    if cum_volume > 0:
+        nbars += 1
+    result = np.zeros(n, dtype=np.float64)
+    if nbars < 3:
+        return result
+    changes = np.diff(closes[:nbars])
+    sigma = np.std(changes)
+    if sigma == 0:
+        return result
+    imbalance = np.zeros(nbars, dtype=np.float64)
+    for b in range(1, nbars):
+        z = changes[b - 1] / sigma
+        # Standard normal CDF.
+        imbalance[b] = 2 * (0.5 * (1 + math.erf(z / math.sqrt(2)))) - 1
+    for i in range(n):
+        if bar_of[i] >= 0:
+            result[i] = imbalance[bar_of[i]]
+    return result
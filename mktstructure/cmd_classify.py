@@ -3,57 +3,133 @@ import os
 from datetime import datetime as dt
 from concurrent.futures import as_completed, ProcessPoolExecutor
 import tqdm
-import pandas as pd
 
-from .utils import lee_and_ready
+from . import bars, metrics, sharding
+from .classification import classify_trades
+from .alignment import alignment_path
+from .prefetch import prefetch, MB
+from .sessions import SessionCalendar
+from .compression import (
+    codec_from_path,
+    parse_codec,
+    strip_suffix,
+    to_csv,
+)
+from .schema import read_ticks
 
 
-def classify(path):
-    for root, _, files in os.walk(path):
+def _ric_date(path):
+    ric, date = os.path.normpath(path).split(os.sep)[-2:]
+    date = dt.fromisoformat(
+        strip_suffix(date).removesuffix(".csv").removesuffix(".sorted")
+    )
+    return ric, date.date()
+
+
+def _sorted_files(path, args=None):
+    paths = []
+    for root, _, files in sharding.walk(path):
         for f in files:
             # skip those signed ones
             if "signed" in f:
                 continue
             # work on only sorted files
-            if not ".sorted.csv.gz" in f:
+            if not ".sorted.csv" in f:
                 continue
             p = os.path.join(root, f)
 
-            if os.path.isfile(p):
-                df = pd.read_csv(p)
-                df_signed = lee_and_ready(df)
-                df_signed.to_csv(p.replace(".csv", ".signed.csv"))
+            if os.path.isfile(p) and sharding.in_shard(p, args):
+                paths.append(p)
+    return paths
+
+
+def classify(path, args, calendar=None):
+    classify_files(_sorted_files(path, args), args, calendar)
+
+
+def classify_files(paths, args, calendar=None):
+    calendar = SessionCalendar() if calendar is None else calendar
+    # Read and decompress the next file while the current one is classified.
+    # With `--shard_dynamic` files are claimed just before being read.
+    for p, df in prefetch(
+        paths,
+        lambda p: read_ticks(p) if sharding.claim(args, p) else None,
+        depth=args.prefetch,
+        max_memory=args.prefetch_memory * MB,
+    ):
+        if df is None:
+            continue
+        try:
+            _classify_file(p, df, args, calendar)
+        except BaseException:
+            sharding.release(args, p, done=False)
+            raise
+        sharding.release(args, p)
+
+
+def _classify_file(p, df, args, calendar):
+    with metrics.stage("classify", args, p, rows_in=len(df)) as m:
+        df_signed, alignment = classify_trades(
+            df,
+            args.algorithm,
+            calendar.sessions(*_ric_date(p)),
+            args.bvc_bar_volume,
+            args.quote_lag,
+            args.align_lags,
+            return_alignment=True,
+        )
+        # Write with the input codec unless `--codec` is given.
+        if args.codec:
+            codec = parse_codec(args.codec, args.codec_threads)
+        else:
+            codec = codec_from_path(p, args.codec_threads)
+        out = strip_suffix(p).replace(".csv", ".signed.csv") + codec.suffix
+        to_csv(df_signed, out, codec)
+        # Trade/quote alignment shared with the measures.
+        alignment.save(alignment_path(out))
+        m["rows_out"] = len(df_signed)
+        # Minute bars for the low-frequency measures, see `bars`.
+        with metrics.stage("bars", args, out, rows_in=len(df_signed)) as b:
+            day_bars = bars.compute_bars(df_signed)
+            bars.save(day_bars, bars.bars_path(out))
+            b["rows_out"] = len(day_bars)
+        m["bytes_written"] = metrics.file_size(
+            out, alignment_path(out), bars.bars_path(out)
+        )
+    return out
 
 
 def cmd_classify(args: argparse.Namespace):
     if args.all:
-        _, rics, _ = next(os.walk(args.data_dir))
+        rics = sharding.data_dirs(args.data_dir)
+        files = {
+            ric: _sorted_files(os.path.join(args.data_dir, ric), args) for ric in rics
+        }
+        # Trading sessions of all RIC-days are computed once and shared with workers.
+        calendar = SessionCalendar.build(
+            _ric_date(p) for paths in files.values() for p in paths
+        )
         workers = min(os.cpu_count(), args.threads)
         progress = tqdm.tqdm(total=len(rics))
         with ProcessPoolExecutor(workers) as exe:
             fs = [
-                exe.submit(classify, os.path.join(args.data_dir, ric)) for ric in rics
+                exe.submit(classify_files, files[ric], args, calendar) for ric in rics
             ]
             for _ in as_completed(fs):
                 progress.update()
     else:
-        # if `--all` flag is set
-        for root, _, files in os.walk(args.data_dir):
-            for f in files:
-                if "signed" in f:
-                    continue
-                if not ".sorted.csv.gz" in f:
-                    continue
-
-                path = os.path.join(root, f)
-                ric, date = os.path.normpath(path).split(os.sep)[-2:]
-
-                if ric not in args.ric:
-                    continue
-                date = dt.fromisoformat(
-                    date.removesuffix(".csv")
-                    .removesuffix(".csv.gz")
-                    .removesuffix(".sorted")
-                )
-                if not (dt.fromisoformat(args.b) <= date <= dt.fromisoformat(args.e)):
-                    continue
+        # if `--all` flag is not set
+        paths = []
+        for p in _sorted_files(args.data_dir, args):
+            ric, date = _ric_date(p)
+            if ric not in args.ric:
+                continue
+            if not (
+                dt.fromisoformat(args.b).date() <= date <= dt.fromisoformat(args.e).date()
+            ):
+                continue
+            paths.append(p)
+        calendar = SessionCalendar.build(_ric_date(p) for p in paths)
+        classify_files(paths, args, calendar)
+
+    sharding.report_pending(args)
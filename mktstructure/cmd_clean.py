@@ -4,22 +4,66 @@ from datetime import datetime as dt
 from concurrent.futures import as_completed, ProcessPoolExecutor
 import tqdm
 
+from . import metrics, sharding
+from .quality import format_counts
 from .utils import _sort_and_rm_duplicates
+from .compression import parse_codec, strip_suffix
 
 
 def clean(path, args):
+    codec = parse_codec(args.codec, args.codec_threads) if args.codec else None
     for root, _, files in os.walk(path):
         for f in files:
+            # skip indices and other non-data files
+            if ".csv" not in f:
+                continue
             path = os.path.join(root, f)
             if os.path.isfile(path):
-                _sort_and_rm_duplicates(path, replace=args.replace)
+                _clean_file(path, args, codec)
+
+
+def _quality(args):
+    """Arguments of `quality.filter_ticks`, None without `--filters`"""
+    if not args.filters:
+        return None
+    return {
+        "checks": args.filters,
+        "max_deviation": args.max_price_deviation,
+        "flag": args.flag,
+    }
+
+
+def _clean_file(path, args, codec):
+    # Another shard's, or claimed by another process.
+    if not sharding.claim(args, path):
+        return
+    counts = {}
+    try:
+        with metrics.stage("clean", args, path) as m:
+            m["rows_in"], m["rows_out"], out = _sort_and_rm_duplicates(
+                path,
+                replace=args.replace,
+                codec=codec,
+                quality=_quality(args),
+                counts=counts,
+            )
+            m["bytes_written"] = metrics.file_size(out)
+            m.update({f"filtered_{check}": n for check, n in counts.items()})
+    except BaseException:
+        sharding.release(args, path, done=False)
+        raise
+    sharding.release(args, path)
+    if counts:
+        verb = "Flagged" if args.flag else "Filtered"
+        print(f"{verb} {path}: {format_counts(counts)}.")
 
 
 def cmd_clean(args: argparse.Namespace):
     # sort by time and remove duplicates
+    codec = parse_codec(args.codec, args.codec_threads) if args.codec else None
 
     if args.all:
-        _, rics, _ = next(os.walk(args.data_dir))
+        rics = sharding.data_dirs(args.data_dir)
         workers = min(os.cpu_count(), args.threads)
         progress = tqdm.tqdm(total=len(rics))
         with ProcessPoolExecutor(workers) as exe:
@@ -30,21 +74,23 @@ def cmd_clean(args: argparse.Namespace):
             for _ in as_completed(fs):
                 progress.update()
     else:
-        for root, _, files in os.walk(args.data_dir):
+        for root, _, files in sharding.walk(args.data_dir):
             for f in files:
+                if ".csv" not in f:
+                    continue
                 path = os.path.join(root, f)
                 ric, date = os.path.normpath(path).split(os.sep)[-2:]
 
                 if not ric in args.ric:
                     continue
                 date = dt.fromisoformat(
-                    date.removesuffix(".csv")
-                    .removesuffix(".csv.gz")
-                    .removesuffix(".sorted")
+                    strip_suffix(date).removesuffix(".csv").removesuffix(".sorted")
                 )
                 if not (dt.fromisoformat(args.b) <= date <= dt.fromisoformat(args.e)):
                     continue
 
                 if os.path.isfile(path):
                     print(f"Cleaning {path}")
-                    _sort_and_rm_duplicates(path, replace=args.replace)
+                    _clean_file(path, args, codec)
+
+    sharding.report_pending(args)
@@ -1,25 +1,60 @@
 import argparse
 import os
+from collections import defaultdict
+from functools import partial
 from datetime import datetime as dt
 
-import pandas as pd
-
-from . import measures
+from . import bars, buckets, measures, metrics, rolling, sharding
+from .prefetch import prefetch, MB
+from .compression import strip_suffix
+from .schema import read_ticks
+from .alignment import AlignmentIndex, alignment_path, cleaned_path
+from .classification import align_signed
 
 
 def format_result(date, ric, measure_name, result):
     return ",".join([date.strftime("%Y-%m-%d"), ric, measure_name, str(result)])
 
 
+def format_bucket_result(date, ric, bucket, measure_name, result):
+    return ",".join([date.strftime("%Y-%m-%d"), ric, bucket, measure_name, str(result)])
+
+
+# Measures computed from each file on its own.
+DAILY_MEASURES = [
+    "bid_ask_spread",
+    "effective_spread",
+    "realized_spread",
+    "price_impact",
+    "variance_ratio",
+    "bid_slope",
+    "ask_slope",
+    "scaled_depth_diff_1",
+    "scaled_depth_diff_5",
+]
+
+
 def cmd_compute(args: argparse.Namespace):
 
-    if args.out:
-        fout = open(args.out, "w")
+    rolling_measures = rolling.selected(args)
+    if rolling_measures and (args.shard or args.shard_dynamic):
+        # A shard has only some days of each RIC, so its windows would be wrong.
+        raise ValueError(
+            "Rolling measures need every day of each RIC, compute them without "
+            "--shard or --shard_dynamic once the shards are done."
+        )
 
-    for root, _, files in os.walk(args.data_dir):
+    if args.out:
+        # Each shard writes its own results, see `mktstructure merge`.
+        fout = open(sharding.output_path(args.out, args), "w")
+
+    only_rolling = not any(getattr(args, m) for m in DAILY_MEASURES)
+    # Days of each RIC to output the rolling measures of.
+    rolling_days = defaultdict(set)
+    tasks = []
+    for root, _, files in sharding.walk(args.data_dir):
         for f in files:
             # skip those unsigned ones
-            # TODO: .csv vs .csv.gz
             if ".csv" not in f:
                 continue
             if not (
@@ -34,8 +69,8 @@ def cmd_compute(args: argparse.Namespace):
             path = os.path.join(root, f)
             ric, date = os.path.normpath(path).split(os.sep)[-2:]
             date = dt.fromisoformat(
-                date.removesuffix(".csv")
-                .removesuffix(".csv.gz")
+                strip_suffix(date)
+                .removesuffix(".csv")
                 .removesuffix(".signed")
                 .removesuffix(".sorted")
             )
@@ -48,34 +83,148 @@ def cmd_compute(args: argparse.Namespace):
                 if not (dt.fromisoformat(args.b) <= date <= dt.fromisoformat(args.e)):
                     continue
 
-            if os.path.isfile(path):
-                df = pd.read_csv(path)
-
-                if args.bid_ask_spread:
-                    _compute(measures.bidask_spread, path, date, ric, df, fout)
-                if args.effective_spread:
-                    _compute(measures.effective_spread, path, date, ric, df, fout)
-                if args.realized_spread:
-                    _compute(measures.realized_spread, path, date, ric, df, fout)
-                if args.price_impact:
-                    _compute(measures.price_impact, path, date, ric, df, fout)
-                if args.variance_ratio:
-                    _compute(measures.variance_ratio, path, date, ric, df, fout)
-                if args.bid_slope:
-                    _compute(measures.bid_slope, path, date, ric, df, fout)
-                if args.ask_slope:
-                    _compute(measures.ask_slope, path, date, ric, df, fout)
-                if args.scaled_depth_diff_1:
-                    _compute(measures.sdd1, path, date, ric, df, fout)
-                if args.scaled_depth_diff_5:
-                    _compute(measures.sdd5, path, date, ric, df, fout)
+            if not (os.path.isfile(path) and sharding.in_shard(path, args)):
+                continue
+            if rolling_measures and "signed" in f:
+                rolling_days[ric].add(date.strftime("%Y-%m-%d"))
+                # No need to read the ticks if the day statistics or bars are fresh.
+                if only_rolling and rolling.is_fresh(args.data_dir, path):
+                    continue
+                if only_rolling and bars.is_fresh(path):
+                    day_bars = bars.load(bars.bars_path(path))
+                    rolling.save_day_stats(args.data_dir, ric, date.date(), day_bars)
+                    continue
+            tasks.append((path, date, ric))
+
+    # Read and decompress the next files while measures run on the current one.
+    # With `--shard_dynamic` files are claimed just before being read.
+    for (path, date, ric), data in prefetch(
+        tasks,
+        lambda task: _claim_and_read(task[0], args),
+        depth=args.prefetch,
+        max_memory=args.prefetch_memory * MB,
+    ):
+        if data is None:
+            continue
+        try:
+            _compute_file(path, date, ric, *data, fout, args)
+        except BaseException:
+            sharding.release(args, path, done=False)
+            raise
+        sharding.release(args, path)
+
+    # Rolling windows are updated with the new days once all files are done.
+    for ric, days in sorted(rolling_days.items()):
+        history = rolling.update(args.data_dir, ric, args.window)
+        for day in sorted(days):
+            if day not in history:
+                continue
+            date = dt.fromisoformat(day)
+            for m in rolling_measures:
+                name = f"{rolling.MEASURES[m]} ({args.window} days)"
+                print(format_result(date, ric, name, history[day][m]), file=fout)
 
     fout.close()
-
-
-def _compute(measure, path, date, ric, data, fout):
+    sharding.report_pending(args)
+
+
+def _compute_file(path, date, ric, df, alignment, fout, args):
+    with metrics.stage("compute", args, path, rows_in=len(df)):
+        # Bucket of each row with `--interval`, shared by the measures.
+        bucket = None
+        if getattr(args, "interval", None):
+            bucket = buckets.bucket_ids(df, date, args.interval)
+        compute = partial(
+            _compute,
+            path=path,
+            date=date,
+            ric=ric,
+            data=df,
+            fout=fout,
+            args=args,
+            bucket=bucket,
+        )
+        if args.bid_ask_spread:
+            compute(measures.bidask_spread)
+        if args.effective_spread:
+            compute(measures.effective_spread)
+        if args.realized_spread:
+            compute(measures.realized_spread, alignment=alignment)
+        if args.price_impact:
+            compute(measures.price_impact, alignment=alignment)
+        if args.variance_ratio:
+            compute(measures.variance_ratio)
+        if args.bid_slope:
+            compute(measures.bid_slope)
+        if args.ask_slope:
+            compute(measures.ask_slope)
+        if args.scaled_depth_diff_1:
+            compute(measures.sdd1)
+        if args.scaled_depth_diff_5:
+            compute(measures.sdd5)
+        # Sufficient statistics of the day for the rolling measures, computed once.
+        if rolling.selected(args) and "signed" in os.path.basename(path):
+            if not rolling.is_fresh(args.data_dir, path):
+                day_bars = _bars(path, df, args)
+                rolling.save_day_stats(args.data_dir, ric, date.date(), day_bars)
+
+
+def _bars(path, df, args):
+    """Minute bars of the signed file, built and saved if `classify` didn't"""
+    if bars.is_fresh(path):
+        return bars.load(bars.bars_path(path))
+    with metrics.stage("bars", args, path, rows_in=len(df)) as m:
+        day_bars = bars.compute_bars(df)
+        bars.save(day_bars, bars.bars_path(path))
+        m["rows_out"] = len(day_bars)
+    return day_bars
+
+
+def _claim_and_read(path, args):
+    if not sharding.claim(args, path):
+        return None
+    return _read(path, args.price_dtype)
+
+
+def _read(path, price_dtype):
+    data = read_ticks(path, price_dtype)
+    # Use the trade/quote alignment stored by `classify` if available.
+    align = alignment_path(path)
+    if os.path.isfile(align):
+        return data, AlignmentIndex.load(align)
+    # Else rebuild it from the quotes of the cleaned data, for the same results, and
+    # save it so that the cleaned data is read only once.
+    cleaned = cleaned_path(path) if ".signed" in path else None
+    if cleaned is None:
+        return data, None
+    alignment = align_signed(data, read_ticks(cleaned, price_dtype))
+    alignment.save(align)
+    print(f"Rebuilt the trade/quote alignment of {path} into {align}.")
+    return data, alignment
+
+
+def _compute(
+    measure, path, date, ric, data, fout, alignment=None, args=None, bucket=None
+):
+    if bucket is not None and not hasattr(measure, "estimate_buckets"):
+        print(f"Skipping {measure.name} for {path}, it has no per-interval estimate")
+        return
     print(f"Computing {measure.name} for {path}")
-    result = measure.estimate(data)
+    # Per-measure timings, nested in the stage of the file.
+    with metrics.stage(
+        "measure", args, measure=measure.name, ric=ric, date=date.strftime("%Y-%m-%d")
+    ):
+        kwargs = {} if alignment is None else {"alignment": alignment}
+        if bucket is not None:
+            result = measure.estimate_buckets(data, bucket, **kwargs)
+        else:
+            result = measure.estimate(data, **kwargs)
+    if bucket is not None:
+        for b, value in zip(*result):
+            label = buckets.label(b, args.interval)
+            formated = format_bucket_result(date, ric, label, measure.name, value)
+            print(formated, file=fout)
+        return
     # Variance ratio test returns a list of results
     if measure.name == "LoMacKinlay1988":
         assert isinstance(result, list)
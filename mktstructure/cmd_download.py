@@ -1,56 +1,162 @@
 import argparse
 import gzip
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from shutil import copyfileobj
 
-from .utils import extract_index_components_ric
-from .utils import SP500_RIC, NASDAQ_RIC, NYSE_RIC
+from . import metrics, sharding
+from .constituents import download_requests
+from .fields import tick_fields
+from .ingest import ingest
+from .planner import PLAN_SUFFIX, Catalog, QuotaTracker, load_plan, plan, save_plan
 from .trth import Connection
 from .trth_parser import parse_to_data_dir
+from .compression import SUFFIXES, compress_file, parse_codec, strip_suffix
 
 
 def cmd_download(args: argparse.Namespace):
 
-    start_date = f"{args.b}T00:00:00.000Z"
-    end_date = f"{args.e}T00:00:00.000Z"
+    # Only the fields needed by the measures to compute, if given.
+    fields = tick_fields(args.measures, args.fields)
+    if fields:
+        print(f"Requesting fields: {', '.join(fields)}.")
 
     print("Connecting to TRTH...")
-    trth = Connection(args.u, args.p, progress_callback=print)
-
-    if args.sp500:
-        args.ric.extend(
-            extract_index_components_ric(
-                trth.get_index_components([SP500_RIC], start_date, end_date),
-                mkt_index=[SP500_RIC],
-            )
-        )
-
-    data = trth.get_table(args.ric, start_date, end_date)
-
-    print(f"Saving data to {args.o}...")
-
-    trth.save_results(data, args.o)
+    trth = Connection(
+        args.u,
+        args.p,
+        progress_callback=print,
+        base_url=args.base_url,
+        polling_interval=args.poll_interval,
+    )
+
+    # Index constituents are requested only for the days they are in the index, so RICs
+    # with different membership intervals go in separate requests and files.
+    catalog = Catalog(args.data_dir, args.rows_per_day)
+    save = partial(trth.save_table, fields=fields)
+    downloads = download_jobs(trth, args, save, catalog)
+    if not downloads:
+        return
 
     print("Downloading finished.")
 
     if args.parse:
 
-        print("Decompressing downloaded data.")
-        with gzip.open(args.o, "rb") as fin, open("__tmp.csv", "wb") as fout:
-            copyfileobj(fin, fout)
-
-        print("Parsing downloaded raw data.")
-        parse_to_data_dir("__tmp.csv", args.data_dir, "1")
-
-        os.remove("__tmp.csv")
+        for path in downloads:
+            print(f"Decompressing downloaded data {path}.")
+            with metrics.stage("decompress", args, path) as m:
+                with gzip.open(path, "rb") as fin, open("__tmp.csv", "wb") as fout:
+                    copyfileobj(fin, fout)
+                m["bytes_written"] = metrics.file_size("__tmp.csv")
+
+            print("Parsing downloaded raw data.")
+            parsed_at = time.time()
+            with metrics.stage("parse", args, "__tmp.csv") as m:
+                if args.merge:
+                    # Sorted merge into the stored RIC-days, see `ingest`.
+                    merged = ingest("__tmp.csv", args.data_dir)
+                    added = sum(rows for _, rows, _ in merged)
+                    dropped = sum(duplicates for *_, duplicates in merged)
+                    print(
+                        f"Merged {added:,} rows into {len(merged)} files, "
+                        f"dropped {dropped:,} duplicates."
+                    )
+                    m["rows_out"] = added
+                else:
+                    parse_to_data_dir("__tmp.csv", args.data_dir, "1")
+                m["bytes_written"] = _dir_size(args.data_dir)
+
+            os.remove("__tmp.csv")
+            # Rows of the new RIC-days, to size the jobs of later downloads.
+            catalog.record(_parsed_since(args.data_dir, parsed_at))
 
         if args.compress:
 
-            print("Compressing parsed data.")
-            for root, _, files in os.walk(args.data_dir):
-                for f in [f for f in files if "gz" not in f.lower()]:
-                    with open(os.path.join(root, f), "rb") as fin:
-                        data = fin.read()
-                    with gzip.open(os.path.join(root, f + ".gz"), "wb") as fout:
-                        fout.write(data)
-                    os.remove(os.path.join(root, f))
+            print(f"Compressing parsed data with {args.codec}.")
+            codec = parse_codec(args.codec, args.codec_threads)
+            paths = [
+                os.path.join(root, f)
+                for root, _, files in os.walk(args.data_dir)
+                for f in files
+                if not any(s and f.endswith(s) for s in SUFFIXES.values())
+            ]
+            # Each file is streamed through the encoder, which is itself
+            # multi-threaded, so only a couple of files are in flight at once.
+            with metrics.stage("compress", args, files=len(paths)) as m:
+                m["bytes_read"] = metrics.file_size(*paths)
+                with ThreadPoolExecutor(2) as exe:
+                    list(exe.map(lambda p: compress_file(p, codec), paths))
+                m["bytes_written"] = _dir_size(args.data_dir)
+
+
+def download_jobs(trth, args, save, catalog):
+    """
+    Plan the extractions of `args` into jobs (see `planner`) and download each with
+    `save`, e.g. `trth.save_table`, until the quota runs out. Returns the paths saved.
+    With `--resume`, the jobs planned by the first run are downloaded.
+    """
+    requests = download_requests(trth, args)
+    saved = args.o + PLAN_SUFFIX
+    jobs = load_plan(saved, requests) if args.resume else None
+    if jobs is None:
+        jobs = plan(requests, catalog, args.max_rows_per_job, args.max_rics_per_job)
+        save_plan(saved, requests, jobs)
+    else:
+        print(f"Resuming the jobs planned in {saved}.")
+    if not jobs:
+        print("Nothing to download.")
+        return []
+    sizes = [rows for *_, rows in jobs]
+    print(
+        f"Planned {len(jobs)} extraction jobs of {min(sizes):,.0f} to "
+        f"{max(sizes):,.0f} estimated rows."
+    )
+    quota = QuotaTracker(args.max_quota)
+    downloads = []
+    for i, (rics, start_date, end_date, rows) in enumerate(jobs):
+        if quota.exhausted():
+            print(
+                f"Quota used up, {len(jobs) - i} jobs left. "
+                "Rerun with --resume once the quota allows."
+            )
+            break
+        path = part_path(args.o, i)
+        with metrics.stage("download", args, rics=len(rics)) as m:
+            print(f"Saving data to {path}...")
+            # Journaled, so that `--resume` picks up the job and a partial download.
+            save(rics, start_date, end_date, path, resume=args.resume)
+            quota.record(trth.quota)
+            m["bytes_written"] = metrics.file_size(path)
+            m["estimated_rows"] = rows
+        downloads.append(path)
+    remaining = "" if quota.remaining is None else f", {quota.remaining} left"
+    print(f"Quota used: {quota.used}{remaining}.")
+    return downloads
+
+
+def _parsed_since(data_dir, since):
+    """Uncompressed RIC-day files written by the parser since `since`"""
+    for root, _, files in sharding.walk(data_dir):
+        for f in files:
+            path = os.path.join(root, f)
+            if not re.fullmatch(r"\d{4}-\d{2}-\d{2}\.csv", f):
+                continue
+            if os.path.getmtime(path) >= since:
+                yield path
+
+
+def part_path(path, i):
+    """Path of the i-th downloaded file, e.g. `out.csv.gz`, `out.1.csv.gz`, ..."""
+    if i == 0:
+        return path
+    stem = strip_suffix(path).removesuffix(".csv")
+    return f"{stem}.{i}{path[len(stem):]}"
+
+
+def _dir_size(path):
+    return metrics.file_size(
+        *(os.path.join(root, f) for root, _, files in os.walk(path) for f in files)
+    )
@@ -1,33 +1,35 @@
 import argparse
 import gzip
 import os
+from functools import partial
 from shutil import copyfileobj
 
-from .utils import extract_index_components_ric
-from .utils import SP500_RIC, NASDAQ_RIC, NYSE_RIC
+from .cmd_download import download_jobs
+from .fields import depth_fields
+from .planner import Catalog
 from .trth import Connection
 
 
 def cmd_download_mktdepth(args: argparse.Namespace):
 
-    start_date = f"{args.b}T00:00:00.000Z"
-    end_date = f"{args.e}T00:00:00.000Z"
+    # Only the fields and levels needed by the measures to compute, if given.
+    fields, levels = depth_fields(args.measures, args.fields, args.levels)
+    print(f"Requesting fields: {', '.join(fields)}; levels: {levels}.")
 
     print("Connecting to TRTH...")
-    trth = Connection(args.u, args.p, progress_callback=print)
-
-    if args.sp500:
-        args.ric.extend(
-            extract_index_components_ric(
-                trth.get_index_components([SP500_RIC], start_date, end_date),
-                mkt_index=[SP500_RIC],
-            )
-        )
-
-    data = trth.get_table_mktdepth(args.ric, start_date, end_date)
-
-    print(f"Saving data to {args.o}...")
-
-    trth.save_results(data, args.o)
+    trth = Connection(
+        args.u,
+        args.p,
+        progress_callback=print,
+        base_url=args.base_url,
+        polling_interval=args.poll_interval,
+    )
+
+    # Index constituents are requested only for the days they are in the index, so RICs
+    # with different membership intervals go in separate requests and files. The catalog
+    # has trade rows only, so jobs are sized with `--rows_per_day`.
+    catalog = Catalog(None, args.rows_per_day)
+    save = partial(trth.save_table_mktdepth, fields=fields, levels=levels)
+    download_jobs(trth, args, save, catalog)
 
     print("Downloading finished.")
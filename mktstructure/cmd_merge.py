@@ -0,0 +1,9 @@
+import argparse
+
+from .sharding import merge
+
+
+def cmd_merge(args: argparse.Namespace):
+    print(f"Merging {len(args.files)} files into {args.out}...")
+    lines = merge(args.files, args.out)
+    print(f"{lines} results saved.")
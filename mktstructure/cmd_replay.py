@@ -0,0 +1,62 @@
+import argparse
+import os
+from collections import defaultdict
+from datetime import datetime as dt
+
+from . import metrics, sharding
+from .cmd_compute import format_result
+from .measures import online
+from .replay import Replay
+from .sessions import SessionCalendar
+
+
+def _replay_files(args):
+    """Sorted files to replay by date"""
+    days = defaultdict(list)
+    for root, _, files in sharding.walk(args.data_dir):
+        for f in files:
+            if ".sorted.csv" not in f or "signed" in f:
+                continue
+            path = os.path.join(root, f)
+            ric, day = sharding.ric_day(path)
+            if not args.all:
+                if ric not in args.ric:
+                    continue
+                if not (args.b <= day <= args.e):
+                    continue
+            days[day].append(path)
+    return {day: sorted(paths) for day, paths in sorted(days.items())}
+
+
+def cmd_replay(args: argparse.Namespace):
+    trade_measures = [m for m in online.TRADE_ESTIMATORS if getattr(args, m, False)]
+    depth_measures = [m for m in online.DEPTH_ESTIMATORS if getattr(args, m, False)]
+    fout = open(args.out, "w") if args.out else None
+    calendar = SessionCalendar()
+
+    # Days are replayed one after the other, all RICs of a day at once.
+    for day, paths in _replay_files(args).items():
+        replay = Replay(
+            paths,
+            trade_measures,
+            depth_measures,
+            speed=args.speed or None,
+            chunk_size=args.chunk_size,
+            batch_size=args.batch_size,
+            price_dtype=args.price_dtype,
+            calendar=calendar,
+        )
+        with metrics.stage("replay", args, date=day, files=len(paths)) as m:
+            stats = replay.run()
+            m.update(stats)
+        print(
+            f"Replayed {day}: {stats['ticks']} ticks of {len(paths)} files in "
+            f"{stats['wall_seconds']:.2f}s, {stats['ticks_per_second']:,.0f} ticks/s, "
+            f"{stats['speedup']:,.1f}x real time, max lag {stats['lag']:.3f}s"
+        )
+        if fout:
+            for ric, day, name, value in replay.results():
+                print(format_result(dt.fromisoformat(day), ric, name, value), file=fout)
+
+    if fout:
+        fout.close()
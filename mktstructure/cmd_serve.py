@@ -0,0 +1,26 @@
+import argparse
+
+from .serve import ResultsServer
+
+
+def cmd_serve(args: argparse.Namespace):
+    index_dir = args.index_dir or f"{args.files[0]}.index"
+    print(f"Indexing {len(args.files)} files into {index_dir}...")
+    server = ResultsServer(
+        args.files,
+        index_dir,
+        (args.host, args.port),
+        cache_mb=args.cache_mb,
+        refresh=args.refresh,
+    )
+    index = server.index()
+    print(
+        f"Serving {len(index)} results of {len(index.rics)} RICs on {server.url}, "
+        "Ctrl-C to stop."
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,161 @@
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import metrics, sharding
+from .compression import parse_codec, strip_suffix
+from .sessions import SessionCalendar
+
+# Processed files and their (mtime, size), so that a restart doesn't redo everything.
+STATE_FILE = os.path.join(".watch", "state.json")
+# `compute` flags of measures on trades (signed data) and on market depth (sorted data).
+TRADE_MEASURES = [
+    "bid_ask_spread",
+    "effective_spread",
+    "realized_spread",
+    "price_impact",
+    "variance_ratio",
+]
+DEPTH_MEASURES = [
+    "bid_slope",
+    "ask_slope",
+    "scaled_depth_diff_1",
+    "scaled_depth_diff_5",
+]
+
+
+def _is_raw(f):
+    base = strip_suffix(f)
+    return base.endswith(".csv") and ".sorted" not in base and ".signed" not in base
+
+
+def scan(data_dir):
+    """(mtime, size) of every raw (parsed, not yet cleaned) data file"""
+    snapshot = {}
+    for root, _, files in sharding.walk(data_dir):
+        for f in files:
+            if not _is_raw(f):
+                continue
+            path = os.path.join(root, f)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = [st.st_mtime_ns, st.st_size]
+    return snapshot
+
+
+def _only(args, measures):
+    """Copy of `args` with only the given measures selected"""
+    flags = {
+        m: getattr(args, m) and m in measures for m in TRADE_MEASURES + DEPTH_MEASURES
+    }
+    return argparse.Namespace(**{**vars(args), **flags})
+
+
+def process(path, args, calendar):
+    """Clean, classify and compute the measures of one raw file, returns the results"""
+    from .cmd_classify import _classify_file, _ric_date
+    from .cmd_clean import _quality
+    from .cmd_compute import _compute_file, _read
+    from .quality import format_counts
+    from .schema import read_ticks
+    from .utils import _sort_and_rm_duplicates
+
+    codec = parse_codec(args.codec, args.codec_threads) if args.codec else None
+    counts = {}
+    with metrics.stage("clean", args, path) as m:
+        m["rows_in"], m["rows_out"], sorted_path = _sort_and_rm_duplicates(
+            path, replace=False, codec=codec, quality=_quality(args), counts=counts
+        )
+        m["bytes_written"] = metrics.file_size(sorted_path)
+        m.update({f"filtered_{check}": n for check, n in counts.items()})
+    if counts:
+        verb = "Flagged" if args.flag else "Filtered"
+        print(f"{verb} {path}: {format_counts(counts)}.")
+    ric, day = _ric_date(sorted_path)
+    results = io.StringIO()
+    if any(getattr(args, m) for m in DEPTH_MEASURES):
+        df, _ = _read(sorted_path, args.price_dtype)
+        _compute_file(
+            sorted_path, day, ric, df, None, results, _only(args, DEPTH_MEASURES)
+        )
+    if any(getattr(args, m) for m in TRADE_MEASURES):
+        df = read_ticks(sorted_path)
+        signed_path = _classify_file(sorted_path, df, args, calendar)
+        df, alignment = _read(signed_path, args.price_dtype)
+        _compute_file(
+            signed_path, day, ric, df, alignment, results, _only(args, TRADE_MEASURES)
+        )
+    return results.getvalue()
+
+
+def _load_state(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def cmd_watch(args: argparse.Namespace):
+    state_path = os.path.join(args.data_dir, STATE_FILE)
+    done = _load_state(state_path)
+    # Files seen but maybe still being written: path -> (mtime and size, first seen).
+    settling = {}
+    running = {}
+    calendar = SessionCalendar()
+    workers = min(os.cpu_count(), args.threads)
+
+    print(f"Watching {args.data_dir} for new files...")
+    with ProcessPoolExecutor(workers) as exe, open(args.out, "a") as fout:
+        try:
+            while True:
+                now = time.monotonic()
+                busy = {path for path, _ in running.values()}
+                for path, stamp in scan(args.data_dir).items():
+                    if done.get(path) == stamp or path in busy:
+                        continue
+                    if path not in settling or settling[path][0] != stamp:
+                        settling[path] = (stamp, now)
+                        continue
+                    # Unchanged for `--settle` seconds, i.e. fully written. Keep at most
+                    # two files per worker in flight, the rest wait for the next scan.
+                    settled = now - settling[path][1] >= args.settle
+                    if settled and len(running) < 2 * workers:
+                        del settling[path]
+                        fut = exe.submit(process, path, args, calendar)
+                        running[fut] = (path, stamp)
+
+                if args.once and not settling and not running:
+                    break
+                if not running:
+                    time.sleep(args.poll_interval)
+                    continue
+                finished, _ = wait(
+                    running, args.poll_interval, return_when=FIRST_COMPLETED
+                )
+                for fut in finished:
+                    path, stamp = running.pop(fut)
+                    try:
+                        fout.write(fut.result())
+                        fout.flush()
+                        print(f"Processed {path}")
+                    except Exception as e:
+                        # Not retried until the file changes.
+                        print(f"Failed to process {path}: {e!r}")
+                    done[path] = stamp
+                    _save_state(state_path, done)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for files in progress...")
+            for fut in running:
+                fut.cancel()
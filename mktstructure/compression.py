@@ -0,0 +1,199 @@
+import gzip
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Name of codec -> file suffix
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "lz4": ".lz4", "none": ""}
+# Blocks of this size are compressed independently when encoding in parallel.
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class Codec:
+    """
+    A compression codec for intermediate data files, e.g. `gzip`, `gzip:1`, `zstd:3`, `lz4` or `none`.
+
+    Files are read and written through `open()`, which streams the data. When `threads > 1`,
+    gzip and lz4 data are encoded in independent blocks on a thread pool and written as
+    concatenated gzip members / lz4 frames, which any standard decoder reads as one stream.
+    zstd uses its own multi-threaded encoder.
+    """
+
+    def __init__(self, name="gzip", level=None, threads=1):
+        if name not in SUFFIXES:
+            raise ValueError(
+                f"Unknown codec {name}, choose from {', '.join(SUFFIXES)}."
+            )
+        self.name = name
+        self.level = level
+        self.threads = max(1, threads or 1)
+
+    def __repr__(self):
+        level = "" if self.level is None else f":{self.level}"
+        return f"{self.name}{level}"
+
+    @property
+    def suffix(self):
+        return SUFFIXES[self.name]
+
+    def open(self, path, mode="rb"):
+        text = "t" in mode
+        binary_mode = mode.replace("t", "").replace("b", "") + "b"
+        if "r" in mode:
+            f = self._open_read(path)
+        else:
+            f = self._open_write(path, binary_mode)
+        return io.TextIOWrapper(f, encoding="utf-8", newline="") if text else f
+
+    def _open_read(self, path):
+        if self.name == "gzip":
+            return gzip.open(path, "rb")
+        if self.name == "zstd":
+            zstd = _import_codec("zstandard", "zstd")
+            return zstd.open(path, "rb")
+        if self.name == "lz4":
+            lz4_frame = _import_codec("lz4.frame", "lz4")
+            return lz4_frame.open(path, "rb")
+        return open(path, "rb")
+
+    def _open_write(self, path, mode):
+        if self.name == "gzip":
+            level = 9 if self.level is None else self.level
+            if self.threads > 1:
+                return _BlockWriter(
+                    open(path, mode),
+                    lambda block: gzip.compress(block, compresslevel=level),
+                    self.threads,
+                )
+            return gzip.open(path, mode, compresslevel=level)
+        if self.name == "zstd":
+            zstd = _import_codec("zstandard", "zstd")
+            cctx = zstd.ZstdCompressor(
+                level=3 if self.level is None else self.level,
+                threads=self.threads if self.threads > 1 else 0,
+            )
+            return zstd.open(path, mode, cctx=cctx)
+        if self.name == "lz4":
+            lz4_frame = _import_codec("lz4.frame", "lz4")
+            level = 0 if self.level is None else self.level
+            if self.threads > 1:
+                return _BlockWriter(
+                    open(path, mode),
+                    lambda block: lz4_frame.compress(block, compression_level=level),
+                    self.threads,
+                )
+            return lz4_frame.open(path, mode, compression_level=level)
+        return open(path, mode)
+
+
+class _BlockWriter(io.BufferedIOBase):
+    """Compress fixed-size blocks on a thread pool and write them out in order"""
+
+    def __init__(self, raw, compress, threads, block_size=BLOCK_SIZE):
+        self._raw = raw
+        self._compress = compress
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._max_pending = 2 * threads
+        self._exe = ThreadPoolExecutor(threads)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer += b
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[: self._block_size]))
+            del self._buffer[: self._block_size]
+        return len(b)
+
+    def _submit(self, block):
+        self._pending.append(self._exe.submit(self._compress, block))
+        # Bound the number of blocks held in memory.
+        while len(self._pending) > self._max_pending:
+            self._raw.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._raw.write(self._pending.popleft().result())
+        finally:
+            self._exe.shutdown(wait=True)
+            self._raw.close()
+            super().close()
+
+
+def _import_codec(module, name):
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError as e:
+        raise ImportError(
+            f"Codec {name} requires the `{module.split('.')[0]}` package, "
+            f"install it via `pip install mktstructure[{name}]`."
+        ) from e
+
+
+def parse_codec(spec: str, threads=1) -> Codec:
+    """Parse a codec spec like `gzip`, `gzip:1`, `zstd:3`, `lz4` or `none`"""
+    name, _, level = spec.lower().partition(":")
+    return Codec(name, int(level) if level else None, threads)
+
+
+def codec_from_path(path, threads=1) -> Codec:
+    """Guess the codec of a file from its suffix"""
+    for name, suffix in SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return Codec(name, threads=threads)
+    return Codec("none")
+
+
+def strip_suffix(path: str) -> str:
+    """Remove the compression suffix, if any, from the path"""
+    for suffix in SUFFIXES.values():
+        if suffix and path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+
+def read_csv(path, **kwargs):
+    import pandas as pd
+
+    with codec_from_path(path).open(path, "rb") as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def iter_csv(path, chunksize, **kwargs):
+    """`read_csv()` in chunks of `chunksize` rows, keeping the file open between chunks"""
+    import pandas as pd
+
+    with codec_from_path(path).open(path, "rb") as f:
+        with pd.read_csv(f, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+
+
+def to_csv(df, path, codec: Codec, **kwargs):
+    with codec.open(path, "wt") as f:
+        df.to_csv(f, **kwargs)
+
+
+def compress_file(path, codec: Codec, remove=True):
+    """Stream `path` into `path + codec.suffix`, optionally removing the original file"""
+    if codec.name == "none":
+        return path
+    out = path + codec.suffix
+    with open(path, "rb") as fin, codec.open(out, "wb") as fout:
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            if not block:
+                break
+            fout.write(block)
+    if remove:
+        os.remove(path)
+    return out
@@ -0,0 +1,154 @@
+"""
+Point-in-time index constituents, cached on disk by chain RIC and date range.
+
+A `Search/HistoricalChainResolution` request over a range gives the RICs in the chain at
+any time in it. The whole range of a chain is resolved first, with its first and last
+business days. If the three agree the membership is taken as constant, else the range is
+split in halves and each is resolved the same way, so that only the ranges where the
+membership changes are narrowed down to single days. A RIC leaving and rejoining within
+a range whose ends agree is then taken as in the index throughout. Results are saved
+as `<cache_dir>/<chain RIC>/<first>[_<last>].json`, so reruns need no requests, unless
+empty, which may be a failed resolution. The days a RIC is a constituent are merged into
+membership intervals, and RICs with the same interval share one extraction request.
+Ticks are then only requested for the days a RIC is in the index, rather than for the
+whole range for every RIC ever in it.
+"""
+import json
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from .utils import extract_index_components_ric
+from .utils import SP500_RIC, NASDAQ_RIC, NYSE_RIC
+
+CACHE_DIR = ".chains"
+# `download` flag -> chain RIC of the index.
+INDEX_FLAGS = {"sp500": SP500_RIC, "nasdaq100": NASDAQ_RIC, "nyse": NYSE_RIC}
+
+
+def business_days(start, end) -> List[date]:
+    """Weekdays from `start` up to, but excluding, `end` (YYYY-MM-DD or dates)"""
+    return [d.date() for d in pd.bdate_range(start, end, inclusive="left")]
+
+
+class ConstituentCache:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, chain, first, last):
+        name = f"{first}" if first == last else f"{first}_{last}"
+        return os.path.join(self.root, chain, f"{name}.json")
+
+    def get(self, chain, first, last):
+        """Constituents of `chain` from `first` to `last`, None if not cached"""
+        path = self._path(chain, first, last)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, chain, first, last, rics):
+        path = self._path(chain, first, last)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(sorted(rics), f)
+        os.replace(path + ".tmp", path)
+
+    def constituents(self, trth, chain, first, last=None) -> List[str]:
+        """
+        RICs in `chain` at any time from `first` to `last` (inclusive, default `first`),
+        resolved with `trth` if not cached
+        """
+        last = first if last is None else last
+        rics = self.get(chain, first, last)
+        if rics is None:
+            start = f"{first}T00:00:00.000Z"
+            end = f"{last + timedelta(days=1)}T00:00:00.000Z"
+            result = trth.get_index_components([chain], start, end)
+            rics = extract_index_components_ric(result, mkt_index=[chain])
+            # An empty chain is more likely a failed resolution, so it's asked again.
+            if rics:
+                self.put(chain, first, last, rics)
+        return rics
+
+    def _spans(self, trth, chain, days, lo, hi) -> List[Tuple[int, int, set]]:
+        """
+        Runs `(lo, hi, rics)` of `days[lo:hi]` with the same constituents, split in
+        halves only where they change
+        """
+        rics = set(self.constituents(trth, chain, days[lo], days[hi - 1]))
+        if hi - lo == 1:
+            return [(lo, hi, rics)]
+        first = set(self.constituents(trth, chain, days[lo]))
+        last = set(self.constituents(trth, chain, days[hi - 1]))
+        if first == rics == last:
+            return [(lo, hi, rics)]
+        mid = (lo + hi) // 2
+        return self._spans(trth, chain, days, lo, mid) + self._spans(
+            trth, chain, days, mid, hi
+        )
+
+    def membership(self, trth, chains, start, end) -> Dict[str, List[Tuple]]:
+        """
+        Membership intervals `(first day, last day)` of each RIC in any of the `chains`
+        between `start` (inclusive) and `end` (exclusive). `trth` may be None if all the
+        ranges resolved are cached.
+        """
+        days = business_days(start, end)
+        members = defaultdict(set)
+        for chain in chains:
+            if not days:
+                break
+            for lo, hi, rics in self._spans(trth, chain, days, 0, len(days)):
+                for ric in rics:
+                    members[ric].update(days[lo:hi])
+        intervals = {}
+        for ric, in_index in members.items():
+            intervals[ric] = []
+            for i, day in enumerate(days):
+                if day not in in_index:
+                    continue
+                if i and days[i - 1] in in_index:
+                    intervals[ric][-1] = (intervals[ric][-1][0], day)
+                else:
+                    intervals[ric].append((day, day))
+        return intervals
+
+
+def requests(intervals) -> List[Tuple[List[str], str, str]]:
+    """
+    Extraction requests `(rics, start, end)` covering the membership `intervals`, one
+    per distinct interval, with the UTC start and (exclusive) end of `cmd_download`.
+    """
+    groups = defaultdict(list)
+    for ric, spans in intervals.items():
+        for span in spans:
+            groups[span].append(ric)
+    return [
+        (
+            sorted(rics),
+            f"{first}T00:00:00.000Z",
+            f"{last + timedelta(days=1)}T00:00:00.000Z",
+        )
+        for (first, last), rics in sorted(groups.items())
+    ]
+
+
+def download_requests(trth, args) -> List[Tuple[List[str], str, str]]:
+    """
+    Extraction requests `(rics, start, end)` of `download`: the `--ric` for the whole
+    range, and the constituents of the selected indices while they are in the index.
+    """
+    start, end = f"{args.b}T00:00:00.000Z", f"{args.e}T00:00:00.000Z"
+    jobs = [(list(args.ric), start, end)] if args.ric else []
+    chains = [chain for flag, chain in INDEX_FLAGS.items() if getattr(args, flag)]
+    if chains:
+        root = args.chain_cache or os.path.join(args.data_dir, CACHE_DIR)
+        intervals = ConstituentCache(root).membership(trth, chains, args.b, args.e)
+        # RICs given with `--ric` are requested for the whole range already.
+        intervals = {r: spans for r, spans in intervals.items() if r not in args.ric}
+        jobs.extend(requests(intervals))
+    return jobs
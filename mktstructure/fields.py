@@ -0,0 +1,124 @@
+"""
+Content fields and depth of the extraction requests, reduced to what is needed.
+
+`download --measures` requests only the fields the measures to be computed need, found
+from the `vars_needed` of each measure, and `download_mktdepth --measures` also only the
+levels they use. `--fields` and `--levels` set them explicitly instead. Without either,
+the full field list and depth of `request_templates` are requested.
+
+`Mid Point` and `Direction` are not downloaded but derived by `classify`, so they need
+the fields it classifies trades with. Trade and rolling measures are computed from the
+signed data, which `classify` writes only with these, so every one of them needs them.
+"""
+import importlib
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from .request_templates import INTRADAY_MARKET_DEPTH, INTRADAY_TICKS
+
+# Column of the parsed Time & Sales data -> content field it comes from.
+TICK_FIELDS = {
+    "Price": "Trade - Price",
+    "Volume": "Trade - Volume",
+    "Bid Price": "Quote - Bid Price",
+    "Bid Size": "Quote - Bid Size",
+    "Ask Price": "Quote - Ask Price",
+    "Ask Size": "Quote - Ask Size",
+}
+# Columns used by `classify`, which derives the others.
+CLASSIFY_VARS = {"Price", "Volume", "Bid Price", "Bid Size", "Ask Price", "Ask Size"}
+DERIVED_VARS = {"Mid Point": CLASSIFY_VARS, "Direction": CLASSIFY_VARS}
+# Market depth column, e.g. `L5-BidSize`, and its content field, e.g. `Bid Size`.
+DEPTH_VAR = re.compile(r"L(\d+)-(Bid|Ask)(Price|Size)")
+
+# `compute` flag -> module of `measures` and the deepest level it uses, if limited.
+MEASURES = {
+    "bid_ask_spread": ("bidask_spread", None),
+    "effective_spread": ("effective_spread", None),
+    "realized_spread": ("realized_spread", None),
+    "price_impact": ("price_impact", None),
+    "variance_ratio": ("variance_ratio", None),
+    "bid_slope": ("bid_slope", None),
+    "ask_slope": ("ask_slope", None),
+    "scaled_depth_diff_1": ("scaled_depth_difference", 1),
+    "scaled_depth_diff_5": ("scaled_depth_difference", 5),
+}
+# The rolling measures are computed from the minute bars.
+ROLLING_MEASURES = ("amihud", "roll_spread", "kyle_lambda", "corwin_schultz")
+# Measures computed from the signed data of `classify`, the others from the cleaned.
+SIGNED_MEASURES = {
+    "bid_ask_spread",
+    "effective_spread",
+    "realized_spread",
+    "price_impact",
+    "variance_ratio",
+    *ROLLING_MEASURES,
+}
+
+
+def vars_needed(measures: Iterable[str]) -> set:
+    """Columns of the parsed data the `compute` `measures` (flag names) need"""
+    needed = set()
+    for measure in measures:
+        if measure in SIGNED_MEASURES:
+            needed.update(CLASSIFY_VARS)
+        if measure in ROLLING_MEASURES:
+            from .bars import vars_needed as bar_vars
+
+            needed.update(bar_vars)
+            continue
+        module, max_level = MEASURES[measure]
+        module = importlib.import_module(f".measures.{module}", __package__)
+        for var in module.vars_needed:
+            match = DEPTH_VAR.fullmatch(var)
+            if match and max_level and int(match.group(1)) > max_level:
+                continue
+            needed.add(var)
+    for var in list(needed):
+        needed.update(DERIVED_VARS.get(var, ()))
+    return needed
+
+
+def tick_fields(measures=None, fields=None) -> Optional[List[str]]:
+    """
+    Content fields of a Time & Sales request: `fields` if given, else those needed by
+    `measures`, else None for the full list of the template
+    """
+    if fields:
+        return list(fields)
+    if not measures:
+        return None
+    needed = vars_needed(measures)
+    template = INTRADAY_TICKS["ExtractionRequest"]["ContentFieldNames"]
+    wanted = {TICK_FIELDS[var] for var in needed if var in TICK_FIELDS}
+    if not wanted:
+        raise ValueError(f"No Time & Sales fields needed by {', '.join(measures)}.")
+    # In the order of the template.
+    return [field for field in template if field in wanted]
+
+
+def depth_fields(measures=None, fields=None, levels=None) -> Tuple[List[str], int]:
+    """
+    Content fields and number of levels of a market depth request: `fields` and
+    `levels` if given, else those needed by `measures`, else those of the template
+    """
+    template = INTRADAY_MARKET_DEPTH["ExtractionRequest"]
+    all_fields = template["ContentFieldNames"]
+    all_levels = template["Condition"]["NumberOfLevels"]
+    wanted, deepest = None, None
+    if measures:
+        wanted, deepest = set(), 0
+        for var in vars_needed(measures):
+            match = DEPTH_VAR.fullmatch(var)
+            if match:
+                wanted.add(f"{match.group(2)} {match.group(3)}")
+                deepest = max(deepest, int(match.group(1)))
+        if not wanted and not fields:
+            raise ValueError(f"No market depth needed by {', '.join(measures)}.")
+    if fields:
+        selected = list(fields)
+    elif wanted is not None:
+        selected = [field for field in all_fields if field in wanted]
+    else:
+        selected = list(all_fields)
+    return selected, levels or deepest or all_levels
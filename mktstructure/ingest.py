@@ -0,0 +1,352 @@
+"""
+Merge newly downloaded ticks into the stored RIC-day files, e.g. a re-download after a
+vendor correction, instead of replacing or appending to them.
+
+The raw download is parsed into a staging directory, `<data_dir>/.ingest-*`, and each
+new RIC-day is merged into its stored `<date>.csv`, sorted by `Date-Time`, as parsed or
+as cleaned by `clean --replace`. New days are moved into place. The files derived from a
+merged day (the `<date>.sorted.csv` of `clean`, the signed trades, alignment and bars of
+`classify` and the day's rolling statistics) are removed, since the new rows have not
+been through `clean` and `classify`, which have to be run again for them. In a file
+cleaned in place with `--flag`, the new rows get the `Quality` of every check, the stored
+rows keep theirs.
+
+For an uncompressed file, the first and last stored rows the new ones overlap are found
+by binary search over its bytes. The rows before are copied as they are, the overlap is
+merged with the new rows on the fly and the rows after are copied again. New rows after
+the end of the file are appended. The cost of a merge is then in the new rows and the
+rows they overlap, the file is never loaded or sorted. Compressed files are streamed
+through the merge whole.
+
+Rows equal to another at the same timestamp are dropped as in `clean`, comparing numbers
+by value and timestamps by `sort_key()` since stored files may have been written by
+`clean`, e.g. `400.0` rather than `400` and `2022-01-03 14:00:00.5+00:00` rather than
+`2022-01-03T14:00:00.500000000Z`. New rows are written in the columns and timestamp
+format of the stored file.
+"""
+import csv
+import heapq
+import io
+import os
+import shutil
+import tempfile
+from typing import List, Tuple
+
+import numpy as np
+
+from .compression import SUFFIXES, codec_from_path, strip_suffix, to_csv
+from .rolling import ROLLING_DIR
+from .schema import DATETIME_FIELD, QUALITY_FIELD, read_ticks
+from .trth_parser import parse_to_data_dir
+
+# Below this many bytes the binary search scans lines.
+SCAN_BYTES = 64 * 1024
+COPY_BLOCK = 1024 * 1024
+
+
+def ingest(raw_path, data_dir) -> List[Tuple[str, int, int]]:
+    """
+    Parse the raw (uncompressed) download at `raw_path` and merge its RIC-days into
+    `data_dir`. Returns `(path, rows added, duplicates dropped)` of each file written.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".ingest-", dir=data_dir)
+    try:
+        parse_to_data_dir(raw_path, staging, "1")
+        results, stale = [], []
+        for ric in sorted(os.listdir(staging)):
+            for f in sorted(os.listdir(os.path.join(staging, ric))):
+                new = os.path.join(staging, ric, f)
+                target = stored_path(os.path.join(data_dir, ric, f))
+                if target is None:
+                    os.makedirs(os.path.join(data_dir, ric), exist_ok=True)
+                    target = os.path.join(data_dir, ric, f)
+                    rows = _count_rows(new)
+                    os.replace(new, target)
+                    results.append((target, rows, 0))
+                else:
+                    added, duplicates = merge_file(target, new)
+                    if added and _has_quality(target):
+                        fill_quality(target)
+                    results.append((target, added, duplicates))
+                    if not added:
+                        continue
+                # Out of date with the new rows.
+                for path in derived_paths(data_dir, target):
+                    os.remove(path)
+                    stale.append(path)
+        if stale:
+            print(
+                f"Removed {len(stale)} files derived from the merged days, "
+                "run clean and classify again."
+            )
+        return results
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def stored_path(path):
+    """The stored file at `path`, compressed or not, if any"""
+    for suffix in SUFFIXES.values():
+        if os.path.isfile(path + suffix):
+            return path + suffix
+    return None
+
+
+def derived_paths(data_dir, path) -> List[str]:
+    """
+    Files derived from the RIC-day file `<ric>/<date>.csv` by `clean`, `classify` and
+    `compute`, other than the file itself
+    """
+    root, f = os.path.split(path)
+    ric, day = os.path.basename(root), f.split(".")[0]
+    paths = [
+        os.path.join(root, g)
+        for g in os.listdir(root)
+        if g.startswith(f"{day}.") and strip_suffix(g) != f"{day}.csv"
+    ]
+    stats = os.path.join(data_dir, ROLLING_DIR, ric, f"{day}.json")
+    return sorted(paths) + ([stats] if os.path.isfile(stats) else [])
+
+
+def _has_quality(path):
+    with codec_from_path(path).open(path, "rb") as f:
+        return QUALITY_FIELD in _split(f.readline())
+
+
+def fill_quality(path):
+    """
+    Check the rows of a file cleaned with `--flag` that have no `Quality` yet, e.g.
+    merged, with every `quality` check. The other rows keep theirs.
+    """
+    from .quality import CHECKS, filter_ticks
+
+    df = read_ticks(path, flagged=True)
+    unchecked = df[QUALITY_FIELD].isna().to_numpy()
+    checked, _ = filter_ticks(df, CHECKS, flag=True)
+    codes = np.where(unchecked, checked[QUALITY_FIELD], df[QUALITY_FIELD])
+    df[QUALITY_FIELD] = codes.astype(np.int8)
+    to_csv(df, path, codec_from_path(path))
+
+
+def sort_key(timestamp: str) -> str:
+    """Comparable form of a UTC `Date-Time`, raw or as written by `clean`"""
+    day, time = timestamp[:10], timestamp[11:]
+    time = time.removesuffix("Z").removesuffix("+00:00")
+    hms, _, fraction = time.partition(".")
+    return f"{day} {hms}.{fraction:0<9}"
+
+
+def timestamp_format(stored: str):
+    """
+    Function writing a sort key as the stored `Date-Time`, raw or as written by `clean`,
+    with as many fractional digits unless more are needed
+    """
+    clean = stored[10:11] == " "
+    time = stored[11:].removesuffix("Z").removesuffix("+00:00")
+    _, dot, fraction = time.partition(".")
+    digits = len(fraction) if dot else 0
+
+    def timestamp(key: str) -> str:
+        hms, _, fraction = key.partition(".")
+        fraction = fraction[: max(digits, len(fraction.rstrip("0")))]
+        text = f"{hms}.{fraction}" if fraction else hms
+        return text + "+00:00" if clean else text.replace(" ", "T") + "Z"
+
+    return timestamp
+
+
+def _values(row, column) -> tuple:
+    """
+    The row with numbers as floats and the timestamp at `column` as its sort key, to
+    compare rows written differently
+    """
+    values = []
+    for i, value in enumerate(row):
+        if i == column:
+            values.append(sort_key(value))
+            continue
+        try:
+            values.append(float(value))
+        except ValueError:
+            values.append(value)
+    return tuple(values)
+
+
+def _split(line: bytes) -> list:
+    return next(csv.reader([line.decode()]))
+
+
+def merge_file(target, new) -> Tuple[int, int]:
+    """
+    Merge the sorted RIC-day file `new` into the stored file `target`. Returns the rows
+    added and the duplicates dropped.
+    """
+    with open(new, "rb") as f:
+        new_header = _split(f.readline())
+        new_rows = [row for row in csv.reader(io.TextIOWrapper(f, newline="")) if row]
+    codec = codec_from_path(target)
+    with codec.open(target, "rb") as f:
+        header_line = f.readline()
+        first = f.readline()
+    header = _split(header_line)
+    column = header.index(DATETIME_FIELD)
+    # New rows in the columns and timestamp format of the stored file.
+    timestamp = (
+        timestamp_format(_split(first)[column]) if first.strip() else _raw_timestamp
+    )
+    at = {field: i for i, field in enumerate(new_header)}
+    missing = [field for field in new_header if field not in header]
+    if missing:
+        print(f"Dropping fields not in {target}: {', '.join(missing)}.")
+    rows = []
+    for row in new_rows:
+        key = sort_key(row[at[DATETIME_FIELD]])
+        out = [row[at[field]] if field in at else "" for field in header]
+        out[column] = timestamp(key)
+        rows.append((key, out))
+    if not rows:
+        return 0, 0
+    rows.sort(key=lambda r: r[0])
+    new_lines = [(key, _values(row, column), _join(row), True) for key, row in rows]
+    if codec.name != "none":
+        return _merge_stream(target, codec, header_line, column, new_lines)
+    return _merge_in_place(target, column, new_lines)
+
+
+def _raw_timestamp(key: str) -> str:
+    return key.replace(" ", "T") + "Z"
+
+
+def _join(row) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(row)
+    return buf.getvalue().encode()
+
+
+def _stored_lines(lines, column):
+    for line in lines:
+        if line.strip():
+            row = _split(line)
+            yield sort_key(row[column]), _values(row, column), line, False
+
+
+def _dedup(lines, stats):
+    """Drop lines equal to an earlier one at the same timestamp, counting new ones"""
+    last, seen = None, set()
+    for key, values, line, new in lines:
+        if key != last:
+            last, seen = key, set()
+        if values in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(values)
+        stats["added"] += new
+        yield line if line.endswith(b"\n") else line + b"\n"
+
+
+def _merge(stored, new, stats):
+    """Lines of the `stored` and `new` lines, sorted and without duplicates"""
+    # Stored lines first at equal timestamps, so that they keep their order.
+    merged = heapq.merge(stored, new, key=lambda line: line[0])
+    return _dedup(merged, stats)
+
+
+def _added(stats):
+    """New rows written and duplicates dropped"""
+    return stats["added"], stats["duplicates"]
+
+
+def _merge_in_place(target, column, new_lines):
+    size = os.path.getsize(target)
+    stats = {"added": 0, "duplicates": 0}
+    with open(target, "rb") as f:
+        header_end = len(f.readline())
+        start = _bisect(f, column, new_lines[0][0], header_end, size, strict=False)
+        if start == size:
+            # After the last stored row, appended.
+            newline = _ends_with_newline(f, size)
+            with open(target, "ab") as out:
+                if not newline:
+                    out.write(b"\n")
+                for line in _dedup(new_lines, stats):
+                    out.write(line)
+            return _added(stats)
+        end = _bisect(f, column, new_lines[-1][0], start, size, strict=True)
+        tmp = target + ".merge.tmp"
+        with open(tmp, "wb") as out:
+            f.seek(0)
+            _copy(f, out, start)
+            f.seek(start)
+            overlap = f.read(end - start).splitlines(keepends=True)
+            stored = _stored_lines(overlap, column)
+            for line in _merge(stored, new_lines, stats):
+                out.write(line)
+            _copy(f, out, size - end)
+    os.replace(tmp, target)
+    return _added(stats)
+
+
+def _merge_stream(target, codec, header_line, column, new_lines):
+    stats = {"added": 0, "duplicates": 0}
+    tmp = target + ".merge.tmp"
+    with codec.open(target, "rb") as f, codec.open(tmp, "wb") as out:
+        f.readline()
+        out.write(header_line)
+        stored = _stored_lines(f, column)
+        for line in _merge(stored, new_lines, stats):
+            out.write(line)
+    os.replace(tmp, target)
+    return _added(stats)
+
+
+def _bisect(f, column, key, lo, hi, strict):
+    """
+    Offset of the first line in `[lo, hi)` with a timestamp after `key` if `strict`,
+    else not before it. `lo` and `hi` are line starts or the end of the file.
+    """
+
+    def before(line):
+        k = sort_key(_split(line)[column])
+        return k <= key if strict else k < key
+
+    while hi - lo > SCAN_BYTES:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()
+        pos = f.tell()
+        if pos >= hi:
+            break
+        line = f.readline()
+        if before(line):
+            lo = pos + len(line)
+        else:
+            hi = pos
+    f.seek(lo)
+    while lo < hi:
+        line = f.readline()
+        if not line.strip() or not before(line):
+            break
+        lo += len(line)
+    return lo
+
+
+def _ends_with_newline(f, size):
+    f.seek(size - 1)
+    return f.read(1) == b"\n"
+
+
+def _copy(fin, fout, n):
+    while n > 0:
+        block = fin.read(min(COPY_BLOCK, n))
+        if not block:
+            break
+        fout.write(block)
+        n -= len(block)
+
+
+def _count_rows(path):
+    with open(path, "rb") as f:
+        blocks = iter(lambda: f.read(COPY_BLOCK), b"")
+        # Lines less the header.
+        return max(sum(block.count(b"\n") for block in blocks) - 1, 0)
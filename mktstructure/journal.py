@@ -0,0 +1,53 @@
+"""
+Journal of an extraction job and the download of its result, kept next to the output
+file (`<path>.journal.json`) so that a restarted `download --resume` picks up the job
+instead of submitting it again.
+
+It records the request payload, the location polled while the job runs, the JobId, the
+size of the result and the bytes received so far, and whether the file is complete. The
+received bytes are in `<path>.part` until the download is complete and verified.
+"""
+import json
+import os
+
+SUFFIX = ".journal.json"
+PART_SUFFIX = ".part"
+
+
+def part_path(path):
+    return path + PART_SUFFIX
+
+
+class JobJournal:
+    def __init__(self, path):
+        self.path = path
+        self.entry = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.entry = json.load(f)
+
+    @classmethod
+    def for_output(cls, path) -> "JobJournal":
+        return cls(path + SUFFIX)
+
+    def __getitem__(self, key):
+        return self.entry.get(key)
+
+    def matches(self, payload) -> bool:
+        """Whether the journal is of a job with this request payload"""
+        return self.entry.get("payload") == json.loads(json.dumps(payload))
+
+    def reset(self, payload):
+        """Start over with a new job for `payload`"""
+        self.entry = {"payload": payload}
+        self.save()
+
+    def update(self, **fields):
+        self.entry.update(fields)
+        self.save()
+
+    def save(self):
+        # Write to a temporary file first so that a crash never leaves a partial one.
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.entry, f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
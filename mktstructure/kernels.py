@@ -0,0 +1,85 @@
+"""
+Numba kernels, ahead-of-time compiled where available.
+
+Kernels are plain Python functions registered with `@kernel(signature)`. On first call they
+are looked up in the AOT-compiled `mktstructure._kernels` extension (built by setup.py or
+`python -m mktstructure.kernels`), otherwise compiled with `numba.jit`. Either way numba
+is only imported by commands that actually run a kernel, and not at all with the extension.
+"""
+import importlib
+import os
+
+# Export name -> Kernel, in the extension the name is `<module>_<function>`.
+KERNELS = {}
+# Modules defining kernels, imported to register them before an AOT build.
+KERNEL_MODULES = [
+    "mktstructure.bars",
+    "mktstructure.classification",
+    "mktstructure.measures.variance_ratio",
+    "mktstructure.quality",
+]
+AOT_MODULE = "_kernels"
+
+
+class Kernel:
+    def __init__(self, func, signature):
+        self.py_func = func
+        self.signature = signature
+        self.name = f"{func.__module__.rsplit('.', 1)[-1]}_{func.__name__.lstrip('_')}"
+        self._impl = None
+
+    def __call__(self, *args):
+        if self._impl is None:
+            self._impl = _aot(self.name) or _jit(self.py_func)
+        return self._impl(*args)
+
+
+def kernel(signature):
+    """Register a kernel with its numba `signature`, used for the AOT build"""
+
+    def decorator(func):
+        k = Kernel(func, signature)
+        KERNELS[k.name] = k
+        return k
+
+    return decorator
+
+
+def _aot(name):
+    if os.environ.get("MKTSTRUCTURE_NO_AOT"):
+        return None
+    try:
+        module = importlib.import_module(f"mktstructure.{AOT_MODULE}")
+    except ImportError:
+        return None
+    return getattr(module, name, None)
+
+
+def _jit(func):
+    from numba import jit
+
+    return jit(nopython=True, nogil=True, cache=True)(func)
+
+
+def _compiler():
+    from numba.pycc import CC
+
+    for module in KERNEL_MODULES:
+        importlib.import_module(module)
+    cc = CC(AOT_MODULE)
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    for name, k in KERNELS.items():
+        cc.export(name, k.signature)(k.py_func)
+    return cc
+
+
+def aot_extension():
+    """setuptools Extension of the AOT-compiled kernels"""
+    ext = _compiler().distutils_extension()
+    ext.name = f"mktstructure.{AOT_MODULE}"
+    return ext
+
+
+if __name__ == "__main__":
+    # Build the extension in place. Kernels register in `mktstructure.kernels`, not here.
+    importlib.import_module("mktstructure.kernels")._compiler().compile()
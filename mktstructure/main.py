@@ -39,7 +39,7 @@ def init_argparse() -> argparse.ArgumentParser:
     )
     parser_classify = subparsers.add_parser(
         "classify",
-        description="Classify ticks into buy and sell orders using Lee and Ready (1991) algorithm",
+        description="Classify ticks into buy and sell orders using Lee and Ready (1991) or other algorithms",
         help="Classify ticks into buy and sell orders",
     )
     parser_compute = subparsers.add_parser(
@@ -47,6 +47,29 @@ def init_argparse() -> argparse.ArgumentParser:
         description="Compute specified measures",
         help="Compute market microstructure measures",
     )
+    parser_watch = subparsers.add_parser(
+        "watch",
+        description="Watch the data directory and clean, classify and compute measures "
+        "for each new or changed file as it lands",
+        help="Process new data files as they land",
+    )
+    parser_replay = subparsers.add_parser(
+        "replay",
+        description="Replay the sorted data of many RICs in timestamp order through "
+        "streaming classification and online measures",
+        help="Replay stored ticks at a multiple of real time",
+    )
+    parser_merge = subparsers.add_parser(
+        "merge",
+        description="Merge results of `compute` run in several shards",
+        help="Merge results of sharded runs",
+    )
+    parser_serve = subparsers.add_parser(
+        "serve",
+        description="Serve results of `compute` over HTTP as JSON, indexed by RIC, "
+        "date and measure",
+        help="Serve results to local clients",
+    )
 
     # subparser for `download` subcommand
     parser_download.add_argument(
@@ -59,6 +82,19 @@ def init_argparse() -> argparse.ArgumentParser:
         metavar="password",
         help="DataScope password",
     )
+    parser_download.add_argument(
+        "--base_url",
+        metavar="url",
+        default="https://selectapi.datascope.refinitiv.com/RestApi/v1",
+        help="root URL of the DataScope REST API, e.g. of a local mock_datascope server",
+    )
+    parser_download.add_argument(
+        "--poll_interval",
+        metavar="seconds",
+        type=float,
+        default=10,
+        help="seconds between polls of a pending extraction (default: 10)",
+    )
     parser_download.add_argument(
         "-b",
         metavar="begin",
@@ -90,6 +126,94 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, process all S&P500 components (extending RIC list, if any)",
     )
+    parser_download.add_argument(
+        "--nasdaq100",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, process all NASDAQ-100 components (extending RIC list, if any)",
+    )
+    parser_download.add_argument(
+        "--nyse",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, process all NYSE Composite components (extending RIC list, if any)",
+    )
+    parser_download.add_argument(
+        "--max_rows_per_job",
+        metavar="rows",
+        type=int,
+        default=50_000_000,
+        help="max estimated rows of an extraction job (default: 50000000)",
+    )
+    parser_download.add_argument(
+        "--max_rics_per_job",
+        metavar="n",
+        type=int,
+        default=1000,
+        help="max RICs of an extraction job (default: 1000)",
+    )
+    parser_download.add_argument(
+        "--rows_per_day",
+        metavar="rows",
+        type=int,
+        default=200_000,
+        help="estimated rows of a RIC-day without history in the catalog "
+        "(default: 200000)",
+    )
+    parser_download.add_argument(
+        "--max_quota",
+        metavar="n",
+        type=int,
+        default=None,
+        help="stop submitting jobs once they used this much quota",
+    )
+    parser_download.add_argument(
+        "--measures",
+        nargs="+",
+        metavar="measure",
+        choices=[
+            "bid_ask_spread",
+            "effective_spread",
+            "realized_spread",
+            "price_impact",
+            "variance_ratio",
+            "bid_slope",
+            "ask_slope",
+            "scaled_depth_diff_1",
+            "scaled_depth_diff_5",
+            "amihud",
+            "roll_spread",
+            "kyle_lambda",
+            "corwin_schultz",
+        ],
+        default=None,
+        help="request only the fields needed by these `compute` measures, "
+        "e.g. bid_ask_spread amihud",
+    )
+    parser_download.add_argument(
+        "--fields",
+        nargs="+",
+        metavar="field",
+        default=None,
+        help="content fields to request, e.g. 'Trade - Price' 'Trade - Volume' "
+        "(default: all fields, or those needed by --measures)",
+    )
+    parser_download.add_argument(
+        "--resume",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, resume the extraction jobs and downloads of a previous run from "
+        "their journals instead of submitting them again",
+    )
+    parser_download.add_argument(
+        "--chain_cache",
+        metavar="dir",
+        default=None,
+        help="cache of point-in-time index constituents (default: <data_dir>/.chains)",
+    )
     parser_download.add_argument(
         "--parse",
         default=False,
@@ -97,6 +221,14 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, parse the downloaded raw data to output data directory",
     )
+    parser_download.add_argument(
+        "--merge",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set with --parse, merge the data into the stored RIC-day files in "
+        "time order, dropping duplicates, instead of replacing them",
+    )
     parser_download.add_argument(
         "--data_dir",
         metavar="dir",
@@ -110,6 +242,38 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, compress parsed data (effective only when --parse is set)",
     )
+    parser_download.add_argument(
+        "--codec",
+        metavar="codec",
+        default="gzip",
+        help="codec used to compress parsed data: gzip, gzip:<level>, zstd, zstd:<level>, lz4 or none (default: gzip)",
+    )
+    parser_download.add_argument(
+        "--codec_threads",
+        metavar="threads",
+        type=int,
+        help="number of threads used to compress each file",
+        default=os.cpu_count(),
+    )
+    parser_download.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_download.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_download.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
 
     # parser for `clean` subcommand
     parser_clean.add_argument(
@@ -150,6 +314,44 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, replace raw data with cleaned data",
     )
+    parser_clean.add_argument(
+        "--filters",
+        nargs="*",
+        choices=["session", "zero_size", "crossed", "locked", "outlier"],
+        default=[],
+        help="quality checks of the cleaned ticks: ticks out of the trading sessions, "
+        "zero prices or sizes, crossed or locked quotes and trades away from the "
+        "prevailing quote (default: none)",
+    )
+    parser_clean.add_argument(
+        "--flag",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, keep rows failing --filters with the check in a Quality column "
+        "instead of removing them",
+    )
+    parser_clean.add_argument(
+        "--max_price_deviation",
+        metavar="fraction",
+        type=float,
+        help="trades further than this from the prevailing midpoint are outliers "
+        "(default: 0.1)",
+        default=0.1,
+    )
+    parser_clean.add_argument(
+        "--codec",
+        metavar="codec",
+        default=None,
+        help="codec of cleaned data: gzip, gzip:<level>, zstd, zstd:<level>, lz4 or none (default: same as input)",
+    )
+    parser_clean.add_argument(
+        "--codec_threads",
+        metavar="threads",
+        type=int,
+        help="number of threads used to compress each file",
+        default=1,
+    )
     parser_clean.add_argument(
         "-t",
         "--threads",
@@ -158,6 +360,39 @@ def init_argparse() -> argparse.ArgumentParser:
         help="number of workers to use",
         default=os.cpu_count(),
     )
+    parser_clean.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="only process the i-th of N hash partitions of the RIC-days (0 <= i < N)",
+        default=None,
+    )
+    parser_clean.add_argument(
+        "--shard_dynamic",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, claim files with lock files in the data directory so that "
+        "several processes or hosts can share the work",
+    )
+    parser_clean.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_clean.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_clean.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
 
     # subparser for `download_mktdepth` subcommand
     parser_download_mktdepth.add_argument(
@@ -170,6 +405,19 @@ def init_argparse() -> argparse.ArgumentParser:
         metavar="password",
         help="DataScope password",
     )
+    parser_download_mktdepth.add_argument(
+        "--base_url",
+        metavar="url",
+        default="https://selectapi.datascope.refinitiv.com/RestApi/v1",
+        help="root URL of the DataScope REST API, e.g. of a local mock_datascope server",
+    )
+    parser_download_mktdepth.add_argument(
+        "--poll_interval",
+        metavar="seconds",
+        type=float,
+        default=10,
+        help="seconds between polls of a pending extraction (default: 10)",
+    )
     parser_download_mktdepth.add_argument(
         "-b",
         metavar="begin",
@@ -201,6 +449,102 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, process all S&P500 components (extending RIC list, if any)",
     )
+    parser_download_mktdepth.add_argument(
+        "--nasdaq100",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, process all NASDAQ-100 components (extending RIC list, if any)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--nyse",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, process all NYSE Composite components (extending RIC list, if any)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--max_rows_per_job",
+        metavar="rows",
+        type=int,
+        default=50_000_000,
+        help="max estimated rows of an extraction job (default: 50000000)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--max_rics_per_job",
+        metavar="n",
+        type=int,
+        default=1000,
+        help="max RICs of an extraction job (default: 1000)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--rows_per_day",
+        metavar="rows",
+        type=int,
+        default=200_000,
+        help="estimated rows of a RIC-day without history in the catalog "
+        "(default: 200000)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--max_quota",
+        metavar="n",
+        type=int,
+        default=None,
+        help="stop submitting jobs once they used this much quota",
+    )
+    parser_download_mktdepth.add_argument(
+        "--measures",
+        nargs="+",
+        metavar="measure",
+        choices=[
+            "bid_ask_spread",
+            "effective_spread",
+            "realized_spread",
+            "price_impact",
+            "variance_ratio",
+            "bid_slope",
+            "ask_slope",
+            "scaled_depth_diff_1",
+            "scaled_depth_diff_5",
+            "amihud",
+            "roll_spread",
+            "kyle_lambda",
+            "corwin_schultz",
+        ],
+        default=None,
+        help="request only the fields and levels needed by these `compute` measures, "
+        "e.g. bid_slope scaled_depth_diff_1",
+    )
+    parser_download_mktdepth.add_argument(
+        "--fields",
+        nargs="+",
+        metavar="field",
+        default=None,
+        help="content fields to request, e.g. 'Bid Price' 'Bid Size' "
+        "(default: all fields, or those needed by --measures)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--levels",
+        metavar="n",
+        type=int,
+        default=None,
+        help="number of depth levels to request (default: 5, or those needed by "
+        "--measures)",
+    )
+    parser_download_mktdepth.add_argument(
+        "--resume",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, resume the extraction jobs and downloads of a previous run from "
+        "their journals instead of submitting them again",
+    )
+    parser_download_mktdepth.add_argument(
+        "--chain_cache",
+        metavar="dir",
+        default=None,
+        help="cache of point-in-time index constituents (default: <data_dir>/.chains)",
+    )
     parser_download_mktdepth.add_argument(
         "--parse",
         default=False,
@@ -221,6 +565,25 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, compress parsed data (effective only when --parse is set)",
     )
+    parser_download_mktdepth.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_download_mktdepth.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_download_mktdepth.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
 
     # parser for `classify` subcommand
     parser_classify.add_argument(
@@ -254,6 +617,48 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, classify all data in the data director",
     )
+    parser_classify.add_argument(
+        "--algorithm",
+        nargs="+",
+        choices=["lr", "emo", "clnv", "bvc"],
+        default=["lr"],
+        help="classification algorithms to use in one pass: Lee and Ready (lr), "
+        "Ellis, Michaely and O'Hara (emo), Chakrabarty, Li, Nguyen and Van Ness (clnv), "
+        "bulk volume classification (bvc). The first one is saved as `Direction`",
+    )
+    parser_classify.add_argument(
+        "--bvc_bar_volume",
+        metavar="volume",
+        type=float,
+        help="volume per bar used by BVC (default: daily volume / 50)",
+        default=None,
+    )
+    parser_classify.add_argument(
+        "--quote_lag",
+        metavar="lag",
+        default="0",
+        help="match trades to the quote prevailing this long before, e.g. 0, 1s, 5s (default: 0)",
+    )
+    parser_classify.add_argument(
+        "--align_lags",
+        metavar="lag",
+        nargs="*",
+        default=[],
+        help="extra quote lags to store in the trade/quote alignment index",
+    )
+    parser_classify.add_argument(
+        "--codec",
+        metavar="codec",
+        default=None,
+        help="codec of classified data: gzip, gzip:<level>, zstd, zstd:<level>, lz4 or none (default: same as input)",
+    )
+    parser_classify.add_argument(
+        "--codec_threads",
+        metavar="threads",
+        type=int,
+        help="number of threads used to compress each file",
+        default=1,
+    )
     parser_classify.add_argument(
         "-t",
         "--threads",
@@ -262,6 +667,53 @@ def init_argparse() -> argparse.ArgumentParser:
         help="number of workers to use",
         default=os.cpu_count(),
     )
+    parser_classify.add_argument(
+        "--prefetch",
+        metavar="depth",
+        type=int,
+        help="number of files to read ahead while computing (0 to disable)",
+        default=2,
+    )
+    parser_classify.add_argument(
+        "--prefetch_memory",
+        metavar="MB",
+        type=int,
+        help="max memory (MB) of decoded files waiting in the read-ahead queue",
+        default=1024,
+    )
+    parser_classify.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="only process the i-th of N hash partitions of the RIC-days (0 <= i < N)",
+        default=None,
+    )
+    parser_classify.add_argument(
+        "--shard_dynamic",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, claim files with lock files in the data directory so that "
+        "several processes or hosts can share the work",
+    )
+    parser_classify.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_classify.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_classify.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
 
     # parser for `compute` subcommand
     parser_compute.add_argument(
@@ -298,7 +750,7 @@ def init_argparse() -> argparse.ArgumentParser:
     parser_compute.add_argument(
         "--out",
         metavar="out",
-        help="file to save output results",
+        help="file to save output results, `{shard}` is replaced by the shard",
         required=True,
     )
     parser_compute.add_argument(
@@ -364,6 +816,503 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_const",
         help="if set, compute the scaled depth difference at the 5th level",
     )
+    parser_compute.add_argument(
+        "--amihud",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the Amihud illiquidity over a rolling window of days",
+    )
+    parser_compute.add_argument(
+        "--roll_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the Roll spread over a rolling window of days",
+    )
+    parser_compute.add_argument(
+        "--kyle_lambda",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute Kyle's lambda over a rolling window of days",
+    )
+    parser_compute.add_argument(
+        "--corwin_schultz",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the Corwin-Schultz spread over a rolling window of days",
+    )
+    parser_compute.add_argument(
+        "--window",
+        metavar="days",
+        type=int,
+        help="number of trading days of the rolling measures (default: 20)",
+        default=20,
+    )
+    parser_compute.add_argument(
+        "--interval",
+        metavar="interval",
+        help="compute measures per time bucket of this length, e.g. 5min or 30s, "
+        "instead of per day",
+        default=None,
+    )
+    parser_compute.add_argument(
+        "--prefetch",
+        metavar="depth",
+        type=int,
+        help="number of files to read ahead while computing (0 to disable)",
+        default=2,
+    )
+    parser_compute.add_argument(
+        "--prefetch_memory",
+        metavar="MB",
+        type=int,
+        help="max memory (MB) of decoded files waiting in the read-ahead queue",
+        default=1024,
+    )
+    parser_compute.add_argument(
+        "--price_dtype",
+        choices=["float32", "float64"],
+        help="in-memory type of prices (default: float64), float32 halves the memory "
+        "but rounds prices above ~100,000",
+        default="float64",
+    )
+    parser_compute.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="only process the i-th of N hash partitions of the RIC-days (0 <= i < N)",
+        default=None,
+    )
+    parser_compute.add_argument(
+        "--shard_dynamic",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, claim files with lock files in the data directory so that "
+        "several processes or hosts can share the work",
+    )
+    parser_compute.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_compute.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_compute.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
+
+    # parser for `watch` subcommand
+    parser_watch.add_argument(
+        "--data_dir",
+        metavar="dir",
+        help="data directory",
+        required=True,
+    )
+    parser_watch.add_argument(
+        "--out",
+        metavar="out",
+        help="file to append results to as each file is processed",
+        required=True,
+    )
+    parser_watch.add_argument(
+        "--bid_ask_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the bid-ask spread",
+    )
+    parser_watch.add_argument(
+        "--effective_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the effective spread",
+    )
+    parser_watch.add_argument(
+        "--realized_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the realized spread",
+    )
+    parser_watch.add_argument(
+        "--price_impact",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the price impact",
+    )
+    parser_watch.add_argument(
+        "--variance_ratio",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the variance ratio and test statistics",
+    )
+    parser_watch.add_argument(
+        "--bid_slope",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the bid slope",
+    )
+    parser_watch.add_argument(
+        "--ask_slope",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the ask slope",
+    )
+    parser_watch.add_argument(
+        "--scaled_depth_diff_1",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the scaled depth difference at the 1st level",
+    )
+    parser_watch.add_argument(
+        "--scaled_depth_diff_5",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the scaled depth difference at the 5th level",
+    )
+    parser_watch.add_argument(
+        "--interval",
+        metavar="interval",
+        help="compute measures per time bucket of this length, e.g. 5min or 30s, "
+        "instead of per day",
+        default=None,
+    )
+    parser_watch.add_argument(
+        "--algorithm",
+        nargs="+",
+        choices=["lr", "emo", "clnv", "bvc"],
+        default=["lr"],
+        help="classification algorithms to use in one pass: Lee and Ready (lr), "
+        "Ellis, Michaely and O'Hara (emo), Chakrabarty, Li, Nguyen and Van Ness (clnv), "
+        "bulk volume classification (bvc). The first one is saved as `Direction`",
+    )
+    parser_watch.add_argument(
+        "--bvc_bar_volume",
+        metavar="volume",
+        type=float,
+        help="volume per bar used by BVC (default: daily volume / 50)",
+        default=None,
+    )
+    parser_watch.add_argument(
+        "--quote_lag",
+        metavar="lag",
+        default="0",
+        help="match trades to the quote prevailing this long before, e.g. 0, 1s, 5s (default: 0)",
+    )
+    parser_watch.add_argument(
+        "--align_lags",
+        metavar="lag",
+        nargs="*",
+        default=[],
+        help="extra quote lags to store in the trade/quote alignment index",
+    )
+    parser_watch.add_argument(
+        "--filters",
+        nargs="*",
+        choices=["session", "zero_size", "crossed", "locked", "outlier"],
+        default=[],
+        help="quality checks of the cleaned ticks: ticks out of the trading sessions, "
+        "zero prices or sizes, crossed or locked quotes and trades away from the "
+        "prevailing quote (default: none)",
+    )
+    parser_watch.add_argument(
+        "--flag",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, keep rows failing --filters with the check in a Quality column "
+        "instead of removing them",
+    )
+    parser_watch.add_argument(
+        "--max_price_deviation",
+        metavar="fraction",
+        type=float,
+        help="trades further than this from the prevailing midpoint are outliers "
+        "(default: 0.1)",
+        default=0.1,
+    )
+    parser_watch.add_argument(
+        "--codec",
+        metavar="codec",
+        default=None,
+        help="codec of cleaned and classified data: gzip, gzip:<level>, zstd, zstd:<level>, lz4 or none (default: same as input)",
+    )
+    parser_watch.add_argument(
+        "--codec_threads",
+        metavar="threads",
+        type=int,
+        help="number of threads used to compress each file",
+        default=1,
+    )
+    parser_watch.add_argument(
+        "--price_dtype",
+        choices=["float32", "float64"],
+        help="in-memory type of prices (default: float64), float32 halves the memory "
+        "but rounds prices above ~100,000",
+        default="float64",
+    )
+    parser_watch.add_argument(
+        "-t",
+        "--threads",
+        metavar="threads",
+        type=int,
+        help="number of workers to use",
+        default=os.cpu_count(),
+    )
+    parser_watch.add_argument(
+        "--poll_interval",
+        metavar="seconds",
+        type=float,
+        help="seconds between scans of the data directory (default: 2)",
+        default=2,
+    )
+    parser_watch.add_argument(
+        "--settle",
+        metavar="seconds",
+        type=float,
+        help="seconds a file must be unchanged before it's processed (default: 5)",
+        default=5,
+    )
+    parser_watch.add_argument(
+        "--once",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, exit once all current files are processed",
+    )
+    parser_watch.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_watch.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_watch.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
+
+    # parser for `replay` subcommand
+    parser_replay.add_argument(
+        "--ric",
+        nargs="*",
+        default=[],
+        help="RIC of securities to replay",
+    )
+    parser_replay.add_argument(
+        "-b",
+        metavar="begin",
+        default="2021-02-15",
+        help="begin UTC date (YYYY-MM-DD)",
+    )
+    parser_replay.add_argument(
+        "-e",
+        metavar="end",
+        default="2021-02-28",
+        help="end UTC date (YYYY-MM-DD)",
+    )
+    parser_replay.add_argument(
+        "--data_dir",
+        metavar="dir",
+        help="data directory",
+        required=True,
+    )
+    parser_replay.add_argument(
+        "--all",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, replay all data in the data directory",
+    )
+    parser_replay.add_argument(
+        "--out",
+        metavar="out",
+        help="file to save the measures at the end of each day",
+        default=None,
+    )
+    parser_replay.add_argument(
+        "--bid_ask_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the bid-ask spread",
+    )
+    parser_replay.add_argument(
+        "--effective_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the effective spread",
+    )
+    parser_replay.add_argument(
+        "--realized_spread",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the realized spread",
+    )
+    parser_replay.add_argument(
+        "--price_impact",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the price impact",
+    )
+    parser_replay.add_argument(
+        "--bid_slope",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the bid slope",
+    )
+    parser_replay.add_argument(
+        "--ask_slope",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the ask slope",
+    )
+    parser_replay.add_argument(
+        "--scaled_depth_diff_1",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the scaled depth difference at the 1st level",
+    )
+    parser_replay.add_argument(
+        "--scaled_depth_diff_5",
+        default=False,
+        const=True,
+        action="store_const",
+        help="if set, compute the scaled depth difference at the 5th level",
+    )
+    parser_replay.add_argument(
+        "--speed",
+        metavar="factor",
+        type=float,
+        help="replay at this multiple of real time, e.g. 10 or 100 (default: 0, as fast "
+        "as possible)",
+        default=0,
+    )
+    parser_replay.add_argument(
+        "--chunk_size",
+        metavar="rows",
+        type=int,
+        help="rows read from each file at a time (default: 100000)",
+        default=100_000,
+    )
+    parser_replay.add_argument(
+        "--batch_size",
+        metavar="ticks",
+        type=int,
+        help="ticks of the merged stream per batch (default: 1000)",
+        default=1000,
+    )
+    parser_replay.add_argument(
+        "--price_dtype",
+        choices=["float32", "float64"],
+        help="in-memory type of prices (default: float64), float32 halves the memory "
+        "but rounds prices above ~100,000",
+        default="float64",
+    )
+    parser_replay.add_argument(
+        "--metrics_out",
+        metavar="file",
+        help="append per-file, per-stage metrics (JSON lines) to this file",
+        default=None,
+    )
+    parser_replay.add_argument(
+        "--profile",
+        metavar="dir",
+        help="save cProfile dumps of each file's stage to this directory",
+        default=None,
+    )
+    parser_replay.add_argument(
+        "--profile_min_seconds",
+        metavar="seconds",
+        type=float,
+        help="only save profiles of files taking at least this long (default: 0)",
+        default=0,
+    )
+
+    # parser for `merge` subcommand
+    parser_merge.add_argument(
+        "files",
+        nargs="+",
+        help="result files of each shard",
+    )
+    parser_merge.add_argument(
+        "--out",
+        metavar="out",
+        help="file to save merged results",
+        required=True,
+    )
+
+    # parser for `serve` subcommand
+    parser_serve.add_argument(
+        "files",
+        nargs="+",
+        help="result files to serve",
+    )
+    parser_serve.add_argument(
+        "--host",
+        metavar="host",
+        help="address to listen on (default: 127.0.0.1)",
+        default="127.0.0.1",
+    )
+    parser_serve.add_argument(
+        "--port",
+        metavar="port",
+        type=int,
+        help="port to listen on (default: 8000)",
+        default=8000,
+    )
+    parser_serve.add_argument(
+        "--index_dir",
+        metavar="index_dir",
+        help="directory of the index of the results (default: <first file>.index)",
+    )
+    parser_serve.add_argument(
+        "--cache_mb",
+        metavar="MB",
+        type=int,
+        help="size of the cache of recent query results (default: 256)",
+        default=256,
+    )
+    parser_serve.add_argument(
+        "--refresh",
+        metavar="seconds",
+        type=float,
+        help="seconds between checks for changed result files (default: 60)",
+        default=60,
+    )
 
     return parser
 
@@ -397,6 +1346,26 @@ def main():
 
         cmd_compute(args)
 
+    if args.command == "watch":
+        from .cmd_watch import cmd_watch
+
+        cmd_watch(args)
+
+    if args.command == "replay":
+        from .cmd_replay import cmd_replay
+
+        cmd_replay(args)
+
+    if args.command == "merge":
+        from .cmd_merge import cmd_merge
+
+        cmd_merge(args)
+
+    if args.command == "serve":
+        from .cmd_serve import cmd_serve
+
+        cmd_serve(args)
+
 
 if __name__ == "__main__":
     main()
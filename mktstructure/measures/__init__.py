@@ -1,13 +1,27 @@
-from . import (
-    bidask_spread,
-    effective_spread,
-    realized_spread,
-    price_impact,
-    variance_ratio,
-    bid_slope,
-    ask_slope,
-    scaled_depth_difference,
-)
+import importlib
+
+# Measures are imported on first use, so that e.g. computing a spread doesn't import
+# the kernels of the variance ratio.
+_MEASURES = {
+    "bidask_spread",
+    "effective_spread",
+    "realized_spread",
+    "price_impact",
+    "variance_ratio",
+    "bid_slope",
+    "ask_slope",
+    "scaled_depth_difference",
+}
+
+
+def __getattr__(name):
+    if name in _MEASURES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | _MEASURES)
 
 
 class sdd1:
@@ -15,12 +29,28 @@ class sdd1:
 
     @staticmethod
     def estimate(df):
+        from . import scaled_depth_difference
+
         return scaled_depth_difference.estimate(df, 1)
 
+    @staticmethod
+    def estimate_buckets(df, buckets):
+        from . import scaled_depth_difference
+
+        return scaled_depth_difference.estimate_buckets(df, buckets, 1)
+
 
 class sdd5:
     name = "ScaledDepthDifferenceLvl5"
 
     @staticmethod
     def estimate(df):
+        from . import scaled_depth_difference
+
         return scaled_depth_difference.estimate(df, 5)
+
+    @staticmethod
+    def estimate_buckets(df, buckets):
+        from . import scaled_depth_difference
+
+        return scaled_depth_difference.estimate_buckets(df, buckets, 5)
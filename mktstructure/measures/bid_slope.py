@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
 
 name = "BidSlope"
 description = "Bid Slope to examine the liquidity available to investors wishing to execute a sell market order"
@@ -17,12 +18,10 @@ vars_needed = {
 }
 
 
-def estimate(data: pd.DataFrame) -> np.ndarray:
-    if not vars_needed.issubset(data.columns):
-        raise MissingVariableError(name, vars_needed.difference(data.columns))
-
-    data = data.dropna(subset=vars_needed)
-
+def _slopes(data):
+    """Rows without missing values and their slope"""
+    rows = data[list(vars_needed)].notna().all(axis=1).to_numpy()
+    data = data[rows]
     slope = -np.divide(
         data["L1-BidSize"].to_numpy()
         + data["L2-BidSize"].to_numpy()
@@ -31,4 +30,22 @@ def estimate(data: pd.DataFrame) -> np.ndarray:
         + data["L5-BidSize"].to_numpy(),
         data["L5-BidPrice"] - (data["L1-AskPrice"] - data["L1-BidPrice"]) / 2,
     )
+    return rows, slope
+
+
+def estimate(data: pd.DataFrame) -> np.ndarray:
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    _, slope = _slopes(data)
     return np.mean(slope) if len(slope) else np.nan
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray):
+    """Bid slope in each time bucket, given the bucket of each row"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    rows, slope = _slopes(data)
+    # Skipping NaNs like the mean of the Series in `estimate()`.
+    return _buckets.mean(slope.to_numpy(), buckets[rows], skipna=True)
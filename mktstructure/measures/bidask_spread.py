@@ -2,18 +2,31 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
 
 name = "BidAskSpread"
 description = "Simple average bid-ask spread"
 vars_needed = {"Bid Price", "Ask Price", "Mid Point"}
 
 
+def _spreads(data):
+    return np.divide(
+        data["Ask Price"].to_numpy() - data["Bid Price"].to_numpy(),
+        data["Mid Point"].to_numpy(),
+    )
+
+
 def estimate(data: pd.DataFrame) -> np.ndarray:
     if not vars_needed.issubset(data.columns):
         raise MissingVariableError(name, vars_needed.difference(data.columns))
 
-    spread = np.divide(
-        data["Ask Price"].to_numpy() - data["Bid Price"].to_numpy(),
-        data["Mid Point"].to_numpy(),
-    )
+    spread = _spreads(data)
     return np.mean(spread) if len(spread) else np.nan
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray):
+    """Bid-ask spread in each time bucket, given the bucket of each row"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    return _buckets.mean(_spreads(data), buckets)
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
 
 name = "EffectiveSpread"
 description = """
@@ -13,18 +14,31 @@ P is the transaction price, and midpoint is the bid-ask midpoint.
 vars_needed = {"Price", "Volume", "Mid Point", "Direction"}
 
 
-def estimate(data: pd.DataFrame) -> np.ndarray:
-    if not vars_needed.issubset(data.columns):
-        raise MissingVariableError(name, vars_needed.difference(data.columns))
-
+def _spreads(data):
+    """Effective spread and dollar volume of each trade"""
     midpt = data["Mid Point"].to_numpy()
     price = data["Price"].to_numpy()
     direction = data["Direction"].to_numpy()
     espread = 2 * direction * (price - midpt) / midpt
+    volume = data["Volume"].to_numpy()
+    return espread, np.multiply(volume, price)
+
+
+def estimate(data: pd.DataFrame) -> np.ndarray:
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
 
+    espread, dolloar_volume = _spreads(data)
     # Daily effective spread is the dollar-volume-weighted average
     # of the effective spread computed over all trades in the day.
-    volume = data["Volume"].to_numpy()
-    dolloar_volume = np.multiply(volume, price)
     esprd = np.sum(np.multiply(espread, dolloar_volume) / np.sum(dolloar_volume))
     return np.nan if np.isnan(esprd) else esprd
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray):
+    """Effective spread in each time bucket, given the bucket of each trade"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    espread, dollar_volume = _spreads(data)
+    return _buckets.weighted_mean(espread, dollar_volume, buckets)
@@ -0,0 +1,358 @@
+"""
+Incremental versions of the measures, for monitoring a day as its ticks come in.
+
+Each estimator is fed consecutive chunks of the data the batch measure reads (signed
+trades for the spreads and price impact, market depth for the slopes and SDD) with
+`update(chunk)`, and `value()` is the measure over all ticks so far. Both take constant
+time per tick, and once the whole day is fed `value()` matches the batch `estimate()` up
+to floating point rounding. `update_arrays()` takes the `columns()` of the ticks as
+arrays instead, e.g. slices of the columns of a larger chunk, skipping pandas overhead.
+
+Realized spread and price impact need the midpoint of the quote prevailing `horizon`
+after each trade, as in the alignment index of `classify`. The quotes are fed with
+`update_quotes()`, as `replay` does, or else are those prevailing at the trades, their
+`Mid Point`. Trades are held until a later tick arrives and are left out of `value()`
+until then, as the batch measures leave out the end of the day.
+"""
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from . import (
+    ask_slope,
+    bid_slope,
+    bidask_spread,
+    effective_spread,
+    price_impact,
+    realized_spread,
+    scaled_depth_difference,
+)
+from .exceptions import *
+from ..alignment import HORIZON, lag_ns, trade_timestamps
+
+
+class OnlineEstimator:
+    name = None
+    vars_needed = set()
+
+    def __init__(self):
+        self.rows = 0
+
+    def update(self, data: pd.DataFrame) -> "OnlineEstimator":
+        return self.update_arrays(self.columns(data))
+
+    def columns(self, data: pd.DataFrame) -> dict:
+        """Arrays of the columns of `data` used by the estimator"""
+        if not self.vars_needed.issubset(data.columns):
+            raise MissingVariableError(
+                self.name, self.vars_needed.difference(data.columns)
+            )
+        return {var: data[var].to_numpy() for var in self.vars_needed}
+
+    def update_arrays(self, columns: dict) -> "OnlineEstimator":
+        rows = len(next(iter(columns.values())))
+        if rows:
+            self._update(columns)
+            self.rows += rows
+        return self
+
+    def _update(self, columns):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+
+class _Mean(OnlineEstimator):
+    """Mean of a per-tick value, skipping NaNs if `skipna`"""
+
+    skipna = False
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0.0
+        self.count = 0
+
+    def _update(self, columns):
+        values = self._values(columns)
+        if self.skipna:
+            values = values[~np.isnan(values)]
+        self.total += np.sum(values)
+        self.count += len(values)
+
+    def _values(self, columns) -> np.ndarray:
+        raise NotImplementedError
+
+    def value(self):
+        return self.total / self.count if self.count else np.nan
+
+
+class _Weighted(OnlineEstimator):
+    """Dollar-volume-weighted average of a per-trade value"""
+
+    def __init__(self):
+        super().__init__()
+        self.weighted = 0.0
+        self.dollar_volume = 0.0
+        self.trades = 0
+
+    def _add(self, values, dollar_volume):
+        self.weighted += np.sum(values * dollar_volume)
+        self.dollar_volume += np.sum(dollar_volume)
+        self.trades += len(values)
+
+    def value(self):
+        # The batch sum over no trades is 0.
+        if not self.trades:
+            return 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = np.float64(self.weighted) / self.dollar_volume
+        return np.nan if np.isnan(value) else value
+
+
+class BidAskSpread(_Mean):
+    name = bidask_spread.name
+    vars_needed = bidask_spread.vars_needed
+
+    def _values(self, columns):
+        spread = columns["Ask Price"] - columns["Bid Price"]
+        return spread / columns["Mid Point"]
+
+
+class EffectiveSpread(_Weighted):
+    name = effective_spread.name
+    vars_needed = effective_spread.vars_needed
+
+    def _update(self, columns):
+        midpt = columns["Mid Point"]
+        price = columns["Price"]
+        espread = 2 * columns["Direction"] * (price - midpt) / midpt
+        self._add(espread, columns["Volume"] * price)
+
+
+class _Buffer:
+    """
+    Columns of a queue of rows, appended at the back and dropped from the front in
+    amortized constant time per row. The rows are `[head, tail)` of arrays reallocated,
+    twice as large if more than half full, only when the tail reaches their end.
+    """
+
+    def __init__(self, dtypes, capacity=1024):
+        self.arrays = {k: np.empty(capacity, dtype=t) for k, t in dtypes.items()}
+        self.capacity = capacity
+        self.head = self.tail = 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def __getitem__(self, name):
+        return self.arrays[name][self.head : self.tail]
+
+    def items(self):
+        return ((k, self[k]) for k in self.arrays)
+
+    def append(self, chunk):
+        n = len(next(iter(chunk.values())))
+        if self.tail + n > self.capacity:
+            size = len(self)
+            self.capacity = max(self.capacity, 2 * (size + n))
+            for k, values in self.arrays.items():
+                moved = np.empty(self.capacity, dtype=values.dtype)
+                moved[:size] = values[self.head : self.tail]
+                self.arrays[k] = moved
+            self.head, self.tail = 0, size
+        for k, values in chunk.items():
+            self.arrays[k][self.tail : self.tail + n] = values
+        self.tail += n
+
+    def drop(self, n):
+        self.head += n
+
+
+class _AfterHorizon(_Weighted):
+    """
+    Weighted average of a value that needs the midpoint prevailing `horizon` after each
+    trade. Trades wait in `pending` until a tick later than that arrives, and the quotes
+    that may still prevail for them are kept in `quotes`.
+    """
+
+    def __init__(self, horizon=HORIZON):
+        super().__init__()
+        self.horizon = -lag_ns(horizon)
+        self.pending = _Buffer(
+            {
+                "time": np.int64,
+                "price": np.float64,
+                "midpt": np.float64,
+                "direction": np.float64,
+                "volume": np.float64,
+            }
+        )
+        self.quotes = _Buffer({"time": np.int64, "midpt": np.float64})
+        self.has_quotes = False
+        # Time of the last tick.
+        self.now = np.iinfo(np.int64).min
+
+    def columns(self, data):
+        columns = super().columns(data)
+        columns["Date-Time"] = trade_timestamps(data).view(np.int64)
+        return columns
+
+    def update_quotes(self, times, midpoints) -> "_AfterHorizon":
+        """
+        Feed the next quotes, with the same (local) epoch-ns times as the trades. The
+        trades before the last of them may follow, so no quote is dropped until then.
+        """
+        self.has_quotes = True
+        self._add_quotes(times, midpoints)
+        self._resolve(prune=False)
+        return self
+
+    def _add_quotes(self, times, midpoints):
+        self.quotes.append({"time": times, "midpt": midpoints})
+        if len(times):
+            self.now = max(self.now, int(times[-1]))
+
+    def _update(self, columns):
+        times = columns["Date-Time"]
+        self.pending.append(
+            {
+                "time": times,
+                "price": columns["Price"],
+                "midpt": columns["Mid Point"],
+                "direction": columns["Direction"],
+                "volume": columns["Volume"],
+            }
+        )
+        if not self.has_quotes:
+            self._add_quotes(times, columns["Mid Point"])
+        self.now = max(self.now, int(times[-1]))
+        self._resolve()
+
+    def _resolve(self, prune=True):
+        if not len(self.pending):
+            return
+        times = self.pending["time"]
+        # Targets are sorted, those before the last tick have all their quotes.
+        resolved = int(np.searchsorted(times, self.now - self.horizon, "left"))
+        if resolved:
+            targets = times[:resolved] + self.horizon
+            quote_times = self.quotes["time"]
+            offsets = np.searchsorted(quote_times, targets, "right") - 1
+            midpt = np.full(resolved, np.nan)
+            found = offsets >= 0
+            midpt[found] = self.quotes["midpt"][offsets[found]]
+            # As the batch measures, without trades lacking a later midpoint.
+            matched = ~np.isnan(midpt)
+            done = {k: v[:resolved][matched] for k, v in self.pending.items()}
+            self._add_resolved(done, midpt[matched])
+            self.pending.drop(resolved)
+        if not prune:
+            return
+        # Quotes before the one prevailing at the earliest target are no longer needed.
+        first = len(self.quotes) - 1
+        if len(self.pending):
+            target = self.pending["time"][0] + self.horizon
+            first = np.searchsorted(self.quotes["time"], target, "right") - 1
+        if first > 0:
+            self.quotes.drop(int(first))
+
+    def _add_resolved(self, trades, midpt_later):
+        raise NotImplementedError
+
+
+class RealizedSpread(_AfterHorizon):
+    name = realized_spread.name
+    vars_needed = realized_spread.vars_needed
+
+    def _add_resolved(self, trades, midpt_later):
+        rspread = 2 * trades["direction"] * (trades["price"] - midpt_later)
+        self._add(rspread, trades["volume"] * trades["price"])
+
+
+class PriceImpact(_AfterHorizon):
+    name = price_impact.name
+    vars_needed = price_impact.vars_needed
+
+    def _add_resolved(self, trades, midpt_later):
+        midpt = trades["midpt"]
+        pimpact = 2 * trades["direction"] * (midpt_later - midpt) / midpt
+        self._add(pimpact, trades["volume"] * trades["price"])
+
+
+def _complete(columns, names):
+    """Mask of the rows without NaNs in the given columns, as `DataFrame.dropna()`"""
+    rows = np.ones(len(columns[next(iter(names))]), dtype=bool)
+    for name in names:
+        if columns[name].dtype.kind == "f":
+            rows &= ~np.isnan(columns[name])
+    return rows
+
+
+class _Slope(_Mean):
+    # The batch mean is of a Series, which skips NaNs.
+    skipna = True
+    side = None
+
+    def _values(self, columns):
+        rows = _complete(columns, self.vars_needed)
+        depth = sum(columns[f"L{i}-{self.side}Size"][rows] for i in range(1, 6))
+        ask = columns["L1-AskPrice"][rows]
+        bid = columns["L1-BidPrice"][rows]
+        level5 = columns[f"L5-{self.side}Price"][rows]
+        slope = np.divide(depth, level5 - (ask - bid) / 2)
+        return -slope if self.side == "Bid" else slope
+
+
+class BidSlope(_Slope):
+    name = bid_slope.name
+    vars_needed = bid_slope.vars_needed
+    side = "Bid"
+
+
+class AskSlope(_Slope):
+    name = ask_slope.name
+    vars_needed = ask_slope.vars_needed
+    side = "Ask"
+
+
+class ScaledDepthDifference(_Mean):
+    vars_needed = scaled_depth_difference.vars_needed
+    skipna = True
+
+    def __init__(self, level=1):
+        super().__init__()
+        self.level = level
+        self.name = f"{scaled_depth_difference.name}Lvl{level}"
+
+    def _values(self, columns):
+        levels = range(1, self.level + 1)
+        bid_cols = [f"L{i}-BidSize" for i in levels]
+        ask_cols = [f"L{i}-AskSize" for i in levels]
+        rows = _complete(columns, bid_cols + ask_cols)
+        cum_bid = sum(columns[col][rows].astype(float) for col in bid_cols)
+        cum_ask = sum(columns[col][rows].astype(float) for col in ask_cols)
+        denom = cum_ask + cum_bid
+        return np.divide(
+            2 * (cum_ask - cum_bid),
+            denom,
+            out=np.full_like(denom, np.nan, dtype=float),
+            where=denom != 0,
+        )
+
+
+# Estimators by their `compute` flag, of signed trades and of market depth. `replay` runs
+# the ones registered here.
+TRADE_ESTIMATORS = {
+    "bid_ask_spread": BidAskSpread,
+    "effective_spread": EffectiveSpread,
+    "realized_spread": RealizedSpread,
+    "price_impact": PriceImpact,
+}
+DEPTH_ESTIMATORS = {
+    "bid_slope": BidSlope,
+    "ask_slope": AskSlope,
+    "scaled_depth_diff_1": partial(ScaledDepthDifference, 1),
+    "scaled_depth_diff_5": partial(ScaledDepthDifference, 5),
+}
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
+from ..alignment import midpoints_after
 
 name = "PriceImpact"
 description = """
@@ -13,27 +15,37 @@ midpoint is bid-ask midpoint, and midpoint_5min is the bid-ask midpoint 5min lat
 vars_needed = {"Price", "Volume", "Mid Point", "Direction"}
 
 
-def estimate(data: pd.DataFrame) -> np.ndarray:
-    if not vars_needed.issubset(data.columns):
-        raise MissingVariableError(name, vars_needed.difference(data.columns))
-
+def _impacts(data, alignment):
+    """Price impact and dollar volume of the trades with a midpoint 5 min later"""
     midpt = data["Mid Point"].to_numpy()
 
-    timestamps = np.array(data.index, dtype="datetime64")
     # Find the Quote Mid Point 5 min later than each trade.
-    matched_midpt = []
-    for idx, ts1 in enumerate(timestamps):
-        for i, ts2 in enumerate(timestamps[idx:]):
-            if ts2 - ts1 >= np.timedelta64(5, "m"):
-                matched_midpt.append(midpt[idx + i])
-                break
-    matched = len(matched_midpt)
-    directions = data["Direction"].to_numpy()[:matched]
-    pimpact = 2 * directions * (matched_midpt - midpt[:matched]) / midpt[:matched]
-    # Daily price impact is the dollar-volume-weighted average
-    # of the price impact computed over all trades in the day.
+    matched_midpt = midpoints_after(data, alignment)
+    matched = ~np.isnan(matched_midpt)
+    directions = data["Direction"].to_numpy()[matched]
+    pimpact = (
+        2 * directions * (matched_midpt[matched] - midpt[matched]) / midpt[matched]
+    )
     price = data["Price"].to_numpy()
     volume = data["Volume"].to_numpy()
-    dolloar_volume = np.multiply(volume, price)[:matched]
+    return matched, pimpact, np.multiply(volume, price)[matched]
+
+
+def estimate(data: pd.DataFrame, alignment=None) -> np.ndarray:
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    _, pimpact, dolloar_volume = _impacts(data, alignment)
+    # Daily price impact is the dollar-volume-weighted average
+    # of the price impact computed over all trades in the day.
     pimpact = np.sum(np.multiply(pimpact, dolloar_volume) / np.sum(dolloar_volume))
     return np.nan if np.isnan(pimpact) else pimpact
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray, alignment=None):
+    """Price impact in each time bucket, given the bucket of each trade"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    matched, pimpact, dollar_volume = _impacts(data, alignment)
+    return _buckets.weighted_mean(pimpact, dollar_volume, buckets[matched])
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
+from ..alignment import midpoints_after
 
 name = "RealizedSpread"
 description = """
@@ -15,24 +17,34 @@ P is the transaction price, and midpoint_5min is the bid-ask midpoint 5mins late
 vars_needed = {"Price", "Volume", "Mid Point", "Direction"}
 
 
-def estimate(data: pd.DataFrame) -> np.ndarray:
-    midpt = data["Mid Point"].to_numpy()
+def _spreads(data, alignment):
+    """Realized spread and dollar volume of the trades with a midpoint 5 min later"""
     price = data["Price"].to_numpy()
-    timestamps = np.array(data.index, dtype="datetime64")
     # Find the Quote Mid Point 5 min later than each trade.
-    matched_midpt = []
-    for idx, ts1 in enumerate(timestamps):
-        for i, ts2 in enumerate(timestamps[idx:]):
-            if ts2 - ts1 >= np.timedelta64(5, "m"):
-                matched_midpt.append(midpt[idx + i])
-                break
-    matched = len(matched_midpt)
-    rspread = (
-        2 * data["Direction"].to_numpy()[:matched] * (price[:matched] - matched_midpt)
+    matched_midpt = midpoints_after(data, alignment)
+    matched = ~np.isnan(matched_midpt)
+    rspread = 2 * data["Direction"].to_numpy()[matched] * (
+        price[matched] - matched_midpt[matched]
     )
+    volume = data["Volume"].to_numpy()
+    return matched, rspread, np.multiply(volume, price)[matched]
+
+
+def estimate(data: pd.DataFrame, alignment=None) -> np.ndarray:
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    _, rspread, dolloar_volume = _spreads(data, alignment)
     # Daily realized spread is the dollar-volume-weighted average
     # of the realized spread computed over all trades in the day.
-    volume = data["Volume"].to_numpy()
-    dolloar_volume = np.multiply(volume, price)[:matched]
     rsprd = np.sum(np.multiply(rspread, dolloar_volume) / np.sum(dolloar_volume))
     return np.nan if np.isnan(rsprd) else rsprd
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray, alignment=None):
+    """Realized spread in each time bucket, given the bucket of each trade"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    matched, rspread, dollar_volume = _spreads(data, alignment)
+    return _buckets.weighted_mean(rspread, dollar_volume, buckets[matched])
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .exceptions import *
+from .. import buckets as _buckets
 
 name = "ScaledDepthDifference"
 description = "Scaled Depth Difference to examine the relative level of asymmetry in the order book at a particular point in time"
@@ -19,20 +20,20 @@ vars_needed = {
 }
 
 
-def estimate(data: pd.DataFrame, level=1) -> np.ndarray:
-    if not vars_needed.issubset(data.columns):
-        raise MissingVariableError(name, vars_needed.difference(data.columns))
-
+def _differences(data, level):
+    """Rows without missing depths up to `level` and their scaled depth difference"""
     # Cumulative depth up to the given level
     bid_cols = [f"L{i}-BidSize" for i in range(1, level + 1)]
     ask_cols = [f"L{i}-AskSize" for i in range(1, level + 1)]
 
     # Only drop rows where the columns we actually use have NaN
     used_cols = bid_cols + ask_cols
-    data = data.dropna(subset=used_cols)
+    rows = data[used_cols].notna().all(axis=1).to_numpy()
+    data = data[rows]
 
-    cum_bid = data[bid_cols].sum(axis=1).to_numpy()
-    cum_ask = data[ask_cols].sum(axis=1).to_numpy()
+    # As floats, sizes are unsigned and the difference would wrap around.
+    cum_bid = data[bid_cols].sum(axis=1).to_numpy(dtype=float)
+    cum_ask = data[ask_cols].sum(axis=1).to_numpy(dtype=float)
 
     denom = cum_ask + cum_bid
 
@@ -43,4 +44,21 @@ def estimate(data: pd.DataFrame, level=1) -> np.ndarray:
         where=denom != 0,
     )
 
+    return rows, slope
+
+
+def estimate(data: pd.DataFrame, level=1) -> np.ndarray:
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    _, slope = _differences(data, level)
     return np.nanmean(slope) if len(slope) else np.nan
+
+
+def estimate_buckets(data: pd.DataFrame, buckets: np.ndarray, level=1):
+    """Scaled depth difference in each time bucket, given the bucket of each row"""
+    if not vars_needed.issubset(data.columns):
+        raise MissingVariableError(name, vars_needed.difference(data.columns))
+
+    rows, slope = _differences(data, level)
+    return _buckets.mean(slope, buckets[rows], skipna=True)
@@ -1,13 +1,14 @@
 # LoMacKinlay.py
 import numpy as np
-from numba import jit
+
+from ..kernels import kernel
 
 name = "LoMacKinlay1988"
 description = "Variance ratio and test statistics as in Lo and MacKinlay (1988)"
 vars_needed = ["Price"]
 
 
-@jit(nopython=True, nogil=True, cache=True)
+@kernel("UniTuple(f8, 3)(f8[::1], i8, i8[::1])")
 def _estimate(log_prices, k, const_arr):
     # Log returns = [x2, x3, x4, ..., xT], where x(i)=ln[p(i)/p(i-1)]
     rets = np.diff(log_prices)
@@ -37,9 +38,9 @@ def _estimate(log_prices, k, const_arr):
     #   When k=5, a_arr = array([2.56, 1.44, 0.64, 0.16]).
     #   When k=8, a_arr = array([3.0625, 2.25, 1.5625, 1., 0.5625, 0.25, 0.0625])
     # Without JIT it's defined as:
-    #   a_arr = np.square(np.arange(k-1, 0, step=-1, dtype=np.int) * 2 / k)
+    #   a_arr = np.square(np.arange(k-1, 0, step=-1, dtype=np.int64) * 2 / k)
     # But np.array creation is not allowed in nopython mode.
-    # So const_arr=np.arange(k-1, 0, step=-1, dtype=np.int) is created outside.
+    # So const_arr=np.arange(k-1, 0, step=-1, dtype=np.int64) is created outside.
     a_arr = np.square(const_arr * 2 / k)
 
     # b_arr is part of the delta_arr.
@@ -71,7 +72,7 @@ def estimate(data):
     # Estimate many lags.
     for k in [2, 4, 6, 8, 10, 15, 20]:
         # Compute a constant array as np.array creation is not allowed in nopython mode.
-        const_arr = np.arange(k - 1, 0, step=-1, dtype=np.int)
+        const_arr = np.arange(k - 1, 0, step=-1, dtype=np.int64)
         try:
             vr, stat1, stat2 = _estimate(np.log(prices), k, const_arr)
         except ZeroDivisionError:
@@ -0,0 +1,113 @@
+"""
+Per-file, per-stage instrumentation, written as JSON lines to `--metrics_out`.
+
+Each record has the stage, file, wall and CPU time, bytes read and written, rows in
+and out and the peak RSS of the process during the stage. The CPU time is that of all
+threads of the process, so it includes the codec and numba threads of the stage, and
+any read-ahead running meanwhile. With `--profile <dir>`, a
+cProfile dump (pstats format, e.g. for snakeviz) is saved for each file whose stage
+takes longer than `--profile_min_seconds`.
+"""
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Depth of nested stages in this process, only the outermost resets the peak RSS.
+_depth = 0
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process where supported (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS, and is inherited across exec.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(p) for p in paths if p and os.path.isfile(p))
+
+
+def enabled(args):
+    return bool(getattr(args, "metrics_out", None) or getattr(args, "profile", None))
+
+
+@contextmanager
+def stage(name, args=None, path=None, profile=True, **fields):
+    """
+    Measure the enclosed block as one stage on `path`, configured by the command's `args`.
+    Yields the record, to which the block adds `rows_in`, `rows_out`, `bytes_written` etc.
+
+        with metrics.stage("clean", args, path) as m:
+            m["rows_in"], m["rows_out"], out = _sort_and_rm_duplicates(path)
+            m["bytes_written"] = metrics.file_size(out)
+    """
+    global _depth
+    record = {"stage": name, "path": path, **fields}
+    if not enabled(args):
+        yield record
+        return
+
+    profile_dir = getattr(args, "profile", None) if profile and _depth == 0 else None
+    profiler = cProfile.Profile() if profile_dir else None
+    if _depth == 0:
+        reset_peak_rss()
+    if path is not None:
+        record["bytes_read"] = file_size(path)
+    _depth += 1
+    t0, c0 = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        _depth -= 1
+        record["wall_seconds"] = time.perf_counter() - t0
+        record["cpu_seconds"] = time.process_time() - c0
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["pid"] = os.getpid()
+        record["time"] = time.time()
+        if profiler and record["wall_seconds"] >= getattr(
+            args, "profile_min_seconds", 0
+        ):
+            os.makedirs(profile_dir, exist_ok=True)
+            slug = re.sub(r"[^\w.-]+", "_", os.path.relpath(path) if path else name)
+            dump = os.path.join(profile_dir, f"{name}-{slug}-{os.getpid()}.prof")
+            profiler.dump_stats(dump)
+            record["profile"] = dump
+        if getattr(args, "metrics_out", None):
+            emit(args.metrics_out, record)
+
+
+def emit(path, record):
+    """Append one record in a single write, so lines of worker processes don't interleave"""
+    line = (json.dumps(record, default=str) + "\n").encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
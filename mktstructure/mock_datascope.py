@@ -0,0 +1,427 @@
+"""
+Local stand-in for the DataScope REST endpoints used by `trth.Connection`, serving synthetic
+gzip payloads, for offline tests and end-to-end download benchmarks.
+
+    python -m mktstructure.mock_datascope --port 8080 --ticks_per_day 1000000 --job_delay 5
+    mktstructure download --base_url http://127.0.0.1:8080/RestApi/v1 --poll_interval 1 ...
+
+Serves `Authentication/RequestToken`, `Search/HistoricalChainResolution`,
+`Extractions/ExtractRaw` (202 and polling of the returned location until the job is ready)
+and `Extractions/RawExtractionResults('<JobId>')/$value`, with range requests. Latency,
+request throttling (429), download bandwidth and dropped downloads are configurable.
+Payloads have the requested content fields and depth levels that the synthetic data has.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from . import synthetic
+
+API_ROOT = "/RestApi/v1"
+CHUNK_SIZE = 64 * 1024
+
+
+class MockDataScope(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        ticks_per_day=10_000,
+        latency=0.0,
+        job_delay=0.0,
+        rate_limit=None,
+        bandwidth=None,
+        chain_size=100,
+        chain_turnover=0,
+        drop_after=None,
+        quota_limit=100_000,
+        seed=0,
+    ):
+        """
+        `latency` (seconds) is added to every response, extractions stay in 202 for at least
+        `job_delay` seconds, more than `rate_limit` requests per second get a 429 and
+        downloads are capped at `bandwidth` bytes per second. With `chain_turnover` n > 0,
+        each index chain has `chain_size` constituents out of `chain_size + n` RICs, and
+        a different n are out of it every calendar month. Downloads support range
+        requests, and with `drop_after` the connection is dropped after that many bytes
+        of each download response. Each RIC of a job counts against `quota_limit`, as
+        reported in the job's notes.
+        """
+        super().__init__(address, _Handler)
+        self.ticks_per_day = ticks_per_day
+        self.latency = latency
+        self.job_delay = job_delay
+        self.rate_limit = rate_limit
+        self.bandwidth = bandwidth
+        self.chain_size = chain_size
+        self.chain_turnover = chain_turnover
+        self.drop_after = drop_after
+        self.quota_limit = quota_limit
+        self.quota_used = 0
+        self.job_quota = {}
+        self.seed = seed
+        self.tokens = set()
+        self.jobs = {}
+        self._payloads = {}
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self._workdir = tempfile.mkdtemp(prefix="mock_datascope_")
+        self._exe = ThreadPoolExecutor(2)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_ROOT}"
+
+    def server_close(self):
+        super().server_close()
+        self._exe.shutdown(wait=True)
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def throttled(self):
+        """Whether this request exceeds the rate limit, over a sliding window of 1s"""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._requests and now - self._requests[0] > 1:
+                self._requests.popleft()
+            if len(self._requests) >= self.rate_limit:
+                return True
+            self._requests.append(now)
+        return False
+
+    def constituents(self, range_):
+        """Constituents of any index chain at any time in the request's `Range`"""
+        n, turnover = self.chain_size, self.chain_turnover
+        rics = synthetic.make_rics(n + turnover)
+        if not turnover:
+            return rics
+        start = date.fromisoformat(range_["Start"][:10])
+        end = max(date.fromisoformat(range_["End"][:10]), start + timedelta(days=1))
+        days = (start + timedelta(days=i) for i in range((end - start).days))
+        months = {(d.year, d.month) for d in days}
+        members = set()
+        for year, month in months:
+            # RICs at positions m*turnover ... (m+1)*turnover - 1 (mod n + turnover) are
+            # out of the index in month m.
+            out = (year * 12 + month) * turnover
+            members.update(
+                ric
+                for i, ric in enumerate(rics)
+                if (i - out) % (n + turnover) >= turnover
+            )
+        return sorted(members)
+
+    def submit(self, request):
+        """Start an extraction job, returns its id"""
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = (time.monotonic() + self.job_delay, self._payload(request))
+        # Each RIC of a job counts once against the quota.
+        with self._lock:
+            before = self.quota_used
+            self.quota_used += len(request["IdentifierList"]["InstrumentIdentifiers"])
+            self.job_quota[job_id] = before, self.quota_used
+        return job_id
+
+    def ready(self, job_id):
+        ready_at, payload = self.jobs[job_id]
+        return time.monotonic() >= ready_at and payload.done()
+
+    def payload_path(self, job_id):
+        return self.jobs[job_id][1].result()
+
+    def _payload(self, request):
+        """Future of the gzip payload, identical requests share the file"""
+        kind = request["@odata.type"]
+        rics = tuple(
+            i["Identifier"]
+            for i in request["IdentifierList"]["InstrumentIdentifiers"]
+        )
+        start = date.fromisoformat(request["Condition"]["QueryStartDate"][:10])
+        end = date.fromisoformat(request["Condition"]["QueryEndDate"][:10])
+        depth = "MarketDepth" in kind
+        if depth:
+            levels = request["Condition"].get("NumberOfLevels", synthetic.LEVELS)
+            # e.g. `Bid Price` -> `L1-BidPrice`, ...
+            names = {f.replace(" ", "") for f in request.get("ContentFieldNames", ())}
+            names = [n for n in synthetic.LEVEL_FIELDS if n in names]
+            fields = synthetic.depth_columns(levels, names)
+        else:
+            levels = None
+            # e.g. `Trade - Price` -> `Price`, `Quote - Bid Price` -> `Bid Price`
+            names = {f.split(" - ")[-1] for f in request.get("ContentFieldNames", ())}
+            fields = [
+                f
+                for f in synthetic.TAS_FIELDS
+                if f in synthetic.BASE_FIELDS or f in names
+            ]
+        key = (kind, rics, start, end, tuple(fields))
+        with self._lock:
+            if key not in self._payloads:
+                path = os.path.join(self._workdir, f"{len(self._payloads)}.csv.gz")
+                self._payloads[key] = self._exe.submit(
+                    self._generate, path, depth, rics, start, end, levels, fields
+                )
+            return self._payloads[key]
+
+    def _generate(self, path, depth, rics, start, end, levels, fields):
+        # The end date is exclusive.
+        days = sum(
+            (start + timedelta(days=i)).weekday() < 5 for i in range((end - start).days)
+        )
+        kwargs = dict(start=start, seed=self.seed, fields=fields)
+        if depth:
+            synthetic.write_market_depth(
+                path, list(rics), days, self.ticks_per_day, levels=levels, **kwargs
+            )
+        else:
+            synthetic.write_time_and_sales(
+                path, list(rics), days, self.ticks_per_day, **kwargs
+            )
+        return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockDataScope
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self._admit():
+            return
+        path = self.path[len(API_ROOT) :]
+        if path == "/Authentication/RequestToken":
+            token = uuid.uuid4().hex
+            self.server.tokens.add(token)
+            return self._json(200, {"value": token})
+        if not self._authorized():
+            return
+        payload = json.loads(body or b"{}")
+        if path == "/Search/HistoricalChainResolution":
+            chains = payload["Request"]["ChainRics"]
+            constituents = [
+                {"Identifier": ric, "IdentifierType": "Ric"}
+                for ric in self.server.constituents(payload["Request"]["Range"])
+            ]
+            return self._json(
+                200,
+                {
+                    "value": [
+                        {"Identifier": chain, "Constituents": constituents}
+                        for chain in chains
+                    ]
+                },
+            )
+        if path == "/Extractions/ExtractRaw":
+            job_id = self.server.submit(payload["ExtractionRequest"])
+            return self._job_status(job_id)
+        self._json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_GET(self):
+        if not self._admit() or not self._authorized():
+            return
+        path = unquote(self.path[len(API_ROOT) :])
+        match = re.fullmatch(r"/Extractions/ExtractRawResult\(ExtractionId='(\w+)'\)", path)
+        if match and match.group(1) in self.server.jobs:
+            return self._job_status(match.group(1))
+        match = re.fullmatch(r"/Extractions/RawExtractionResults\('(\w+)'\)/\$value", path)
+        if match and match.group(1) in self.server.jobs:
+            return self._download(self.server.payload_path(match.group(1)))
+        self._json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _admit(self):
+        time.sleep(self.server.latency)
+        if self.server.throttled():
+            self._json(429, {"error": {"message": "Too many requests"}}, {"Retry-After": "1"})
+            return False
+        return True
+
+    def _authorized(self):
+        token = self.headers.get("Authorization", "").replace("token ", "", 1)
+        if token in self.server.tokens:
+            return True
+        self._json(401, {"error": {"message": "Invalid token"}})
+        return False
+
+    def _job_status(self, job_id):
+        if not self.server.ready(job_id):
+            location = f"{self.server.base_url}/Extractions/ExtractRawResult(ExtractionId='{job_id}')"
+            return self._json(202, {}, {"Location": location})
+        before, after = self.server.job_quota[job_id]
+        self._json(
+            200,
+            {
+                "JobId": job_id,
+                "Notes": [
+                    "Extraction services version 16.0 (mock);"
+                    "Quota Message: INFO: Tick History Cash Quota Count Before Extraction: "
+                    f"{before};"
+                    "Quota Message: INFO: Tick History Cash Quota Count After Extraction: "
+                    f"{after};"
+                    f"Quota Message: INFO: Tick History Cash Quota Limit: "
+                    f"{self.server.quota_limit}"
+                ],
+            },
+        )
+
+    def _download(self, path):
+        size = os.path.getsize(path)
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        sent = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            while True:
+                t0 = time.monotonic()
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                drop_after = self.server.drop_after
+                if drop_after is not None and sent + len(chunk) > drop_after:
+                    # Simulate a dropped connection.
+                    self.wfile.write(chunk[: drop_after - sent])
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    time.sleep(max(0, len(chunk) / bandwidth - (time.monotonic() - t0)))
+
+    def _json(self, status, obj, headers=None):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local mock of the DataScope endpoints serving synthetic data"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="host to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument(
+        "--ticks_per_day",
+        metavar="ticks",
+        type=int,
+        default=10_000,
+        help="ticks per RIC-day in the payloads",
+    )
+    parser.add_argument(
+        "--latency",
+        metavar="seconds",
+        type=float,
+        default=0.0,
+        help="latency added to every response",
+    )
+    parser.add_argument(
+        "--job_delay",
+        metavar="seconds",
+        type=float,
+        default=0.0,
+        help="min time an extraction stays in 202 (in progress)",
+    )
+    parser.add_argument(
+        "--rate_limit",
+        metavar="requests",
+        type=int,
+        default=None,
+        help="max requests per second before responding 429",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        metavar="MB/s",
+        type=float,
+        default=None,
+        help="max download speed",
+    )
+    parser.add_argument(
+        "--chain_size",
+        metavar="n",
+        type=int,
+        default=100,
+        help="number of constituents of every index chain",
+    )
+    parser.add_argument(
+        "--chain_turnover",
+        metavar="n",
+        type=int,
+        default=0,
+        help="number of constituents replaced every month",
+    )
+    parser.add_argument(
+        "--drop_after",
+        metavar="bytes",
+        type=int,
+        default=None,
+        help="drop the connection after this many bytes of each download",
+    )
+    parser.add_argument(
+        "--quota_limit",
+        metavar="n",
+        type=int,
+        default=100_000,
+        help="quota limit, each RIC of a job counts once against it",
+    )
+    args = parser.parse_args()
+
+    server = MockDataScope(
+        (args.host, args.port),
+        ticks_per_day=args.ticks_per_day,
+        latency=args.latency,
+        job_delay=args.job_delay,
+        rate_limit=args.rate_limit,
+        bandwidth=args.bandwidth * 1024 * 1024 if args.bandwidth else None,
+        chain_size=args.chain_size,
+        chain_turnover=args.chain_turnover,
+        drop_after=args.drop_after,
+        quota_limit=args.quota_limit,
+    )
+    print(f"Serving mock DataScope at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
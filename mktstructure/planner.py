@@ -0,0 +1,186 @@
+"""
+Plan extractions as jobs of roughly equal size below configurable limits, and track the
+quota they consume.
+
+Rows per RIC-day are estimated from the catalog of past downloads,
+`<data_dir>/.catalog.json`, which records the rows of each RIC-day parsed by `download`.
+A RIC-day not in the catalog is estimated by the mean of the RIC's known days, then by
+the median RIC-day of the catalog, then by a default. RICs are spread over the fewest
+jobs that keep each job below `max_rows` and `max_rics`, largest first onto the smallest
+job, so the jobs come out about even. A RIC whose range alone is above `max_rows` gets
+jobs of its own over consecutive parts of the range.
+
+The jobs of a download are saved next to its output, `<out>.plan.json`, and reused by
+`--resume`: the catalog grows as the jobs done are parsed, so planning again could give
+the i-th job other RICs or dates and the journals of the jobs done would not match.
+"""
+import json
+import math
+import os
+import re
+from datetime import date, timedelta
+
+import numpy as np
+
+from .constituents import business_days
+
+CATALOG_FILE = ".catalog.json"
+PLAN_SUFFIX = ".plan.json"
+# Rows of a RIC-day without any history.
+ROWS_PER_DAY = 200_000
+MAX_ROWS = 50_000_000
+MAX_RICS = 1000
+
+
+class Catalog:
+    """Rows of each RIC-day downloaded so far, none without a `data_dir`"""
+
+    def __init__(self, data_dir=None, default=ROWS_PER_DAY):
+        self.path = os.path.join(data_dir, CATALOG_FILE) if data_dir else None
+        self.data_dir = data_dir
+        self.default = default
+        self.rows = {}
+        if self.path and os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.rows = json.load(f)
+        known = [n for days in self.rows.values() for n in days.values()]
+        self.median = float(np.median(known)) if known else None
+
+    def estimate(self, ric, day) -> float:
+        days = self.rows.get(ric)
+        if days:
+            return days.get(str(day), sum(days.values()) / len(days))
+        return self.median if self.median is not None else self.default
+
+    def record(self, paths):
+        """Add the rows of the parsed `<ric>/<date>.csv` files at `paths`"""
+        for path in paths:
+            ric, name = os.path.normpath(path).split(os.sep)[-2:]
+            with open(path, "rb") as f:
+                chunks = iter(lambda: f.read(1 << 20), b"")
+                # Lines less the header.
+                rows = sum(chunk.count(b"\n") for chunk in chunks)
+            self.rows.setdefault(ric, {})[name.removesuffix(".csv")] = max(rows - 1, 0)
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.rows, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def plan(requests, catalog, max_rows=MAX_ROWS, max_rics=MAX_RICS):
+    """
+    Split the extraction `requests` `(rics, start, end)` into jobs of the same form,
+    with the estimated rows of each. Start and end are UTC timestamps as in
+    `cmd_download`, the end is exclusive.
+    """
+    jobs = []
+    for rics, start, end in requests:
+        days = business_days(start[:10], end[:10])
+        if not days:
+            continue
+        rows = {ric: [catalog.estimate(ric, day) for day in days] for ric in rics}
+        # RICs too large for one job are split by date.
+        small = {}
+        for ric, estimates in rows.items():
+            if sum(estimates) <= max_rows:
+                small[ric] = sum(estimates)
+                continue
+            for first, last, n in _split_days(days, estimates, max_rows):
+                jobs.append(([ric], _ts(first), _ts(last + timedelta(days=1)), n))
+        for group, n in _balance(small, max_rows, max_rics):
+            jobs.append((group, start, end, n))
+    return jobs
+
+
+def save_plan(path, requests, jobs):
+    """Save the `jobs` planned for the `requests` to `path`"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"requests": requests, "jobs": jobs}, f)
+    os.replace(tmp, path)
+
+
+def load_plan(path, requests):
+    """The jobs saved at `path`, if planned for the same `requests`, else None"""
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    if saved["requests"] != json.loads(json.dumps(requests)):
+        return None
+    return [(rics, start, end, rows) for rics, start, end, rows in saved["jobs"]]
+
+
+def _ts(day: date) -> str:
+    return f"{day}T00:00:00.000Z"
+
+
+def _split_days(days, estimates, max_rows):
+    """Consecutive runs of `days` with at most `max_rows` estimated rows, or one day"""
+    first, total = 0, 0.0
+    for i, n in enumerate(estimates):
+        if i > first and total + n > max_rows:
+            yield days[first], days[i - 1], total
+            first, total = i, 0.0
+        total += n
+    yield days[first], days[-1], total
+
+
+def _balance(sizes, max_rows, max_rics):
+    """Groups of the keys of `sizes` with about equal total sizes, below the limits"""
+    if not sizes:
+        return []
+    total = sum(sizes.values())
+    k = max(math.ceil(total / max_rows), math.ceil(len(sizes) / max_rics), 1)
+    order = sorted(sizes, key=lambda r: (-sizes[r], r))
+    while True:
+        groups = [[] for _ in range(k)]
+        loads = [0.0] * k
+        for ric in order:
+            # The smallest group that has room for another RIC.
+            open_ = [i for i in range(k) if len(groups[i]) < max_rics]
+            i = min(open_, key=lambda j: loads[j])
+            groups[i].append(ric)
+            loads[i] += sizes[ric]
+        if max(loads) <= max_rows:
+            return [(sorted(g), n) for g, n in zip(groups, loads) if g]
+        k += 1
+
+
+QUOTA_PATTERNS = {
+    "before": r"Quota Count Before Extraction: (\d+)",
+    "after": r"Quota Count After Extraction: (\d+)",
+    "limit": r"Quota Limit: (\d+)",
+}
+
+
+def parse_quota(notes) -> dict:
+    """Quota counts before and after an extraction and the limit, from its `Notes`"""
+    quota = {}
+    for note in notes or []:
+        for key, pattern in QUOTA_PATTERNS.items():
+            match = re.search(pattern, note)
+            if match:
+                quota[key] = int(match.group(1))
+    return quota
+
+
+class QuotaTracker:
+    """Quota used by the jobs of a run, from the quota counts reported with each job"""
+
+    def __init__(self, max_quota=None):
+        self.max_quota = max_quota
+        self.used = 0
+        self.remaining = None
+
+    def record(self, quota):
+        if "before" in quota and "after" in quota:
+            self.used += quota["after"] - quota["before"]
+        if "after" in quota and "limit" in quota:
+            self.remaining = quota["limit"] - quota["after"]
+
+    def exhausted(self) -> bool:
+        """Whether the quota left, or `max_quota` for the run, is used up"""
+        if self.remaining is not None and self.remaining <= 0:
+            return True
+        return self.max_quota is not None and self.used >= self.max_quota
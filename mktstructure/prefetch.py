@@ -0,0 +1,57 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MB = 1024 * 1024
+
+
+def _nbytes(obj) -> int:
+    """Approximate in-memory size of a decoded frame"""
+    if isinstance(obj, (tuple, list)):
+        return sum(_nbytes(o) for o in obj)
+    if hasattr(obj, "memory_usage"):
+        # Shallow count is good enough and avoids scanning object columns.
+        return int(obj.memory_usage(index=True, deep=False).sum())
+    return int(getattr(obj, "nbytes", 0))
+
+
+def prefetch(items, reader, depth=2, max_memory=None):
+    """
+    Yield `(item, reader(item))` in the original order, reading up to `depth`
+    items ahead in a thread pool so that file I/O and decompression overlap with
+    whatever the consumer does with the current frame.
+
+    If `max_memory` (in bytes) is given, no new read is scheduled while the
+    decoded frames waiting to be consumed take more than that. At least one
+    read is always in flight so the pipeline cannot stall.
+    """
+    items = list(items)
+    if depth < 1:
+        for item in items:
+            yield item, reader(item)
+        return
+
+    pending = deque()
+    nxt = 0
+
+    def buffered():
+        return sum(
+            _nbytes(fut.result())
+            for _, fut in pending
+            if fut.done() and fut.exception() is None
+        )
+
+    exe = ThreadPoolExecutor(depth)
+    try:
+        while pending or nxt < len(items):
+            while nxt < len(items) and len(pending) < depth:
+                if pending and max_memory is not None and buffered() >= max_memory:
+                    break
+                pending.append((items[nxt], exe.submit(reader, items[nxt])))
+                nxt += 1
+            item, fut = pending.popleft()
+            yield item, fut.result()
+    finally:
+        # Consumer may stop early, don't keep reading files nobody will use.
+        for _, fut in pending:
+            fut.cancel()
+        exe.shutdown(wait=True)
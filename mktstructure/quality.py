@@ -0,0 +1,125 @@
+"""
+Data quality filter of `clean`, applied to the sorted ticks without duplicates in a
+single pass of a numba kernel.
+
+Checks, by their `--filters` names:
+
+- `session`: ticks outside the trading sessions of the RIC's exchange
+- `zero_size`: quotes with a zero bid or ask price or size, trades with a zero price or
+  volume
+- `crossed`: quotes with the bid above the ask
+- `locked`: quotes with the bid equal to the ask
+- `outlier`: trades more than `max_deviation` (a fraction, e.g. 0.1) away from the
+  midpoint of the prevailing quote, the last one that passed the checks
+
+Market depth files are checked on their first level, and have no trades. A row failing
+several checks is counted under the first in this order. Flagged rows are removed, or
+with `flag` kept with the code of the check in a `Quality` column (0 if passed), and
+dropped by `schema.read_ticks` in the later stages.
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .classification import _default_sessions, _epoch_ns
+from .kernels import kernel
+from .schema import DATETIME_FIELD, QUALITY_FIELD
+
+CHECKS = ("session", "zero_size", "crossed", "locked", "outlier")
+MAX_DEVIATION = 0.1
+# Columns of the prices and sizes checked, Time & Sales or market depth.
+TICK_COLUMNS = ("Bid Price", "Bid Size", "Ask Price", "Ask Size")
+DEPTH_COLUMNS = ("L1-BidPrice", "L1-BidSize", "L1-AskPrice", "L1-AskSize")
+
+
+@kernel("i1[::1](i8[:], i8[:, :], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], b1[:], f8)")
+def _flag(
+    timestamps, sessions, prices, volumes, bids, bidsize, asks, asksize, checks, max_dev
+):
+    """
+    Code of the first failed check of each sorted tick, the position in `CHECKS` plus
+    one, or 0 if it passed the enabled `checks`
+    """
+    n = len(timestamps)
+    codes = np.zeros(n, dtype=np.int8)
+    # Midpoint of the prevailing quote.
+    midpoint = np.nan
+    session = 0
+    for i in range(n):
+        # Sessions are sorted, and so are the timestamps.
+        while session < len(sessions) and sessions[session, 1] < timestamps[i]:
+            session += 1
+        if checks[0] and not (
+            session < len(sessions) and sessions[session, 0] <= timestamps[i]
+        ):
+            codes[i] = 1
+            continue
+        p = prices[i]
+        if np.isnan(p):
+            # Quote, NaN fields are not updated rather than zero.
+            b, a = bids[i], asks[i]
+            if checks[1] and (b == 0 or a == 0 or bidsize[i] == 0 or asksize[i] == 0):
+                codes[i] = 2
+            elif checks[2] and b > a:
+                codes[i] = 3
+            elif checks[3] and b == a:
+                codes[i] = 4
+            elif b > 0 and a > 0 and b <= a:
+                midpoint = (b + a) / 2
+        elif checks[1] and (p == 0 or volumes[i] == 0):
+            codes[i] = 2
+        elif checks[4] and abs(p - midpoint) > max_dev * midpoint:
+            codes[i] = 5
+    return codes
+
+
+def _column(df, name):
+    if name in df:
+        return df[name].to_numpy(dtype=np.float64)
+    return np.full(len(df), np.nan)
+
+
+def filter_ticks(
+    df: pd.DataFrame,
+    checks: Sequence[str],
+    sessions: np.ndarray = None,
+    max_deviation: float = MAX_DEVIATION,
+    flag: bool = False,
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    The sorted ticks of a RIC-day less those failing the `checks`, or with their
+    `Quality` if `flag`, and the number of rows failing each check. `sessions` are as
+    in `classification.classify_trades`, looked up by the RIC and date if not given.
+    """
+    unknown = set(checks).difference(CHECKS)
+    if unknown:
+        raise ValueError(f"Unknown quality checks: {', '.join(sorted(unknown))}.")
+    datetimes = df.index if df.index.name == DATETIME_FIELD else df[DATETIME_FIELD]
+    timestamps = _epoch_ns(datetimes)
+    if sessions is None and len(df):
+        offset = int(df["GMT Offset"].iloc[0] * 3600e9)
+        sessions = _default_sessions(df["#RIC"].iloc[0], timestamps[0], offset)
+    if sessions is None:
+        sessions = np.empty((0, 2), dtype=np.int64)
+    columns = TICK_COLUMNS if TICK_COLUMNS[0] in df else DEPTH_COLUMNS
+    codes = _flag(
+        timestamps,
+        np.ascontiguousarray(sessions, dtype=np.int64),
+        _column(df, "Price"),
+        _column(df, "Volume"),
+        *(_column(df, c) for c in columns),
+        np.array([c in checks for c in CHECKS]),
+        float(max_deviation),
+    )
+    counts = np.bincount(codes, minlength=len(CHECKS) + 1)
+    failed = {c: int(counts[i + 1]) for i, c in enumerate(CHECKS) if c in checks}
+    if flag:
+        df = df.assign(**{QUALITY_FIELD: codes})
+    else:
+        df = df[codes == 0]
+    return df, failed
+
+
+def format_counts(failed: Dict[str, int]) -> str:
+    return ", ".join(f"{n} {check}" for check, n in failed.items())
@@ -0,0 +1,255 @@
+"""
+Replay stored RIC-day files as one stream of ticks, to stress test intraday analytics.
+
+`merge()` merges the sorted files of many RICs in timestamp order with a heap over the
+next tick of each file, reading each file in chunks. `pace()` releases the ticks at
+`speed` times real time, or as fast as they are consumed. `Replay` pushes them through
+streaming Lee-Ready classification and the online estimators of the measures.
+
+Each stage is a generator pulled by the next one, so a slow consumer slows down reading
+rather than ticks piling up in memory: at most one chunk per file is held. A consumer
+that can't keep up with `speed` makes the replay fall behind schedule, which is reported
+as its `lag`.
+"""
+import bisect
+import heapq
+import time
+from datetime import date
+
+import numpy as np
+
+from . import sharding
+from .classification import StreamingLeeReady, _epoch_ns
+from .measures import online
+from .schema import iter_ticks
+from .sessions import SessionCalendar
+
+# Rows read from each file at a time.
+CHUNK_SIZE = 100_000
+# Ticks per batch of the merged stream, the unit of pacing.
+BATCH_SIZE = 1000
+
+
+class Run:
+    """Consecutive ticks `start:end` of a file's chunk in the merged stream"""
+
+    def __init__(self, path, chunk, times, start, end):
+        self.path = path
+        self.chunk = chunk
+        self.times = times
+        self.start = start
+        self.end = end
+        # Signed trades of the run as rows `a:b` of the chunk's signed trades, see `Replay`.
+        self.trades = None
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def ticks(self):
+        return self.chunk.iloc[self.start : self.end]
+
+    @property
+    def signed(self):
+        if self.trades is None:
+            return None
+        signed, a, b = self.trades
+        return signed.iloc[a:b]
+
+
+class _Source:
+    """A file being merged, with the chunk it's at"""
+
+    def __init__(self, path, chunk_size, price_dtype):
+        self.path = path
+        self.chunks = iter_ticks(path, chunk_size, price_dtype)
+        self.chunk, self.times, self.pos = None, None, 0
+
+    def next_chunk(self) -> bool:
+        for chunk in self.chunks:
+            if len(chunk):
+                self.chunk, self.times = chunk, _epoch_ns(chunk["Date-Time"])
+                # As ints for the heap and bisect, much faster than numpy per tick.
+                self.keys = self.times.tolist()
+                self.pos = 0
+                return True
+        return False
+
+    def head(self):
+        return self.keys[self.pos]
+
+
+def merge(paths, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, price_dtype="float64"):
+    """
+    Ticks of the sorted files `paths` in timestamp order, in batches of `batch_size`
+    consecutive ticks of the merged stream. A batch is a list of `Run`s, one per file in
+    the batch unless it starts a new chunk. Ties between files go to the one listed first.
+    """
+    sources = [_Source(path, chunk_size, price_dtype) for path in paths]
+    heap = [(s.head(), i) for i, s in enumerate(sources) if s.next_chunk()]
+    heapq.heapify(heap)
+    batch, size = {}, 0
+    while heap:
+        _, i = heapq.heappop(heap)
+        source = sources[i]
+        # Run of ticks up to the next tick of any other file.
+        end = len(source.keys)
+        if heap:
+            next_time, j = heap[0]
+            search = bisect.bisect_right if i < j else bisect.bisect_left
+            end = search(source.keys, next_time, source.pos)
+        end = min(end, source.pos + batch_size - size)
+        runs = batch.setdefault(i, [])
+        if runs and runs[-1].chunk is source.chunk and runs[-1].end == source.pos:
+            runs[-1].end = end
+        else:
+            runs.append(Run(source.path, source.chunk, source.times, source.pos, end))
+        size += end - source.pos
+        source.pos = end
+        if source.pos < len(source.keys) or source.next_chunk():
+            heapq.heappush(heap, (source.head(), i))
+        if size >= batch_size or not heap:
+            yield [run for runs in batch.values() for run in runs]
+            batch, size = {}, 0
+
+
+def pace(batches, speed=None, stats=None):
+    """
+    Release the `batches` of `merge()` at `speed` times the rate of their timestamps, or
+    as fast as they are consumed if not `speed`. Records the max lag behind schedule in
+    seconds as `stats["lag"]`.
+    """
+    start = None
+    for batch in batches:
+        if speed:
+            first = min(run.times[run.start] for run in batch)
+            if start is None:
+                start = time.monotonic(), first
+            delay = start[0] + (first - start[1]) / 1e9 / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif stats is not None:
+                stats["lag"] = max(stats.get("lag", 0.0), -delay)
+        yield batch
+
+
+class _File:
+    """Classifier and estimators of a file, with the columns of its current chunk"""
+
+    def __init__(self, classifier, trade_estimators, depth_estimators):
+        self.classifier = classifier
+        self.trade_estimators = trade_estimators
+        self.depth_estimators = depth_estimators
+        self.chunk = None
+
+    def load(self, chunk):
+        # Classify and extract the columns once per chunk rather than once per run.
+        self.chunk = chunk
+        self.depth_columns = {}
+        for estimator in self.depth_estimators:
+            self.depth_columns.update(estimator.columns(chunk))
+        if self.trade_estimators:
+            self.signed = self.classifier.update(chunk)
+            self.rows = self.classifier.rows
+            self.trade_columns = {}
+            for estimator in self.trade_estimators:
+                self.trade_columns.update(estimator.columns(self.signed))
+
+    def feed(self, run):
+        if run.chunk is not self.chunk:
+            self.load(run.chunk)
+        if self.depth_estimators:
+            columns = {k: v[run.start : run.end] for k, v in self.depth_columns.items()}
+            for estimator in self.depth_estimators:
+                estimator.update_arrays(columns)
+        if self.trade_estimators:
+            a, b = np.searchsorted(self.rows, [run.start, run.end])
+            columns = {k: v[a:b] for k, v in self.trade_columns.items()}
+            # Quotes of the run first, later trades don't change which quote prevails.
+            q, r = np.searchsorted(self.classifier.quote_rows, [run.start, run.end])
+            quote_times = self.classifier.quote_times[q:r]
+            quote_midpoints = self.classifier.quote_midpoints[q:r]
+            for estimator in self.trade_estimators:
+                if hasattr(estimator, "update_quotes"):
+                    estimator.update_quotes(quote_times, quote_midpoints)
+                estimator.update_arrays(columns)
+            run.trades = self.signed, a, b
+
+
+class Replay:
+    """
+    Replay sorted RIC-day files through streaming classification and online measures.
+
+    `trade_measures` run on the trades as classified by Lee and Ready, `depth_measures`
+    on the ticks themselves. Both are `compute` flags registered in
+    `online.TRADE_ESTIMATORS` and `online.DEPTH_ESTIMATORS`, and each file gets its own
+    estimators. Iterate over the replay to also get each `Run` of ticks, with its signed
+    trades, as they go, or just `run()` it.
+    """
+
+    def __init__(
+        self,
+        paths,
+        trade_measures=(),
+        depth_measures=(),
+        speed=None,
+        chunk_size=CHUNK_SIZE,
+        batch_size=BATCH_SIZE,
+        price_dtype="float64",
+        calendar=None,
+    ):
+        self.paths = list(paths)
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.price_dtype = price_dtype
+        calendar = SessionCalendar() if calendar is None else calendar
+        self.files = {}
+        for path in self.paths:
+            ric, day = sharding.ric_day(path)
+            classifier = None
+            if trade_measures:
+                classifier = StreamingLeeReady(
+                    calendar.sessions(ric, date.fromisoformat(day))
+                )
+            self.files[path] = _File(
+                classifier,
+                [online.TRADE_ESTIMATORS[m]() for m in trade_measures],
+                [online.DEPTH_ESTIMATORS[m]() for m in depth_measures],
+            )
+        self.stats = {"ticks": 0, "trades": 0, "lag": 0.0}
+
+    def __iter__(self):
+        stats = self.stats
+        batches = merge(self.paths, self.chunk_size, self.batch_size, self.price_dtype)
+        for batch in pace(batches, self.speed, stats):
+            for run in batch:
+                self.files[run.path].feed(run)
+                stats["ticks"] += len(run)
+                if run.trades is not None:
+                    stats["trades"] += int(run.trades[2] - run.trades[1])
+                stats.setdefault("first_tick", int(run.times[run.start]))
+                last = max(stats.get("last_tick", 0), int(run.times[run.end - 1]))
+                stats["last_tick"] = last
+                yield run
+
+    def run(self):
+        """Replay all the ticks, returns the stats of the replay"""
+        start = time.perf_counter()
+        for _ in self:
+            pass
+        stats = self.stats
+        stats["wall_seconds"] = time.perf_counter() - start
+        stats["data_seconds"] = (
+            (stats["last_tick"] - stats["first_tick"]) / 1e9 if stats["ticks"] else 0.0
+        )
+        stats["ticks_per_second"] = stats["ticks"] / max(stats["wall_seconds"], 1e-9)
+        stats["speedup"] = stats["data_seconds"] / max(stats["wall_seconds"], 1e-9)
+        return stats
+
+    def results(self):
+        """`(ric, day, measure, value)` of every file and measure so far"""
+        for path, f in self.files.items():
+            ric, day = sharding.ric_day(path)
+            for estimator in f.trade_estimators + f.depth_estimators:
+                yield ric, day, estimator.name, estimator.value()
@@ -0,0 +1,244 @@
+"""
+Rolling multi-day measures over the last `window` trading days of each RIC.
+
+The sufficient statistics (sums, cross-products and counts) of each RIC-day are computed
+once by `compute`, from the minute bars of its trades (see `bars`), and saved in
+`<data_dir>/.rolling/<RIC>/<date>.json`. Each RIC's window is kept in
+`<data_dir>/.rolling/<RIC>/window.json` along with the running sums of its days.
+Adding a day is then O(1): its statistics are added and those of the day leaving the
+window are subtracted. A day before the last one in the window, e.g. a backfill,
+rebuilds the RIC's window from the saved days.
+
+- Amihud (2002) illiquidity: mean of |daily return| / dollar volume.
+- Roll (1984) spread: 2 * sqrt(-cov(dP_t, dP_t-1)) of consecutive one-minute price
+  changes within each day, 0 if the autocovariance is positive.
+- Kyle's (1985) lambda: OLS slope of one-minute price changes on signed volume.
+- Corwin and Schultz (2012) spread: mean of the high-low spread estimates of each two
+  consecutive days, with the overnight adjustment and negative estimates set to 0.
+"""
+import json
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from . import sharding
+
+ROLLING_DIR = ".rolling"
+WINDOW_FILE = "window.json"
+# `compute` flag -> measure name.
+MEASURES = {
+    "amihud": "AmihudIlliquidity",
+    "roll_spread": "RollSpread",
+    "kyle_lambda": "KyleLambda",
+    "corwin_schultz": "CorwinSchultz2012",
+}
+# Entries of the per-day vectors summed over the window.
+AMIHUD, AMIHUD_DAYS = 0, 1
+ROLL = slice(2, 6)  # n, sum x, sum y, sum xy, with x = dP_t and y = dP_t-1
+KYLE = slice(6, 11)  # n, sum x, sum y, sum xy, sum xx, with x = signed volume, y = dP_t
+CS, CS_DAYS = 11, 12
+VECTOR_SIZE = 13
+
+
+def selected(args) -> list:
+    """Rolling measures selected by the `compute` flags"""
+    return [m for m in MEASURES if getattr(args, m, False)]
+
+
+def _dir(data_dir, ric):
+    return os.path.join(data_dir, ROLLING_DIR, ric)
+
+
+def day_stats(bars: pd.DataFrame) -> dict:
+    """Sufficient statistics of a RIC-day from its minute bars"""
+    close = bars["close"].to_numpy()
+    signed_volume = bars["signed_volume"].to_numpy()
+    changes = np.diff(close)
+    x, y = changes[1:], changes[:-1]
+    kyle_x = signed_volume[1:]
+    traded = len(bars) > 0
+    return {
+        "close": float(close[-1]) if traded else None,
+        "high": float(bars["high"].max()) if traded else None,
+        "low": float(bars["low"].min()) if traded else None,
+        "dollar_volume": float(bars["dollar_volume"].sum()),
+        "roll": [len(x), np.sum(x), np.sum(y), np.sum(x * y)],
+        "kyle": [
+            len(changes),
+            np.sum(kyle_x),
+            np.sum(changes),
+            np.sum(kyle_x * changes),
+            np.sum(kyle_x * kyle_x),
+        ],
+    }
+
+
+def corwin_schultz(high1, low1, high2, low2, close1):
+    """High-low spread estimate of two consecutive days, 0 if negative"""
+    # Overnight adjustment of the second day's range to the first day's close.
+    if low2 > close1:
+        high2, low2 = high2 - (low2 - close1), close1
+    elif high2 < close1:
+        high2, low2 = close1, low2 + (close1 - high2)
+    beta = np.log(high1 / low1) ** 2 + np.log(high2 / low2) ** 2
+    gamma = np.log(max(high1, high2) / min(low1, low2)) ** 2
+    k = 3 - 2 * np.sqrt(2)
+    alpha = (np.sqrt(2 * beta) - np.sqrt(beta)) / k - np.sqrt(gamma / k)
+    return max(2 * (np.exp(alpha) - 1) / (1 + np.exp(alpha)), 0.0)
+
+
+def save_day_stats(data_dir, ric, day, bars):
+    path = os.path.join(_dir(data_dir, ric), f"{day}.json")
+    _write_json(path, day_stats(bars))
+
+
+def is_fresh(data_dir, path) -> bool:
+    """Whether the saved statistics of the RIC-day of `path` are newer than the file"""
+    ric, day = sharding.ric_day(path)
+    stats = os.path.join(_dir(data_dir, ric), f"{day}.json")
+    return os.path.isfile(stats) and os.path.getmtime(stats) >= os.path.getmtime(path)
+
+
+def _write_json(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Several shards may update the same RIC.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, default=float)
+    os.replace(tmp, path)
+
+
+class Window:
+    """
+    The last `size` days of a RIC with the running sums of their statistics, and the
+    values of the measures at each day with a full window.
+    """
+
+    def __init__(self, size, days=(), sums=None, last=None, history=None, count=0):
+        self.size = size
+        # Days pushed so far.
+        self.count = count
+        # (date, vector) of each day in the window.
+        self.days = deque((day, np.asarray(v)) for day, v in days)
+        self.sums = np.zeros(VECTOR_SIZE) if sums is None else np.asarray(sums)
+        # Close, high and low of the last day with trades.
+        self.last = last
+        self.history = {} if history is None else history
+
+    @property
+    def last_day(self):
+        return self.days[-1][0] if self.days else None
+
+    def push(self, day, stats):
+        vector = np.zeros(VECTOR_SIZE)
+        close, dollar_volume = stats["close"], stats["dollar_volume"]
+        # Amihud and Corwin-Schultz need the previous day with trades.
+        if close is not None and self.last is not None:
+            if dollar_volume > 0:
+                vector[AMIHUD] = abs(close / self.last["close"] - 1) / dollar_volume
+                vector[AMIHUD_DAYS] = 1
+            vector[CS] = corwin_schultz(
+                self.last["high"],
+                self.last["low"],
+                stats["high"],
+                stats["low"],
+                self.last["close"],
+            )
+            vector[CS_DAYS] = 1
+        vector[ROLL] = stats["roll"]
+        vector[KYLE] = stats["kyle"]
+        if close is not None:
+            self.last = {k: stats[k] for k in ("close", "high", "low")}
+        self.days.append((day, vector))
+        self.count += 1
+        self.sums += vector
+        if len(self.days) > self.size:
+            _, dropped = self.days.popleft()
+            self.sums -= dropped
+        if len(self.days) == self.size:
+            self.history[day] = {m: float(getattr(self, m)()) for m in MEASURES}
+
+    def amihud(self):
+        days = self.sums[AMIHUD_DAYS]
+        return self.sums[AMIHUD] / days if days else np.nan
+
+    def corwin_schultz(self):
+        days = self.sums[CS_DAYS]
+        return self.sums[CS] / days if days else np.nan
+
+    def roll_spread(self):
+        n, x, y, xy = self.sums[ROLL]
+        if n < 2:
+            return np.nan
+        cov = (xy - x * y / n) / (n - 1)
+        return 2 * np.sqrt(-cov) if cov < 0 else 0.0
+
+    def kyle_lambda(self):
+        n, x, y, xy, xx = self.sums[KYLE]
+        denom = n * xx - x * x
+        return (n * xy - x * y) / denom if n >= 2 and denom > 0 else np.nan
+
+    def to_json(self):
+        return {
+            "size": self.size,
+            "days": [(day, v.tolist()) for day, v in self.days],
+            "sums": self.sums.tolist(),
+            "last": self.last,
+            "history": self.history,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_json(cls, obj):
+        return cls(**obj)
+
+
+def _saved_days(data_dir, ric):
+    root = _dir(data_dir, ric)
+    if not os.path.isdir(root):
+        return []
+    return sorted(f[: -len(".json")] for f in os.listdir(root) if f[:1].isdigit())
+
+
+def _load_day(data_dir, ric, day):
+    with open(os.path.join(_dir(data_dir, ric), f"{day}.json")) as f:
+        return json.load(f)
+
+
+def _backfilled(data_dir, ric, window, saved, since):
+    """Whether days up to the last one of the window were added or saved since"""
+    past = [day for day in saved if day <= window.last_day]
+    if len(past) != window.count:
+        return True
+    root = _dir(data_dir, ric)
+    return any(os.path.getmtime(os.path.join(root, f"{d}.json")) > since for d in past)
+
+
+def update(data_dir, ric, size):
+    """
+    Add the saved days of `ric` after the last one of its window, one at a time, and
+    save the window. Returns the `{day: {measure flag: value}}` of its days so far.
+    """
+    path = os.path.join(_dir(data_dir, ric), WINDOW_FILE)
+    saved = _saved_days(data_dir, ric)
+    window = None
+    if os.path.isfile(path):
+        with open(path) as f:
+            window = Window.from_json(json.load(f))
+        # A resized window or a new or recomputed past day is rebuilt from all days.
+        if window.size != size or _backfilled(
+            data_dir, ric, window, saved, os.path.getmtime(path)
+        ):
+            window = None
+    if window is None:
+        window = Window(size)
+    added = False
+    for day in saved:
+        if window.last_day is None or day > window.last_day:
+            window.push(day, _load_day(data_dir, ric, day))
+            added = True
+    if added:
+        _write_json(path, window.to_json())
+    return window.history
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from .compression import iter_csv, read_csv
+
+LEVELS = 10
+PRICE_FIELDS = ["Price", "Bid Price", "Ask Price", "Mid Point"] + [
+    f"L{i}-{side}Price" for i in range(1, LEVELS + 1) for side in ("Bid", "Ask")
+]
+SIZE_FIELDS = ["Volume", "Bid Size", "Ask Size"] + [
+    f"L{i}-{side}Size" for i in range(1, LEVELS + 1) for side in ("Bid", "Ask")
+]
+CATEGORY_FIELDS = ["#RIC", "Domain", "Type", "Qualifiers"]
+DIRECTION_FIELD = "Direction"
+DATETIME_FIELD = "Date-Time"
+# Code of the failed check of `quality`, 0 if none, in cleaned data with flags.
+QUALITY_FIELD = "Quality"
+
+
+def tick_dtypes(price_dtype="float64") -> dict:
+    """
+    Compact dtypes of the tick data read straight from the file: categorical strings and
+    prices in `price_dtype`. Sizes are read as `price_dtype` since quotes have no volume and
+    trades have no quote sizes, and are narrowed to uint32 by `compact()` if there's no gap.
+    """
+    dtypes = {field: price_dtype for field in PRICE_FIELDS + SIZE_FIELDS}
+    dtypes.update({field: "category" for field in CATEGORY_FIELDS})
+    return dtypes
+
+
+def read_ticks(path, price_dtype="float64", flagged=False, **kwargs) -> pd.DataFrame:
+    """
+    Load tick data with the compact schema of `tick_dtypes()`. `Date-Time` is parsed into
+    datetime64[ns] (int64 nanoseconds, no string copy kept). Keep `price_dtype` as float64
+    for data to be written back to disk, float32 loses precision for prices above ~100,000.
+    Rows flagged by `clean --flag` are dropped unless `flagged`.
+    """
+    df = read_csv(path, dtype=tick_dtypes(price_dtype), **kwargs)
+    return compact(df if flagged else drop_flagged(df), price_dtype)
+
+
+def iter_ticks(path, chunksize, price_dtype="float64", flagged=False, **kwargs):
+    """`read_ticks()` in chunks of `chunksize` rows"""
+    for df in iter_csv(path, chunksize, dtype=tick_dtypes(price_dtype), **kwargs):
+        yield compact(df if flagged else drop_flagged(df), price_dtype)
+
+
+def drop_flagged(df: pd.DataFrame) -> pd.DataFrame:
+    """The rows that passed the `quality` checks, all if not flagged"""
+    if QUALITY_FIELD not in df.columns:
+        return df
+    return df[df[QUALITY_FIELD].to_numpy() == 0].reset_index(drop=True)
+
+
+def compact(df: pd.DataFrame, price_dtype="float64") -> pd.DataFrame:
+    """Convert the tick data in place to the compact schema"""
+    if DATETIME_FIELD in df.columns and _is_text(df[DATETIME_FIELD]):
+        df[DATETIME_FIELD] = _to_datetime_ns(df[DATETIME_FIELD])
+    for field in df.columns:
+        col = df[field]
+        if field in SIZE_FIELDS and not col.isna().any():
+            values = col.to_numpy()
+            if len(values) == 0 or (
+                values.min() >= 0
+                and values.max() <= np.iinfo(np.uint32).max
+                and np.all(np.mod(values, 1) == 0)
+            ):
+                df[field] = values.astype(np.uint32)
+        elif field in PRICE_FIELDS and col.dtype != price_dtype:
+            df[field] = col.astype(price_dtype)
+        elif field.startswith(DIRECTION_FIELD) or field == "GMT Offset":
+            # BVC directions and some GMT offsets are fractions.
+            df[field] = _narrow(col.to_numpy())
+        elif _is_text(col):
+            df[field] = col.astype("category")
+    return df
+
+
+def _is_text(col):
+    return col.dtype == object or pd.api.types.is_string_dtype(col.dtype)
+
+
+def _narrow(values):
+    if values.dtype.kind in "iu" or (
+        not np.isnan(values).any() and np.all(np.mod(values, 1) == 0)
+    ):
+        if len(values) == 0 or np.abs(values).max() <= np.iinfo(np.int8).max:
+            return values.astype(np.int8)
+        return values
+    return values.astype(np.float32)
+
+
+def _to_datetime_ns(values):
+    # Keep nanoseconds, newer pandas infers the resolution from the strings. Files written
+    # by pandas drop the fraction of whole seconds, so formats may differ between rows.
+    try:
+        parsed = pd.to_datetime(values, format="ISO8601")
+    except (TypeError, ValueError):
+        # pandas < 2.0
+        parsed = pd.to_datetime(values)
+    return parsed.dt.as_unit("ns") if hasattr(parsed.dt, "as_unit") else parsed
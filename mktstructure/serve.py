@@ -0,0 +1,355 @@
+"""
+Local HTTP/JSON service over the results of `compute`, so that consumers query the
+values they need instead of each loading and filtering the whole `--out` files.
+
+The results files are indexed once into `index_dir`: one NumPy array per column (codes
+of the RIC, bucket and measure, the date as days since epoch and the value), sorted by
+RIC, date, bucket and measure, and the names of the codes in `meta.json`. The arrays are
+memory-mapped, so only the pages of the RICs queried are read. A query takes the rows of
+each RIC by binary search on the date, then filters the measures. The index is rebuilt
+when a results file changes, checked at most every `refresh` seconds.
+
+    GET /                   number of rows, RICs, measures, first and last date
+    GET /rics               RICs
+    GET /measures           measures
+    GET /values?ric=A.N,B.OQ&measure=EffectiveSpread&start=2022-01-01&end=2022-01-31
+
+`/values` gives the rows `{"date", "ric", "measure", "value"}` (and `"bucket"` for per
+interval results) as a JSON array. `ric` and `measure` can be repeated or comma
+separated and default to all, dates are inclusive and default to the whole range.
+The response is streamed one RIC at a time with chunked transfer encoding, so large
+panels are never held in memory whole. Each RIC's rows of a query are kept, encoded, in
+an LRU cache of `cache_mb` MB.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+COLUMNS = ("ric", "date", "bucket", "measure", "value")
+MB = 1024 * 1024
+
+
+def _signature(paths):
+    """Size and modification time of each results file, to tell if they changed"""
+    return [
+        [os.path.abspath(p), os.path.getsize(p), os.path.getmtime(p)] for p in paths
+    ]
+
+
+def _read_results(path) -> pd.DataFrame:
+    """Rows of a results file, `date,ric,[bucket,]measure,value`"""
+    df = pd.read_csv(
+        path,
+        header=None,
+        names=["date", "ric", "a", "b", "c"],
+        dtype=str,
+        keep_default_na=False,
+    )
+    # Rows of 4 fields have no bucket.
+    bucketed = df["c"] != ""
+    return pd.DataFrame(
+        {
+            "date": df["date"],
+            "ric": df["ric"],
+            "bucket": df["a"].where(bucketed, ""),
+            "measure": df["b"].where(bucketed, df["a"]),
+            "value": df["c"].where(bucketed, df["b"]),
+        }
+    )
+
+
+def _floats(values: pd.Series) -> np.ndarray:
+    """The values as floats, exactly as written, NaN if not numbers"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except ValueError:
+        # `pd.to_numeric` rounds the last digits.
+        return np.array(
+            [float(v) if _is_float(v) else np.nan for v in values], dtype=np.float64
+        )
+
+
+def _is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+class ResultsIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.rics = self.meta["rics"]
+        self.measures = self.meta["measures"]
+        self.buckets = self.meta["buckets"]
+        self.columns = {
+            c: np.load(os.path.join(index_dir, f"{c}.npy"), mmap_mode="r")
+            for c in COLUMNS
+        }
+        # Rows of the i-th RIC are [starts[i], starts[i + 1]).
+        self.starts = np.searchsorted(
+            self.columns["ric"], np.arange(len(self.rics) + 1)
+        )
+        self._ric_codes = {ric: i for i, ric in enumerate(self.rics)}
+        self._measure_codes = {m: i for i, m in enumerate(self.measures)}
+        # JSON of the names, encoded once.
+        self._json = {
+            "ric": [json.dumps(r) for r in self.rics],
+            "measure": [json.dumps(m) for m in self.measures],
+            "bucket": [json.dumps(b) for b in self.buckets],
+        }
+
+    def __len__(self):
+        return len(self.columns["ric"])
+
+    @classmethod
+    def build(cls, paths, index_dir) -> "ResultsIndex":
+        os.makedirs(index_dir, exist_ok=True)
+        signature = _signature(paths)
+        frames = [_read_results(p) for p in paths]
+        df = pd.concat(frames, ignore_index=True)
+        codes, names = {}, {}
+        for c in ("ric", "bucket", "measure"):
+            codes[c], uniques = pd.factorize(df[c], sort=True)
+            names[c] = [str(u) for u in uniques]
+        codes["date"] = (
+            pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]").astype(np.int32)
+        )
+        codes["value"] = _floats(df["value"])
+        order = np.lexsort(
+            (codes["measure"], codes["bucket"], codes["date"], codes["ric"])
+        )
+        for c in COLUMNS:
+            values = codes[c][order]
+            if c != "value":
+                values = values.astype(np.int32)
+            tmp = os.path.join(index_dir, f"{c}.tmp.npy")
+            np.save(tmp, values)
+            os.replace(tmp, os.path.join(index_dir, f"{c}.npy"))
+        # Written last, an index without it or with other sources is rebuilt.
+        meta = {
+            "sources": signature,
+            "rics": names["ric"],
+            "measures": names["measure"],
+            "buckets": names["bucket"],
+        }
+        tmp = os.path.join(index_dir, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(index_dir, META_FILE))
+        return cls(index_dir)
+
+    @classmethod
+    def open(cls, paths, index_dir) -> "ResultsIndex":
+        """The index of the results files at `paths`, built if missing or stale"""
+        meta = os.path.join(index_dir, META_FILE)
+        if os.path.isfile(meta):
+            with open(meta) as f:
+                if json.load(f)["sources"] == _signature(paths):
+                    return cls(index_dir)
+        return cls.build(paths, index_dir)
+
+    def summary(self) -> dict:
+        dates = self.columns["date"]
+        first = str(np.datetime64(int(dates.min()), "D")) if len(self) else None
+        last = str(np.datetime64(int(dates.max()), "D")) if len(self) else None
+        return {
+            "rows": len(self),
+            "rics": len(self.rics),
+            "measures": self.measures,
+            "start": first,
+            "end": last,
+        }
+
+    def ric_code(self, ric):
+        return self._ric_codes.get(ric)
+
+    def measure_codes(self, measures):
+        return [self._measure_codes[m] for m in measures if m in self._measure_codes]
+
+    def rows(self, ric_code, start, end, measure_codes=None) -> np.ndarray:
+        """
+        Rows of the RIC between the days `start` and `end` (inclusive, as days since
+        epoch) of the measures, all if None
+        """
+        lo, hi = self.starts[ric_code], self.starts[ric_code + 1]
+        dates = self.columns["date"][lo:hi]
+        i = lo + np.searchsorted(dates, start, "left")
+        j = lo + np.searchsorted(dates, end, "right")
+        rows = np.arange(i, j)
+        if measure_codes is not None:
+            rows = rows[np.isin(self.columns["measure"][i:j], measure_codes)]
+        return rows
+
+    def encode(self, rows) -> bytes:
+        """The rows as JSON objects separated by commas"""
+        c = self.columns
+        dates = np.datetime_as_string(c["date"][rows].astype("datetime64[D]"))
+        items = []
+        for row, day in zip(rows, dates):
+            value = float(c["value"][row])
+            bucket = self._json["bucket"][c["bucket"][row]]
+            items.append(
+                f'{{"date":"{day}","ric":{self._json["ric"][c["ric"][row]]},'
+                + (f'"bucket":{bucket},' if bucket != '""' else "")
+                + f'"measure":{self._json["measure"][c["measure"][row]]},'
+                + f'"value":{"null" if np.isnan(value) else repr(value)}}}'
+            )
+        return ",\n".join(items).encode()
+
+
+class LRUCache:
+    """Least recently used values up to `max_bytes` of their sizes, thread safe"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.size -= len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class ResultsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, paths, index_dir, address=("127.0.0.1", 0), cache_mb=256, refresh=60.0
+    ):
+        super().__init__(address, _Handler)
+        self.paths = list(paths)
+        self.index_dir = index_dir
+        self.refresh = refresh
+        self.cache = LRUCache(cache_mb * MB)
+        self._index = ResultsIndex.open(self.paths, index_dir)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def index(self) -> ResultsIndex:
+        """The index, rebuilt first if the results changed since the last check"""
+        with self._lock:
+            if time.monotonic() - self._checked >= self.refresh:
+                self._checked = time.monotonic()
+                sources = self._index.meta["sources"]
+                if all(os.path.isfile(p) for p in self.paths) and sources != _signature(
+                    self.paths
+                ):
+                    self._index = ResultsIndex.build(self.paths, self.index_dir)
+                    self.cache.clear()
+            return self._index
+
+
+def _values(query, name):
+    """Values of a repeated or comma-separated query parameter"""
+    return [v for item in query.get(name, []) for v in item.split(",") if v]
+
+
+def _day(value, default):
+    return int(np.datetime64(value, "D").astype(np.int64)) if value else default
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ResultsServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        index = self.server.index()
+        if url.path == "/":
+            return self._json(200, index.summary())
+        if url.path == "/rics":
+            return self._json(200, index.rics)
+        if url.path == "/measures":
+            return self._json(200, index.measures)
+        if url.path == "/values":
+            try:
+                start = _day(query.get("start", [None])[0], np.iinfo(np.int32).min)
+                end = _day(query.get("end", [None])[0], np.iinfo(np.int32).max)
+            except ValueError as e:
+                return self._json(400, {"error": f"Invalid date: {e}"})
+            return self._values(index, query, start, end)
+        self._json(404, {"error": f"Unknown endpoint {url.path}"})
+
+    def _values(self, index, query, start, end):
+        rics = _values(query, "ric") or index.rics
+        measures = _values(query, "measure")
+        codes = index.measure_codes(measures) if measures else None
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk(b"[")
+        first = True
+        for ric in rics:
+            ric_code = index.ric_code(ric)
+            if ric_code is None:
+                continue
+            measures_key = None if codes is None else tuple(codes)
+            key = (id(index), ric_code, start, end, measures_key)
+            body = self.server.cache.get(key)
+            if body is None:
+                body = index.encode(index.rows(ric_code, start, end, codes))
+                self.server.cache.put(key, body)
+            if body:
+                self._chunk(body if first else b",\n" + body)
+                first = False
+        self._chunk(b"]\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,125 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Regular trading sessions by exchange (RIC suffix): timezone and a list of (open, close) in local time.
+# Exchanges with a lunch break have two sessions per day.
+_US = ("America/New_York", [("09:30", "16:00")])
+EXCHANGES = {
+    "N": _US,  # NYSE
+    "OQ": _US,  # NASDAQ
+    "O": _US,  # NASDAQ
+    "A": _US,  # NYSE American
+    "K": _US,  # NYSE Arca
+    "P": _US,  # NYSE Arca
+    "Z": _US,  # Cboe BZX
+    "TO": ("America/Toronto", [("09:30", "16:00")]),
+    "L": ("Europe/London", [("08:00", "16:30")]),
+    "PA": ("Europe/Paris", [("09:00", "17:30")]),
+    "AS": ("Europe/Amsterdam", [("09:00", "17:30")]),
+    "BR": ("Europe/Brussels", [("09:00", "17:30")]),
+    "DE": ("Europe/Berlin", [("09:00", "17:30")]),
+    "MI": ("Europe/Rome", [("09:00", "17:30")]),
+    "MC": ("Europe/Madrid", [("09:00", "17:30")]),
+    "S": ("Europe/Zurich", [("09:00", "17:30")]),
+    "T": ("Asia/Tokyo", [("09:00", "11:30"), ("12:30", "15:00")]),
+    "HK": ("Asia/Hong_Kong", [("09:30", "12:00"), ("13:00", "16:00")]),
+    "SI": ("Asia/Singapore", [("09:00", "12:00"), ("13:00", "17:00")]),
+    "AX": ("Australia/Sydney", [("10:00", "16:00")]),
+}
+# Early close time by exchange group, see `early_close()`.
+US_EARLY_CLOSE = "13:00"
+UK_EARLY_CLOSE = "12:30"
+
+
+def exchange_of(ric: str) -> str:
+    """Exchange suffix of the RIC, e.g. `N` for `IBM.N`"""
+    return ric.rsplit(".", 1)[-1] if "." in ric else ""
+
+
+def _thanksgiving(year: int) -> date:
+    nov1 = date(year, 11, 1)
+    # Fourth Thursday of November.
+    return nov1 + timedelta(days=(3 - nov1.weekday()) % 7 + 21)
+
+
+def early_close(exchange: str, day: date) -> Optional[str]:
+    """Local closing time if `day` is a half trading day on the exchange, otherwise None"""
+    tz, _ = EXCHANGES.get(exchange, (None, None))
+    if tz == _US[0]:
+        # Day before Independence Day and Christmas Eve are half days when they fall on Mon-Thu,
+        # a Friday is a full holiday instead. Day after Thanksgiving is always a half day.
+        if (day.month, day.day) in ((7, 3), (12, 24)) and day.weekday() < 4:
+            return US_EARLY_CLOSE
+        if day == _thanksgiving(day.year) + timedelta(days=1):
+            return US_EARLY_CLOSE
+    if tz == "Europe/London":
+        if (day.month, day.day) in ((12, 24), (12, 31)) and day.weekday() < 5:
+            return UK_EARLY_CLOSE
+    return None
+
+
+@lru_cache(maxsize=None)
+def session_intervals(exchange: str, day: date) -> Optional[np.ndarray]:
+    """
+    Trading sessions of the exchange on the given local date as an (n, 2) array of
+    [open, close] UTC timestamps in nanoseconds since epoch, or None if the exchange is unknown.
+    DST is taken into account by converting the local times of that very day.
+    """
+    if exchange not in EXCHANGES:
+        return None
+    tz, sessions = EXCHANGES[exchange]
+    tz = ZoneInfo(tz)
+    close = early_close(exchange, day)
+    intervals = []
+    for start, end in sessions:
+        if close is not None and start >= close:
+            continue
+        if close is not None and end > close:
+            end = close
+        intervals.append(
+            [_to_epoch_ns(day, start, tz), _to_epoch_ns(day, end, tz)]
+        )
+    return np.array(intervals, dtype=np.int64).reshape(-1, 2)
+
+
+def _to_epoch_ns(day: date, hhmm: str, tz: ZoneInfo) -> int:
+    t = datetime.combine(day, time.fromisoformat(hhmm), tzinfo=tz)
+    return int(t.timestamp()) * 1_000_000_000
+
+
+def in_sessions(timestamps: np.ndarray, sessions: np.ndarray) -> np.ndarray:
+    """Mask of the sorted or unsorted epoch-ns `timestamps` within any [open, close] session"""
+    if len(sessions) == 0:
+        return np.zeros(len(timestamps), dtype=bool)
+    # The last session opening at or before each timestamp.
+    i = np.searchsorted(sessions[:, 0], timestamps, side="right") - 1
+    return (i >= 0) & (timestamps <= sessions[np.maximum(i, 0), 1])
+
+
+class SessionCalendar:
+    """
+    Trading sessions precomputed for a set of (exchange, date) pairs.
+    It is cheap to pickle and so is built once per run and shared with the workers.
+    """
+
+    def __init__(self, table: Dict[Tuple[str, date], np.ndarray] = None):
+        self.table = {} if table is None else table
+
+    @classmethod
+    def build(cls, ric_dates: Iterable[Tuple[str, date]]) -> "SessionCalendar":
+        table = {}
+        for ric, day in ric_dates:
+            key = (exchange_of(ric), day)
+            if key not in table:
+                table[key] = session_intervals(*key)
+        return cls(table)
+
+    def sessions(self, ric: str, day: date) -> Optional[np.ndarray]:
+        key = (exchange_of(ric), day)
+        if key not in self.table:
+            self.table[key] = session_intervals(*key)
+        return self.table[key]
@@ -0,0 +1,188 @@
+"""
+Split RIC-day work across processes and hosts sharing the data directory.
+
+`--shard i/N` keeps the RIC-days whose hash falls in shard `i` (0 <= i < N), the same RIC-day
+always goes to the same shard in every stage. `--shard_dynamic` instead lets processes claim
+files as they go with lock files created atomically (O_CREAT | O_EXCL) in
+`<data_dir>/.shards/<command>/<run>/`, where `<run>` is a hash of the options that change
+the results, so that e.g. a `compute` of other measures or intervals does not skip the
+files. A finished file's lock becomes a `.done` marker, so it is skipped by later runs
+with the same options. Remove that directory to run the stage again. Locks left by
+crashed processes are reported at the end and have to be removed by hand.
+"""
+import json
+import os
+import socket
+import zlib
+
+SHARDS_DIR = ".shards"
+# Options of how or which files are processed, rather than of their results.
+RUN_OPTIONS = {
+    "command",
+    "data_dir",
+    "all",
+    "ric",
+    "b",
+    "e",
+    "shard",
+    "shard_dynamic",
+    "threads",
+    "codec_threads",
+    "prefetch",
+    "prefetch_memory",
+    "metrics_out",
+    "profile",
+    "profile_min_seconds",
+}
+
+
+def parse_shard(spec):
+    """`"i/N"` to `(i, N)`"""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec!r}, expected i/N.") from None
+    if not 0 <= i < n:
+        raise ValueError(f"Invalid shard {spec!r}, expected 0 <= i < N.")
+    return i, n
+
+
+def ric_day(path):
+    """RIC and date of a data file, `<data_dir>/<RIC>/<YYYY-MM-DD>[.sorted][.signed].csv[.gz]`"""
+    ric = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return ric, os.path.basename(path).split(".")[0]
+
+
+def shard_of(path, n):
+    # crc32 rather than hash(), which is salted per process.
+    ric, date = ric_day(path)
+    return zlib.crc32(f"{ric}/{date}".encode()) % n
+
+
+def in_shard(path, args):
+    spec = getattr(args, "shard", None)
+    if not spec:
+        return True
+    i, n = parse_shard(spec)
+    return shard_of(path, n) == i
+
+
+def data_dirs(data_dir):
+    """RIC directories in the data directory, skipping hidden ones such as the locks"""
+    _, rics, _ = next(os.walk(data_dir))
+    return [ric for ric in rics if not ric.startswith(".")]
+
+
+def walk(data_dir):
+    """`os.walk()` of the data directory, skipping hidden directories such as the locks"""
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        yield root, dirs, files
+
+
+def run_dir(args):
+    """Directory of the locks of this command with these options, see `RUN_OPTIONS`"""
+    options = {k: v for k, v in vars(args).items() if k not in RUN_OPTIONS}
+    key = json.dumps(options, sort_keys=True, default=str)
+    run = f"{zlib.crc32(key.encode()):08x}"
+    return os.path.join(args.data_dir, SHARDS_DIR, args.command, run)
+
+
+def _lock_path(args, path):
+    # One lock per file, e.g. a raw file and its sorted copy are cleaned separately.
+    ric, _ = ric_day(path)
+    return os.path.join(run_dir(args), ric, f"{os.path.basename(path)}.lock")
+
+
+def _done_path(lock):
+    return lock.removesuffix(".lock") + ".done"
+
+
+def claim(args, path):
+    """
+    Whether this process should work on `path`: it's in our `--shard` and, with
+    `--shard_dynamic`, we got its lock and it's not done yet.
+    """
+    if not in_shard(path, args):
+        return False
+    if not getattr(args, "shard_dynamic", False):
+        return True
+    lock = _lock_path(args, path)
+    if os.path.exists(_done_path(lock)):
+        return False
+    os.makedirs(os.path.dirname(lock), exist_ok=True)
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(f"{socket.gethostname()} {os.getpid()}\n")
+    # Another process may have finished it between the check and the lock.
+    if os.path.exists(_done_path(lock)):
+        os.remove(lock)
+        return False
+    return True
+
+
+def release(args, path, done=True):
+    """Mark a claimed `path` as done, or give it back (e.g. on failure) if not `done`"""
+    if not getattr(args, "shard_dynamic", False):
+        return
+    lock = _lock_path(args, path)
+    if done:
+        os.replace(lock, _done_path(lock))
+    else:
+        os.remove(lock)
+
+
+def pending_locks(args):
+    """Locks not done yet, held by running processes or left by crashed ones"""
+    root = run_dir(args)
+    return [
+        os.path.join(r, f)
+        for r, _, files in os.walk(root)
+        for f in files
+        if f.endswith(".lock")
+    ]
+
+
+def report_pending(args):
+    if not getattr(args, "shard_dynamic", False):
+        return
+    pending = pending_locks(args)
+    if pending:
+        print(
+            f"{len(pending)} files are locked by other running or crashed processes, "
+            f"see {run_dir(args)}."
+        )
+
+
+def output_path(path, args):
+    """
+    Substitute `{shard}` in an output path with this shard, or host and pid if dynamic.
+    Sharded runs need it, else every process would overwrite the same file.
+    """
+    if getattr(args, "shard_dynamic", False):
+        shard = f"{socket.gethostname()}-{os.getpid()}"
+    elif getattr(args, "shard", None):
+        shard = "{}-of-{}".format(*parse_shard(args.shard))
+    else:
+        shard = "all"
+    if "{shard}" not in path and shard != "all":
+        raise ValueError(
+            f"Output path {path!r} has no {{shard}}, needed with --shard and "
+            "--shard_dynamic so that each process writes its own results."
+        )
+    return path.replace("{shard}", shard)
+
+
+def merge(paths, out):
+    """Merge per-shard result files into `out`, sorted and without duplicate lines"""
+    lines = set()
+    for path in paths:
+        with open(path) as f:
+            lines.update(line.rstrip("\n") for line in f if line.strip())
+    with open(out, "w") as f:
+        for line in sorted(lines):
+            print(line, file=f)
+    return len(lines)
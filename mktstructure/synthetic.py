@@ -0,0 +1,215 @@
+"""
+Deterministic synthetic data in the raw TRTH formats, for benchmarks and offline runs.
+
+`write_time_and_sales()` produces a Time & Sales extraction (as `download` saves it, before
+`--parse`) and `write_market_depth()` a NormalizedLL2 market depth extraction. Both are
+sorted by RIC and time, like the files delivered by DataScope.
+"""
+import gzip
+from datetime import date, datetime, timedelta
+from typing import List
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+TAS_FIELDS = [
+    "#RIC",
+    "Domain",
+    "Date-Time",
+    "GMT Offset",
+    "Type",
+    "Price",
+    "Volume",
+    "Bid Price",
+    "Bid Size",
+    "Ask Price",
+    "Ask Size",
+]
+LEVELS = 5
+BASE_FIELDS = ["#RIC", "Domain", "Date-Time", "GMT Offset", "Type"]
+LEVEL_FIELDS = ("BidPrice", "BidSize", "AskPrice", "AskSize")
+TZ = ZoneInfo("America/New_York")
+# Ticks are spread over the extended session, about 10% fall outside 09:30-16:00.
+DAY_START, DAY_END = (9 * 60, 16 * 60 + 30)
+
+
+def depth_columns(levels=LEVELS, fields=LEVEL_FIELDS):
+    """Columns of market depth with the `fields` of each of the `levels`"""
+    return BASE_FIELDS + [
+        f"L{i}-{field}" for i in range(1, levels + 1) for field in fields
+    ]
+
+
+DEPTH_FIELDS = depth_columns()
+
+
+def make_rics(n: int) -> List[str]:
+    suffixes = ["N", "OQ"]
+    return [f"SYN{i:04d}.{suffixes[i % 2]}" for i in range(n)]
+
+
+def trading_days(start: date, n: int) -> List[date]:
+    days, day = [], start
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _timestamps(rng, day: date, n: int):
+    """Sorted UTC epoch-ns timestamps and the GMT offset (hours) of the day"""
+    local_midnight = datetime(day.year, day.month, day.day, tzinfo=TZ)
+    offset = int(local_midnight.utcoffset().total_seconds() // 3600)
+    start = int(local_midnight.timestamp() + DAY_START * 60) * 1_000_000_000
+    span = (DAY_END - DAY_START) * 60 * 1_000_000_000
+    return np.sort(start + rng.integers(0, span, n)), offset
+
+
+def _format_timestamps(ts: np.ndarray) -> np.ndarray:
+    return np.char.add(np.datetime_as_string(ts.astype("datetime64[ns]"), "ns"), "Z")
+
+
+def _with_duplicates(rng, df: pd.DataFrame, duplicate_rate: float) -> pd.DataFrame:
+    """Repeat a fraction of the rows right after themselves, as in vendor re-deliveries"""
+    if duplicate_rate <= 0:
+        return df
+    repeats = 1 + (rng.random(len(df)) < duplicate_rate)
+    return df.iloc[np.repeat(np.arange(len(df)), repeats)]
+
+
+def _sizes(rng, n, mask=None) -> pd.array:
+    sizes = pd.array(rng.integers(1, 50, n) * 100, dtype="Int64")
+    if mask is not None:
+        sizes[~mask] = pd.NA
+    return sizes
+
+
+def time_and_sales_rows(
+    rng, ric: str, day: date, ticks: int, duplicate_rate=0.01, trade_rate=0.2
+) -> pd.DataFrame:
+    """One RIC-day of Time & Sales"""
+    ts, offset = _timestamps(rng, day, ticks)
+    is_trade = rng.random(ticks) < trade_rate
+    mid = 50 + 50 * rng.random() + np.cumsum(rng.normal(0, 0.005, ticks))
+    half = 0.005 * rng.integers(1, 5, ticks)
+    bid, ask = np.round(mid - half, 2), np.round(mid + half, 2)
+    price = np.where(rng.random(ticks) < 0.5, bid, ask)
+    # Some trades inside the spread.
+    inside = rng.random(ticks) < 0.2
+    price[inside] = np.round(mid[inside], 2)
+    df = pd.DataFrame(
+        {
+            "#RIC": ric,
+            "Domain": "Market Price",
+            "Date-Time": _format_timestamps(ts),
+            "GMT Offset": offset,
+            "Type": np.where(is_trade, "Trade", "Quote"),
+            "Price": np.where(is_trade, price, np.nan),
+            "Volume": _sizes(rng, ticks, is_trade),
+            "Bid Price": np.where(is_trade, np.nan, bid),
+            "Bid Size": _sizes(rng, ticks, ~is_trade),
+            "Ask Price": np.where(is_trade, np.nan, ask),
+            "Ask Size": _sizes(rng, ticks, ~is_trade),
+        }
+    )
+    return _with_duplicates(rng, df, duplicate_rate)
+
+
+def market_depth_rows(
+    rng, ric: str, day: date, ticks: int, duplicate_rate=0.01, levels=LEVELS
+):
+    """One RIC-day of NormalizedLL2 market depth"""
+    ts, offset = _timestamps(rng, day, ticks)
+    mid = 50 + 50 * rng.random() + np.cumsum(rng.normal(0, 0.005, ticks))
+    cols = {
+        "#RIC": ric,
+        "Domain": "Market Price",
+        "Date-Time": _format_timestamps(ts),
+        "GMT Offset": offset,
+        "Type": "Market Depth",
+    }
+    for level in range(1, levels + 1):
+        tick = 0.01 * level
+        cols[f"L{level}-BidPrice"] = np.round(mid - tick, 2)
+        cols[f"L{level}-BidSize"] = _sizes(rng, ticks)
+        cols[f"L{level}-AskPrice"] = np.round(mid + tick, 2)
+        cols[f"L{level}-AskSize"] = _sizes(rng, ticks)
+    return _with_duplicates(rng, pd.DataFrame(cols), duplicate_rate)
+
+
+def _write(path, fields, make_rows, rics, days, seed):
+    rng = np.random.default_rng(seed)
+    if isinstance(rics, int):
+        rics = make_rics(rics)
+    total = 0
+    # Fast compression, these files are for throughput tests and not kept.
+    if path.endswith(".gz"):
+        f = gzip.open(path, "wt", newline="", compresslevel=1)
+    else:
+        f = open(path, "w", newline="")
+    with f:
+        f.write(",".join(fields) + "\n")
+        for ric in rics:
+            for day in days:
+                rows = make_rows(rng, ric, day)[fields]
+                rows.to_csv(f, header=False, index=False, float_format="%.2f")
+                total += len(rows)
+    return total
+
+
+def write_time_and_sales(
+    path,
+    rics=10,
+    days=1,
+    ticks_per_day=10_000,
+    duplicate_rate=0.01,
+    start=date(2021, 3, 15),
+    seed=0,
+    fields=TAS_FIELDS,
+) -> int:
+    """
+    Write a raw Time & Sales file of `rics` (a number of RICs or a list of RICs) over `days`
+    trading days, returns the number of rows written. `fields` selects the columns.
+    """
+    return _write(
+        path,
+        fields,
+        lambda rng, ric, day: time_and_sales_rows(
+            rng, ric, day, ticks_per_day, duplicate_rate
+        ),
+        rics,
+        trading_days(start, days),
+        seed,
+    )
+
+
+def write_market_depth(
+    path,
+    rics=10,
+    days=1,
+    ticks_per_day=10_000,
+    duplicate_rate=0.01,
+    start=date(2021, 3, 15),
+    seed=0,
+    levels=LEVELS,
+    fields=None,
+) -> int:
+    """
+    Write a raw NormalizedLL2 market depth file of `rics` (a number of RICs or a list of RICs)
+    over `days` trading days, returns the number of rows written. `fields` selects the
+    columns, all those of the `levels` by default.
+    """
+    if fields is None:
+        fields = depth_columns(levels)
+    return _write(
+        path,
+        fields,
+        lambda rng, ric, day: market_depth_rows(
+            rng, ric, day, ticks_per_day, duplicate_rate, levels
+        ),
+        rics,
+        trading_days(start, days),
+        seed,
+    )
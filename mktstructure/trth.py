@@ -1,6 +1,11 @@
-import requests
+import os
+import re
 import time
 
+import requests
+
+from .journal import JobJournal, part_path
+from .planner import parse_quota
 from .utils import (
     make_request_index_components,
     make_request_tick_history,
@@ -10,17 +15,53 @@ from .utils import (
 # URL_BASE = "https://hosted.datascopeapi.reuters.com/RestApi/v1"
 URL_BASE = "https://selectapi.datascope.refinitiv.com/RestApi/v1"
 
-AUTH_URL = f"{URL_BASE}/Authentication/RequestToken"
-SEARCH_HIST_CHAIN_URL = f"{URL_BASE}/Search/HistoricalChainResolution"
-EXTRACT_RAW_URL = f"{URL_BASE}/Extractions/ExtractRaw"
-RESULTS_URL = f"{URL_BASE}/Extractions/RawExtractionResults('<JobId>')/$value"
+AUTH_PATH = "/Authentication/RequestToken"
+SEARCH_HIST_CHAIN_PATH = "/Search/HistoricalChainResolution"
+EXTRACT_RAW_PATH = "/Extractions/ExtractRaw"
+RESULTS_PATH = "/Extractions/RawExtractionResults('<JobId>')/$value"
+
+AUTH_URL = f"{URL_BASE}{AUTH_PATH}"
+SEARCH_HIST_CHAIN_URL = f"{URL_BASE}{SEARCH_HIST_CHAIN_PATH}"
+EXTRACT_RAW_URL = f"{URL_BASE}{EXTRACT_RAW_PATH}"
+RESULTS_URL = f"{URL_BASE}{RESULTS_PATH}"
+
+# Max number of retries of a throttled (429) request or an interrupted download.
+MAX_RETRIES = 10
+# Bytes read from the download at a time, all but the last read survive a dropped
+# connection.
+CHUNK_SIZE = 64 * 1024
+# Bytes received between updates of the job journal.
+JOURNAL_EVERY = 64 * 1024 * 1024
+
+
+class JobNotFound(Exception):
+    """The job of a journal is unknown to the server, e.g. expired"""
 
 
 class Connection:
-    def __init__(self, usr, pwd, token=None, progress_callback=print, *args, **kwargs):
+    def __init__(
+        self,
+        usr,
+        pwd,
+        token=None,
+        progress_callback=print,
+        base_url=URL_BASE,
+        polling_interval=10,
+        *args,
+        **kwargs,
+    ):
+        """
+        `base_url` is the root of the REST API, e.g. a local `mock_datascope` server
+        (`http://127.0.0.1:8080/RestApi/v1`) for offline tests and benchmarks.
+        """
         self.print_fn = progress_callback
         self._username = usr
         self._password = pwd
+        self.base_url = base_url.rstrip("/")
+        self.auth_url = f"{self.base_url}{AUTH_PATH}"
+        self.search_hist_chain_url = f"{self.base_url}{SEARCH_HIST_CHAIN_PATH}"
+        self.extract_raw_url = f"{self.base_url}{EXTRACT_RAW_PATH}"
+        self.results_url = f"{self.base_url}{RESULTS_PATH}"
         self.session = requests.Session()
         self.session.headers.update(
             {
@@ -33,16 +74,19 @@ class Connection:
             self._printRequestURL,
             self._checkResponseForError,
         ]
+        # Set before the token is requested, `_send` waits this long if throttled.
+        self.pollingIntervalSeconds = polling_interval
+        # Quota counts reported with the last extraction, see `planner.parse_quota`.
+        self.quota = {}
         self._accessToken = self._getAccessToken() if token is None else token
         self.updateAccessTokenInRequestHeaders(self._accessToken)
-        self.pollingIntervalSeconds = 10
 
     def close(self):
         pass
 
     def get_index_components(self, mkt_index, date_start, date_end):
         payload = make_request_index_components(mkt_index, date_start, date_end)
-        resp = self.session.post(SEARCH_HIST_CHAIN_URL, payload)
+        resp = self._send("post", self.search_hist_chain_url, data=payload)
         return resp.json()
 
     def get_table(self, rics, start_date, end_date):
@@ -53,6 +97,20 @@ class Connection:
         req = make_request_tick_history_market_depth(rics, start_date, end_date)
         return self.extract_raw(req)
 
+    def save_table(
+        self, rics, start_date, end_date, path, resume=False, fields=None
+    ):
+        req = make_request_tick_history(rics, start_date, end_date, fields)
+        self.extract_to_file(req, path, resume)
+
+    def save_table_mktdepth(
+        self, rics, start_date, end_date, path, resume=False, fields=None, levels=None
+    ):
+        req = make_request_tick_history_market_depth(
+            rics, start_date, end_date, fields, levels
+        )
+        self.extract_to_file(req, path, resume)
+
     def _getAccessToken(self) -> str:
         """Return the access Token"""
         _data = {
@@ -61,7 +119,7 @@ class Connection:
                 "Password": self._password,
             }
         }
-        resp = self.session.post(AUTH_URL, json=_data)
+        resp = self._send("post", self.auth_url, json=_data)
         return resp.json().get("value", "")
 
     def updateAccessTokenInRequestHeaders(self, token: str) -> None:
@@ -89,15 +147,56 @@ class Connection:
             if resp.status_code == 400:
                 self.print_fn(f"Error: {resp.text}")
 
+    def _send(self, method, url, **kwargs):
+        """Send a request, waiting and retrying while the server throttles (429)"""
+        for _ in range(MAX_RETRIES):
+            resp = self.session.request(method, url, **kwargs)
+            if resp.status_code != 429:
+                return resp
+            wait = resp.headers.get("Retry-After")
+            wait = self.pollingIntervalSeconds if wait is None else float(wait)
+            self.print_fn(f"Throttled by server... Retrying in {wait}s.")
+            time.sleep(wait)
+        return resp
+
     def extract_raw(self, payload: dict):
-        resp = self.session.post(EXTRACT_RAW_URL, json=payload)
-        _location = resp.headers.get("location").replace("http://", "https://")
+        job_id = self.submit(payload)
+        # Request should be completed then Get the result by passing jobID to RAWExtractionResults URL
+        resultURL = self.results_url.replace("<JobId>", job_id)
+        # self.print_fn(f"Retrieve result from {resultURL}")
+        # Allow downloading directly from AWS
+        resp = self._send(
+            "get", resultURL, stream=True, headers={"X-Direct-Download": "true"}
+        )
+        return resp
+
+    def submit(self, payload: dict, journal: JobJournal = None) -> str:
+        """
+        Submit an extraction and wait for it, returns its JobId. With a `journal`, a job
+        already submitted for the payload is waited for rather than submitted again.
+        """
+        _location = journal["location"] if journal else None
+        if journal and journal["job_id"]:
+            return journal["job_id"]
+        if _location:
+            self.print_fn("Resuming extraction job...")
+            resp = self._send("get", _location)
+            if resp.status_code == 404:
+                raise JobNotFound(_location)
+        else:
+            resp = self._send("post", self.extract_raw_url, json=payload)
+            _location = resp.headers.get("location", "")
+            # The API may give plain http locations behind its https endpoints.
+            if self.base_url.startswith("https://"):
+                _location = _location.replace("http://", "https://")
+            if journal:
+                journal.update(location=_location)
         while resp.status_code != 200:
             self.print_fn(
                 f"Waiting for data delivery... Polling in {self.pollingIntervalSeconds}s."
             )
             time.sleep(self.pollingIntervalSeconds)
-            resp = self.session.get(_location)
+            resp = self._send("get", _location)
         # self.print_fn(f"Location: {_location}")
         resp_json = resp.json()
         job_id = resp_json.get("JobId")
@@ -108,23 +207,121 @@ class Connection:
                 if "Quota" in var:
                     for line in var.split(";")[-3:]:
                         self.print_fn(line)
-        # Request should be completed then Get the result by passing jobID to RAWExtractionResults URL
-        resultURL = RESULTS_URL.replace("<JobId>", job_id)
-        # self.print_fn(f"Retrieve result from {resultURL}")
-        # Allow downloading directly from AWS
-        resp = self.session.get(
-            resultURL, stream=True, headers={"X-Direct-Download": "true"}
-        )
-        return resp
+        self.quota = parse_quota(resp_json.get("Notes"))
+        if journal:
+            journal.update(job_id=job_id)
+        return job_id
+
+    def extract_to_file(self, payload: dict, path, resume=False):
+        """
+        Extract `payload` and download the result to `path`, resuming an interrupted
+        download with range requests. The job is recorded in a journal next to `path`,
+        see `journal`. With `resume`, a job of the same payload in the journal is picked
+        up instead of submitted again, and is skipped if its download is complete.
+        """
+        journal = JobJournal.for_output(path)
+        self.quota = {}
+        if resume and journal.matches(payload):
+            complete = journal["complete"] and os.path.isfile(path)
+            if complete and os.path.getsize(path) == journal["size"]:
+                self.print_fn(f"{path} already downloaded.")
+                return
+        else:
+            journal.reset(payload)
+            if os.path.isfile(part_path(path)):
+                os.remove(part_path(path))
+        try:
+            self.download_results(self.submit(payload, journal), path, journal)
+        except JobNotFound:
+            # Expired or unknown to the server: start over.
+            self.print_fn("Extraction job not found... Submitting again.")
+            journal.reset(payload)
+            if os.path.isfile(part_path(path)):
+                os.remove(part_path(path))
+            self.download_results(self.submit(payload, journal), path, journal)
+
+    def download_results(self, job_id, path, journal: JobJournal = None):
+        """
+        Download the result of a job to `path`, via `<path>.part`. An interrupted
+        download resumes from the bytes received with a range request. The size received
+        is checked against the size given by the server before `path` is written.
+        """
+        url = self.results_url.replace("<JobId>", job_id)
+        part = part_path(path)
+        # Consecutive tries without receiving anything.
+        failures = 0
+        while failures < MAX_RETRIES:
+            offset = os.path.getsize(part) if os.path.isfile(part) else 0
+            # Allow downloading directly from AWS
+            headers = {"X-Direct-Download": "true"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            size = None
+            try:
+                resp = self._send("get", url, stream=True, headers=headers)
+                if resp.status_code == 404:
+                    raise JobNotFound(url)
+                if resp.status_code == 416 and journal and journal["size"] == offset:
+                    # Everything was received already.
+                    size = offset
+                else:
+                    resp.raise_for_status()
+                    # A server ignoring the range sends it all again.
+                    if resp.status_code != 206:
+                        offset = 0
+                    size = _total_size(resp, offset)
+                    if journal:
+                        journal.update(size=size, bytes=offset)
+                    self._receive(resp, part, offset, journal)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                received = os.path.getsize(part) if os.path.isfile(part) else 0
+                failures = failures + 1 if received <= offset else 0
+                self.print_fn(
+                    f"Download interrupted at {received} bytes... "
+                    f"Resuming in {failures}s."
+                )
+                time.sleep(failures)
+                continue
+            received = os.path.getsize(part)
+            if size is None or received == size:
+                os.replace(part, path)
+                if journal:
+                    journal.update(bytes=received, size=received, complete=True)
+                return
+            self.print_fn(f"Received {received} of {size} bytes... Resuming.")
+            failures += 1
+        raise IOError(f"Failed to download {url} to {path} after {MAX_RETRIES} tries.")
+
+    @staticmethod
+    def _receive(resp, part, offset, journal):
+        received, logged = offset, offset
+        with open(part, "ab" if offset else "wb") as f:
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                received += len(chunk)
+                if journal and received - logged >= JOURNAL_EVERY:
+                    f.flush()
+                    journal.update(bytes=received)
+                    logged = received
 
     @staticmethod
     def save_results(resp, path):
         # _output_file = tempfile.NamedTemporaryFile()
         # Write Output to file
         with open(path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
                 f.write(chunk)
         # _output_file.seek(0)
         # df = pd.read_csv(_output_file, compression="gzip")
         # _output_file.close()
         # return df
+
+
+def _total_size(resp, offset):
+    """Size of the whole result from a 200 or 206 response, None if not given"""
+    content_range = resp.headers.get("Content-Range", "")
+    match = re.fullmatch(r"bytes \d+-\d+/(\d+)", content_range.strip())
+    if match:
+        return int(match.group(1))
+    length = resp.headers.get("Content-Length")
+    return offset + int(length) if length is not None else None
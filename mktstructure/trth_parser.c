@@ -223,9 +223,13 @@ void process(FILE *file, struct Fields *meta, const char *output_dir,
   // Save the remaining part after finishing reading the entire file.
   // Case 1: the file contains only one RIC and one local date.
   // Case 2: the last valid chunk.
+  // thisRIC and thisLocalDate are already freed if the last row continued the
+  // chunk, lastRIC and lastLocalDate always describe it.
   if (numTransactions > 0)
-    save_chunk(thisRIC, thisLocalDate, meta->fields, chunk, numTransactions,
+    save_chunk(lastRIC, lastLocalDate, meta->fields, chunk, numTransactions,
                output_dir, replace);
+  free(lastRIC);
+  free(lastLocalDate);
 
   // Free chunk.
   free(chunk);
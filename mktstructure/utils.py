@@ -1,9 +1,11 @@
+import copy
 import os
 import json
 from typing import List, Dict
-from numba import jit
 import pandas as pd
 import numpy as np
+from . import compression
+from .schema import read_ticks
 from .request_templates import INDEX_COMPONENTS, INTRADAY_TICKS, INTRADAY_MARKET_DEPTH
 
 
@@ -42,125 +44,82 @@ def make_request_index_components(mkt_index: List[str], date_start, date_end):
     return json.dumps(request)
 
 
-def make_request_tick_history(rics: List[str], date_start, date_end):
-    request = INTRADAY_TICKS.copy()
+def make_request_tick_history(rics: List[str], date_start, date_end, fields=None):
+    """Time & Sales request, of the content `fields` if given (see `fields`)"""
+    # Deep copy, the template is shared by every request.
+    request = copy.deepcopy(INTRADAY_TICKS)
     request["ExtractionRequest"]["IdentifierList"]["InstrumentIdentifiers"] = [
         {"Identifier": ric, "IdentifierType": "Ric"} for ric in rics
     ]
     request["ExtractionRequest"]["Condition"]["QueryStartDate"] = date_start
     request["ExtractionRequest"]["Condition"]["QueryEndDate"] = date_end
+    if fields:
+        request["ExtractionRequest"]["ContentFieldNames"] = list(fields)
     return request
 
 
-def make_request_tick_history_market_depth(rics: List[str], date_start, date_end):
-    request = INTRADAY_MARKET_DEPTH.copy()
+def make_request_tick_history_market_depth(
+    rics: List[str], date_start, date_end, fields=None, levels=None
+):
+    """Market depth request, of the content `fields` and `levels` if given"""
+    request = copy.deepcopy(INTRADAY_MARKET_DEPTH)
     request["ExtractionRequest"]["IdentifierList"]["InstrumentIdentifiers"] = [
         {"Identifier": ric, "IdentifierType": "Ric"} for ric in rics
     ]
     request["ExtractionRequest"]["Condition"]["QueryStartDate"] = date_start
     request["ExtractionRequest"]["Condition"]["QueryEndDate"] = date_end
+    if fields:
+        request["ExtractionRequest"]["ContentFieldNames"] = list(fields)
+    if levels:
+        request["ExtractionRequest"]["Condition"]["NumberOfLevels"] = levels
     return request
 
 
-def lee_and_ready(df: pd.DataFrame) -> pd.DataFrame:
-    # Convert to pd.DatetimeIndex to preserve nanoseconds.
-    df["Date-Time"] = pd.DatetimeIndex(df["Date-Time"])
-    # Get GMT Offset
-    offset = np.timedelta64(df["GMT Offset"].iloc[0], "h")
-    # Convert from GMTUTC to local time.
-    df["Date-Time"] = df["Date-Time"] + offset
-    # Set local time as index.
-    df.set_index("Date-Time", inplace=True)
-    # Keep only trades/quotes during normal trading hours.
-    # TODO: Check RIC and get trading hours for non US exchanges.
-    # without `.copy()` there is hidden chaining causing `SettingSettingWithCopyWarning` warning
-    df = df.between_time(start_time="09:30", end_time="16:00").copy()
-    # Prepare for Lee and Ready.
-    prices = df["Price"].to_numpy()
-    bids = df["Bid Price"].to_numpy()
-    asks = df["Ask Price"].to_numpy()
-    bidsize = df["Bid Size"].to_numpy()
-    asksize = df["Ask Size"].to_numpy()
-    directions, bbids, basks = _lee_and_ready_classify(
-        prices, bids, asks, bidsize, asksize
-    )
-    df["Direction"] = pd.Series(directions, index=df.index)
-    df["Bid Price"] = pd.Series(bbids, index=df.index)
-    df["Ask Price"] = pd.Series(basks, index=df.index)
-    df["Mid Point"] = (df["Bid Price"] + df["Ask Price"]) / 2
-    # If the first observation is a Trade, there will not be a Mid Point.
-    return df[df["Type"] == "Trade"].dropna(subset=["Mid Point"])
-
-
-@jit(nopython=True, nogil=True, cache=True)
-def _lee_and_ready_classify(prices, bids, asks, bidsize, asksize):
-    n = len(prices)
-    directions = np.zeros(n, dtype=np.int8)
-    last_bid, last_ask = np.nan, np.nan
-    last_trade_price, last2_trade_price = np.nan, np.nan
-    last_quote_midpoint = np.nan
-    for i in range(n):
-        # If price[i] is np.nan then this is a quote.
-        if np.isnan(prices[i]) and asks[i] and bids[i] and bidsize[i] and asksize[i]:
-            last_quote_midpoint = (last_bid + last_ask) / 2
-            last_bid, last_ask = bids[i], asks[i]
-            continue
-        # Up here we know this is a trade.
-        p = prices[i]
-        # Quote Test
-        if np.isnan(last_quote_midpoint):
-            pass
-        elif p > last_quote_midpoint:
-            directions[i] = 1
-        elif p < last_quote_midpoint:
-            directions[i] = -1
-        # Ticke Test when price = last midpoint
-        elif np.isnan(last_trade_price):
-            pass
-        elif p > last_trade_price:
-            directions[i] = 1
-        elif p < last_trade_price:
-            directions[i] = -1
-        elif np.isnan(last2_trade_price):
-            pass
-        elif p > last2_trade_price:
-            directions[i] = 1
-        elif p < last2_trade_price:
-            directions[i] = -1
-        # The immediate bid/ask before the trade.
-        if not np.isnan(last_bid):
-            bids[i] = last_bid
-        if not np.isnan(last_ask):
-            asks[i] = last_ask
-        last2_trade_price = last_trade_price
-        last_trade_price = p
-    return directions, bids, asks
-
-
-def _sort_and_rm_duplicates(data_path, replace=True):
+def lee_and_ready(df: pd.DataFrame, sessions: np.ndarray = None) -> pd.DataFrame:
+    """Classify trades by Lee and Ready (1991), see `classification.classify_trades`"""
+    from .classification import classify_trades
+
+    return classify_trades(df, ("lr",), sessions)
+
+
+def sort_and_rm_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """The ticks without duplicates, sorted by and indexed on `Date-Time`"""
+    # Drop duplicates first before setting Date-Time as index, otherwise it'll be ignored.
+    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.drop_duplicates.html
+    df = df.drop_duplicates()
+    df = df.set_index(["Date-Time"])
+    return df.sort_index()
+
+
+def _sort_and_rm_duplicates(
+    data_path, replace=True, codec=None, quality=None, counts=None
+):
     """
     Remove trades/quotes with same Bid/Ask/Volume/Price at the same nanosecond.
     It is highly unlikely that two quotes/trades of exactly the same parameters happen at the same nanosecond.
+    Rows failing the checks of `quality`, the `quality.filter_ticks` arguments, are
+    then removed or flagged, and the number failing each is added to `counts`.
+    Returns the number of rows before and after and the path of the cleaned file.
     """
-    if "gz" in data_path:
-        gz = True
-        # Parse_dates here will result in loss of nanosecond precision!
-        df = pd.read_csv(data_path, compression="gzip")
-    else:
-        gz = False
-        df = pd.read_csv(data_path)
-
-    # obs = len(df.index)
-    # Drop duplicates first before converting Date-Time to DatetimeIndex, otherwise it'll be ignored.
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.drop_duplicates.html
-    df.drop_duplicates(inplace=True)
-    # This conversion preserves the nanoseconds.
-    df["Date-Time"] = pd.DatetimeIndex(df["Date-Time"])
-    df.set_index(["Date-Time"], inplace=True)
-    df.sort_index(inplace=True)
-    # new_len = len(df.index)
-    df.to_csv(
-        data_path if replace else f"{data_path.replace('.csv', '.sorted.csv')}",
-        compression="gzip" if gz else "infer",
-        mode="w",
-    )
+    # Compact schema, strings are categories and Date-Time is parsed keeping the nanoseconds.
+    # Flags of an earlier `clean --flag` are kept, and checked again.
+    df = read_ticks(data_path, flagged=True)
+    # Keep the input codec unless told otherwise.
+    if codec is None:
+        codec = compression.codec_from_path(data_path)
+
+    obs = len(df.index)
+    df = sort_and_rm_duplicates(df)
+    if quality:
+        from .quality import filter_ticks
+
+        df, failed = filter_ticks(df, **quality)
+        if counts is not None:
+            counts.update(failed)
+    new_len = len(df.index)
+    base = compression.strip_suffix(data_path)
+    out = base if replace else base.replace(".csv", ".sorted.csv")
+    compression.to_csv(df, out + codec.suffix, codec)
+    if replace and out + codec.suffix != data_path:
+        os.remove(data_path)
+    return obs, new_len, out + codec.suffix
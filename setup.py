@@ -16,6 +16,15 @@ trth_parser = Extension(
     sources=["mktstructure/trth_parser.c"],
     language="C",
 )
+ext_modules = [trth_parser]
+
+# Ahead-of-time compiled numba kernels, optional as they need numba at build time.
+try:
+    from mktstructure.kernels import aot_extension
+
+    ext_modules.append(aot_extension())
+except ImportError:
+    pass
 
 setup(
     name="mktstructure",
@@ -28,8 +37,9 @@ setup(
     url=__github_url__,
     packages=find_packages(),
     install_requires=requires,
+    extras_require={"zstd": ["zstandard"], "lz4": ["lz4"]},
     entry_points={"console_scripts": ["mktstructure=mktstructure.main:main"]},
-    ext_modules=[trth_parser],
+    ext_modules=ext_modules,
     package_data={
         "": ["LICENSE", "README.md", "*.c"],
     },
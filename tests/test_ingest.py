@@ -0,0 +1,177 @@
+import csv
+import gzip
+import os
+
+import pytest
+
+from mktstructure import ingest
+from mktstructure.compression import Codec, compress_file
+from mktstructure.schema import read_ticks
+from mktstructure.synthetic import write_time_and_sales
+from mktstructure.utils import _sort_and_rm_duplicates
+
+HEADER = (
+    "#RIC,Domain,Date-Time,GMT Offset,Type,Price,Volume,"
+    "Bid Price,Bid Size,Ask Price,Ask Size\n"
+)
+
+
+def _row(second, price="82.91", fraction="000000000"):
+    return (
+        f"A.N,Market Price,2021-03-15T14:00:{second:02d}.{fraction}Z,-4,Quote,,,"
+        f"{price},100,82.93,200\n"
+    )
+
+
+def _write(path, rows, header=HEADER):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(header + "".join(rows))
+    return path
+
+
+def _read(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="") as f:
+        return list(csv.reader(f))
+
+
+@pytest.fixture(params=[ingest.SCAN_BYTES, 1], ids=["scan", "bisect"])
+def scan_bytes(request, monkeypatch):
+    # 1 byte forces the binary search down to single lines.
+    monkeypatch.setattr(ingest, "SCAN_BYTES", request.param)
+
+
+def test_merge_into_middle(tmp_path, scan_bytes):
+    rows = [_row(s) for s in range(0, 40, 2)]
+    target = _write(str(tmp_path / "A.N" / "2021-03-15.csv"), rows)
+    rows = [_row(4), _row(5), _row(7), _row(7, "82.92")]
+    new = _write(str(tmp_path / "new.csv"), rows)
+    added, duplicates = ingest.merge_file(target, new)
+    assert (added, duplicates) == (3, 1)
+    rows = _read(target)[1:]
+    times = [row[2] for row in rows]
+    assert times == sorted(times)
+    assert len(rows) == 23
+    assert sum(t.startswith("2021-03-15T14:00:07") for t in times) == 2
+
+
+def test_merge_appends_after_end(tmp_path, scan_bytes):
+    target = _write(str(tmp_path / "t.csv"), [_row(s) for s in range(10)])
+    new = _write(str(tmp_path / "new.csv"), [_row(9), _row(20), _row(21)])
+    assert ingest.merge_file(target, new) == (2, 1)
+    assert [row[2][17:19] for row in _read(target)[1:]][-3:] == ["09", "20", "21"]
+
+
+def test_merge_before_start(tmp_path, scan_bytes):
+    target = _write(str(tmp_path / "t.csv"), [_row(s) for s in range(10, 20)])
+    new = _write(str(tmp_path / "new.csv"), [_row(1), _row(2)])
+    assert ingest.merge_file(target, new) == (2, 0)
+    assert [row[2][17:19] for row in _read(target)[1:]][:3] == ["01", "02", "10"]
+
+
+def test_merge_counts_new_rows_when_stored_duplicates_are_dropped(tmp_path):
+    # Duplicates stored in the overlap are dropped too, but are not new rows.
+    target = _write(str(tmp_path / "t.csv"), [_row(1), _row(1), _row(1), _row(3)])
+    new = _write(str(tmp_path / "new.csv"), [_row(1), _row(2)])
+    assert ingest.merge_file(target, new) == (1, 3)
+    assert len(_read(target)) == 1 + 3
+
+
+def test_merge_compressed(tmp_path):
+    target = _write(str(tmp_path / "t.csv"), [_row(s) for s in range(0, 10, 2)])
+    compress_file(target, Codec("gzip"))
+    new = _write(str(tmp_path / "new.csv"), [_row(2), _row(3)])
+    assert ingest.merge_file(target + ".gz", new) == (1, 1)
+    assert [row[2][17:19] for row in _read(target + ".gz")[1:]] == [
+        "00", "02", "03", "04", "06", "08"
+    ]
+
+
+def test_merge_into_cleaned_file(tmp_path):
+    rows = [_row(1, fraction="500000000"), _row(2)]
+    raw = _write(str(tmp_path / "A.N" / "2021-03-15.csv"), rows)
+    _sort_and_rm_duplicates(raw, replace=True)
+    header, first = _read(raw)[:2]
+    # Written by clean with other columns and fractional digits.
+    assert header[0] == "Date-Time"
+    assert first[0] == "2021-03-15 14:00:01.500000+00:00"
+    new = _write(
+        str(tmp_path / "new.csv"),
+        [_row(1, fraction="500000000"), _row(3, fraction="250000000")],
+    )
+    assert ingest.merge_file(raw, new) == (1, 1)
+    rows = _read(raw)
+    assert rows[0] == header
+    assert rows[-1][0] == "2021-03-15 14:00:03.250000+00:00"
+    assert len(read_ticks(raw)) == 3
+
+
+def test_sort_key_and_format():
+    key = "2021-03-15 14:00:01.500000000"
+    assert ingest.sort_key("2021-03-15T14:00:01.5Z") == key
+    assert ingest.sort_key("2021-03-15 14:00:01.500+00:00") == key
+    assert ingest.sort_key("2021-03-15 14:00:01+00:00") < key
+    clean = ingest.timestamp_format("2021-03-15 14:00:01.5+00:00")
+    assert clean("2021-03-15 14:00:02.000000000") == "2021-03-15 14:00:02.0+00:00"
+    assert clean("2021-03-15 14:00:02.123000000") == "2021-03-15 14:00:02.123+00:00"
+    raw = ingest.timestamp_format("2021-03-15T14:00:01.123456789Z")
+    assert raw("2021-03-15 14:00:02.100000000") == "2021-03-15T14:00:02.100000000Z"
+
+
+def _download(path, ticks_per_day=500, seed=0):
+    write_time_and_sales(path, ["A.N"], 1, ticks_per_day, seed=seed)
+    return path
+
+
+def test_ingest_again_adds_nothing(tmp_path):
+    data = str(tmp_path / "data")
+    raw = _download(str(tmp_path / "raw.csv"))
+    [(path, added, _)] = ingest.ingest(raw, data)
+    assert added == ingest._count_rows(path) > 0
+    [(_, added, duplicates)] = ingest.ingest(raw, data)
+    assert added == 0
+    assert duplicates > 0
+
+
+def test_ingest_removes_derived_files(tmp_path):
+    data = str(tmp_path / "data")
+    ingest.ingest(_download(str(tmp_path / "raw.csv")), data)
+    day = os.path.join(data, "A.N")
+    stored = os.path.join(day, "2021-03-15.csv")
+    _sort_and_rm_duplicates(stored, replace=False)
+    derived = [
+        "2021-03-15.sorted.signed.csv",
+        "2021-03-15.sorted.signed.align.npz",
+        "2021-03-15.sorted.signed.bars.npz",
+    ]
+    for f in derived:
+        open(os.path.join(day, f), "w").close()
+    stats = os.path.join(data, ".rolling", "A.N", "2021-03-15.json")
+    _write(stats, [], header="{}")
+    other_day = os.path.join(day, "2021-03-16.sorted.csv")
+    open(other_day, "w").close()
+
+    new = _download(str(tmp_path / "new.csv"), seed=1)
+    [(path, added, _)] = ingest.ingest(new, data)
+    assert path == stored and added > 0
+    assert sorted(os.listdir(day)) == ["2021-03-15.csv", "2021-03-16.sorted.csv"]
+    assert not os.path.exists(stats)
+
+
+def test_ingest_fills_quality_of_flagged_file(tmp_path):
+    data = str(tmp_path / "data")
+    ingest.ingest(_download(str(tmp_path / "raw.csv")), data)
+    stored = os.path.join(data, "A.N", "2021-03-15.csv")
+    quality = {"checks": ["session", "crossed"], "flag": True}
+    _sort_and_rm_duplicates(stored, replace=True, quality=quality)
+    before = read_ticks(stored, flagged=True)
+
+    new = _download(str(tmp_path / "new.csv"), seed=1)
+    [(_, added, _)] = ingest.ingest(new, data)
+    after = read_ticks(stored, flagged=True)
+    assert len(after) == len(before) + added
+    assert not after["Quality"].isna().any()
+    # The new rows passing the checks are read.
+    passed = (after["Quality"] == 0).sum()
+    assert len(read_ticks(stored)) == passed > (before["Quality"] == 0).sum()